@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Analizador de kardex.csv en streaming (exportaciones de /reportes/kardex.csv o /api/movimientos/export/csv)
+Lee el archivo por bloques de tamaño fijo, calcula saldos, rotación, valorización y anomalías
+sin cargarlo completo en memoria (sin dependencias externas)
+
+Uso:
+    python analizar-kardex.py kardex.csv
+    python analizar-kardex.py kardex-grande.csv --procesos 4 --costos costos.csv --json reporte.json
+    python analizar-kardex.py kardex.csv --checkpoint kardex.ckpt   # sólo procesa lo agregado desde la última vez
+
+El resumen de cada producto en un tramo es (movimientos, neto, saldo mínimo, suma de saldos...);
+dos tramos consecutivos se combinan sin releer filas, lo que permite procesar bloques en
+paralelo y continuar desde un checkpoint.
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+from multiprocessing import Pool
+
+TAMANO_BLOQUE = 8 * 1024 * 1024
+MAX_EJEMPLOS_ANOMALIA = 50
+COLUMNAS = ('id', 'producto', 'tipo', 'cantidad', 'estado', 'fecha')
+
+# Posiciones del resumen por producto (lista en vez de objeto: millones de actualizaciones por segundo)
+N, NETO, MINIMO, FECHA_MINIMO, SUMA_SALDOS, ENTRADAS, SALIDAS, AJUSTES, PENDIENTES, RECHAZADOS, \
+    PRIMERA, ULTIMA, DESORDEN = range(13)
+
+
+def resumen_vacio():
+    return [0, 0, 0, None, 0, 0, 0, 0, 0, 0, None, None, 0]
+
+
+def combinar(a, b):
+    """Resumen de a seguido cronológicamente por b"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    r = list(a)
+    r[N] = a[N] + b[N]
+    r[NETO] = a[NETO] + b[NETO]
+    if a[NETO] + b[MINIMO] < a[MINIMO]:
+        r[MINIMO], r[FECHA_MINIMO] = a[NETO] + b[MINIMO], b[FECHA_MINIMO]
+    r[SUMA_SALDOS] = a[SUMA_SALDOS] + b[SUMA_SALDOS] + b[N] * a[NETO]
+    for i in (ENTRADAS, SALIDAS, AJUSTES, PENDIENTES, RECHAZADOS, DESORDEN):
+        r[i] = a[i] + b[i]
+    r[PRIMERA] = a[PRIMERA] or b[PRIMERA]
+    r[ULTIMA] = b[ULTIMA] or a[ULTIMA]
+    if a[ULTIMA] and b[PRIMERA] and b[PRIMERA] < a[ULTIMA]:
+        r[DESORDEN] += 1
+    return r
+
+
+class Tramo:
+    """Resultado de procesar un rango del archivo: resúmenes por producto y anomalías"""
+
+    def __init__(self):
+        self.productos = {}
+        self.filas = 0
+        self.malformadas = 0
+        self.anomalias = {}
+        self.ejemplos = []
+
+    def anomalia(self, tipo, detalle):
+        self.anomalias[tipo] = self.anomalias.get(tipo, 0) + 1
+        if len(self.ejemplos) < MAX_EJEMPLOS_ANOMALIA:
+            self.ejemplos.append({'tipo': tipo, **detalle})
+
+    def seguido_de(self, otro):
+        """Combina este tramo con uno cronológicamente posterior"""
+        for producto, resumen in otro.productos.items():
+            self.productos[producto] = combinar(self.productos.get(producto), resumen)
+        self.filas += otro.filas
+        self.malformadas += otro.malformadas
+        for tipo, n in otro.anomalias.items():
+            self.anomalias[tipo] = self.anomalias.get(tipo, 0) + n
+        self.ejemplos = (self.ejemplos + otro.ejemplos)[:MAX_EJEMPLOS_ANOMALIA]
+        return self
+
+    def a_dict(self):
+        return {'productos': self.productos, 'filas': self.filas, 'malformadas': self.malformadas,
+                'anomalias': self.anomalias, 'ejemplos': self.ejemplos}
+
+    @classmethod
+    def desde_dict(cls, datos):
+        tramo = cls()
+        tramo.productos = {int(k): v for k, v in datos['productos'].items()}
+        tramo.filas = datos['filas']
+        tramo.malformadas = datos['malformadas']
+        tramo.anomalias = datos['anomalias']
+        tramo.ejemplos = datos['ejemplos']
+        return tramo
+
+
+def leer_cabecera(ruta):
+    """Devuelve (índices de columnas, offset donde empiezan los datos, hash de la cabecera)"""
+    with open(ruta, 'rb') as f:
+        linea = f.readline()
+    nombres = [n.strip().strip('"').lower() for n in linea.decode('utf-8-sig').strip().split(',')]
+    alias = {'producto': ('producto', 'productoid', 'producto_id'), 'estado': ('estado', 'estadoaprobacion')}
+    indices = {}
+    for columna in COLUMNAS:
+        for nombre in alias.get(columna, (columna,)):
+            if nombre in nombres:
+                indices[columna] = nombres.index(nombre)
+                break
+        else:
+            raise SystemExit(f"❌ Falta la columna '{columna}' en la cabecera: {linea!r}")
+    return indices, len(linea), hashlib.sha256(linea).hexdigest()
+
+
+def detectar_orden(ruta, inicio, indices):
+    """Las exportaciones de Ktor vienen de la más nueva a la más antigua (orderBy fechaRegistro DESC)"""
+    with open(ruta, 'rb') as f:
+        f.seek(inicio)
+        muestra = f.read(256 * 1024).decode('utf-8', 'replace').splitlines()[:-1]
+    fechas = [fila[indices['fecha']] for fila in csv.reader(muestra) if len(fila) > indices['fecha']]
+    ascendentes = sum(1 for a, b in zip(fechas, fechas[1:]) if b > a)
+    descendentes = sum(1 for a, b in zip(fechas, fechas[1:]) if b < a)
+    return 'desc' if descendentes > ascendentes else 'asc'
+
+
+def bloques(f, fin):
+    """Bloques de ~TAMANO_BLOQUE cortados en un salto de línea fuera de comillas"""
+    resto = b''
+    while f.tell() < fin:
+        datos = resto + f.read(min(TAMANO_BLOQUE, fin - f.tell()))
+        if f.tell() >= fin:
+            if datos:
+                yield datos, f.tell()
+            return
+        corte = datos.rfind(b'\n')
+        # Un salto de línea dentro de un campo entre comillas no es fin de fila
+        while corte != -1 and datos.count(b'"', 0, corte) % 2:
+            corte = datos.rfind(b'\n', 0, corte)
+        if corte == -1:
+            resto = datos
+            continue
+        yield datos[:corte + 1], f.tell() - (len(datos) - corte - 1)
+        resto = datos[corte + 1:]
+
+
+def procesar_bloque(texto, indices, orden, tramo):
+    """Resume un bloque en orden cronológico; el tramo recibe el bloque como posterior a lo ya visto"""
+    i_id, i_prod, i_tipo = indices['id'], indices['producto'], indices['tipo']
+    i_cant, i_estado, i_fecha = indices['cantidad'], indices['estado'], indices['fecha']
+    minimo_columnas = max(indices.values()) + 1
+    filas = list(csv.reader(io.StringIO(texto)))
+    if orden == 'desc':
+        filas.reverse()
+
+    bloque = Tramo()
+    productos = bloque.productos
+    for fila in filas:
+        if not fila:
+            continue
+        bloque.filas += 1
+        if len(fila) < minimo_columnas:
+            bloque.malformadas += 1
+            continue
+        try:
+            producto = int(fila[i_prod])
+            cantidad = int(fila[i_cant])
+        except ValueError:
+            bloque.malformadas += 1
+            continue
+        tipo, estado, fecha = fila[i_tipo], fila[i_estado], fila[i_fecha]
+
+        r = productos.get(producto)
+        if r is None:
+            r = productos[producto] = resumen_vacio()
+        if r[ULTIMA] and fecha < r[ULTIMA]:
+            r[DESORDEN] += 1
+        r[PRIMERA] = r[PRIMERA] or fecha
+        r[ULTIMA] = fecha
+
+        if estado == 'PENDIENTE':
+            r[PENDIENTES] += 1
+            continue
+        if estado == 'RECHAZADO':
+            r[RECHAZADOS] += 1
+            continue
+
+        if tipo == 'ENTRADA':
+            delta = cantidad
+            r[ENTRADAS] += cantidad
+        elif tipo == 'SALIDA':
+            delta = -cantidad
+            r[SALIDAS] += cantidad
+        elif tipo == 'AJUSTE':
+            delta = cantidad
+            r[AJUSTES] += cantidad
+        else:
+            bloque.anomalia('tipo_desconocido', {'id': fila[i_id], 'producto': producto, 'tipo': tipo})
+            continue
+        if cantidad <= 0 and tipo != 'AJUSTE':
+            bloque.anomalia('cantidad_no_positiva', {'id': fila[i_id], 'producto': producto, 'cantidad': cantidad})
+
+        r[N] += 1
+        r[NETO] += delta
+        if r[NETO] < r[MINIMO]:
+            r[MINIMO], r[FECHA_MINIMO] = r[NETO], fecha
+        r[SUMA_SALDOS] += r[NETO]
+
+    if orden == 'desc':
+        # Este bloque es cronológicamente anterior a todo lo leído antes en el archivo
+        return bloque.seguido_de(tramo)
+    return tramo.seguido_de(bloque)
+
+
+def procesar_rango(tarea):
+    """Procesa [inicio, fin) del archivo; es la unidad de trabajo en modo multiproceso"""
+    ruta, inicio, fin, indices, orden = tarea
+    tramo = Tramo()
+    with open(ruta, 'rb') as f:
+        f.seek(inicio)
+        for datos, _ in bloques(f, fin):
+            tramo = procesar_bloque(datos.decode('utf-8', 'replace'), indices, orden, tramo)
+    return tramo
+
+
+def dividir_rangos(ruta, inicio, fin, partes):
+    """Corta el archivo en rangos alineados a saltos de línea"""
+    cortes = [inicio]
+    with open(ruta, 'rb') as f:
+        for i in range(1, partes):
+            f.seek(inicio + (fin - inicio) * i // partes)
+            f.readline()
+            posicion = min(f.tell(), fin)
+            if posicion > cortes[-1]:
+                cortes.append(posicion)
+    cortes.append(fin)
+    return list(zip(cortes, cortes[1:]))
+
+
+def ultima_linea_completa(ruta, inicio, fin):
+    """Offset justo después del último salto de línea en [inicio, fin)"""
+    with open(ruta, 'rb') as f:
+        posicion = fin
+        while posicion > inicio:
+            desde = max(inicio, posicion - 64 * 1024)
+            f.seek(desde)
+            corte = f.read(posicion - desde).rfind(b'\n')
+            if corte != -1:
+                return desde + corte + 1
+            posicion = desde
+    return inicio
+
+
+def cargar_costos(ruta):
+    """CSV productoId,costo (con o sin cabecera)"""
+    costos = {}
+    with open(ruta, newline='', encoding='utf-8-sig') as f:
+        for fila in csv.reader(f):
+            try:
+                costos[int(fila[0])] = float(fila[1])
+            except (ValueError, IndexError):
+                continue
+    return costos
+
+
+def guardar_checkpoint(ruta, datos):
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(datos, f)
+    os.replace(temporal, ruta)
+
+
+def construir_reporte(tramo, costos, saldo_inicial, top):
+    productos = []
+    for producto, r in tramo.productos.items():
+        saldo = saldo_inicial + r[NETO]
+        promedio = saldo_inicial + r[SUMA_SALDOS] / r[N] if r[N] else saldo
+        fila = {
+            'producto': producto, 'movimientos': r[N], 'entradas': r[ENTRADAS], 'salidas': r[SALIDAS],
+            'ajustes': r[AJUSTES], 'pendientes': r[PENDIENTES], 'rechazados': r[RECHAZADOS],
+            'saldo_final': saldo, 'saldo_minimo': saldo_inicial + r[MINIMO], 'fecha_saldo_minimo': r[FECHA_MINIMO],
+            'saldo_promedio': round(promedio, 2),
+            'rotacion': round(r[SALIDAS] / promedio, 3) if promedio > 0 else None,
+            'primera_fecha': r[PRIMERA], 'ultima_fecha': r[ULTIMA], 'fuera_de_orden': r[DESORDEN],
+        }
+        if producto in costos:
+            fila['valorizacion'] = round(max(saldo, 0) * costos[producto], 2)
+        productos.append(fila)
+
+    negativos = sorted((p for p in productos if p['saldo_minimo'] < 0), key=lambda p: p['saldo_minimo'])
+    anomalias = dict(tramo.anomalias)
+    if negativos:
+        anomalias['stock_negativo'] = len(negativos)
+    fuera_de_orden = sum(p['fuera_de_orden'] for p in productos)
+    if fuera_de_orden:
+        anomalias['fechas_fuera_de_orden'] = fuera_de_orden
+    con_rotacion = [p for p in productos if p['rotacion'] is not None]
+    return {
+        'filas': tramo.filas,
+        'malformadas': tramo.malformadas,
+        'productos': len(productos),
+        'movimientos_aprobados': sum(p['movimientos'] for p in productos),
+        'valorizacion_total': round(sum(p.get('valorizacion', 0) for p in productos), 2) if costos else None,
+        'anomalias': anomalias,
+        'ejemplos_anomalias': tramo.ejemplos,
+        'stock_negativo': negativos[:top],
+        'mayor_rotacion': sorted(con_rotacion, key=lambda p: -p['rotacion'])[:top],
+        'menor_rotacion': sorted(con_rotacion, key=lambda p: p['rotacion'])[:top],
+        'detalle': sorted(productos, key=lambda p: p['producto']),
+    }
+
+
+def imprimir_reporte(reporte, segundos, bytes_leidos):
+    mb = bytes_leidos / 1024 ** 2
+    print("=" * 60)
+    print(f"📊 {reporte['filas']:,} filas ({reporte['malformadas']:,} malformadas) | "
+          f"{reporte['productos']:,} productos | {mb:,.1f} MB en {segundos:.1f} s "
+          f"({mb / segundos if segundos else 0:,.1f} MB/s)")
+    if reporte['valorizacion_total'] is not None:
+        print(f"💰 Valorización del stock: ${reporte['valorizacion_total']:,.0f}")
+    if reporte['anomalias']:
+        print("⚠️ Anomalías: " + ", ".join(f"{k}={v:,}" for k, v in reporte['anomalias'].items()))
+    else:
+        print("✅ Sin anomalías")
+    if reporte['stock_negativo']:
+        print("\n🔻 Productos que quedaron con stock negativo:")
+        for p in reporte['stock_negativo']:
+            print(f"   #{p['producto']}: mínimo {p['saldo_minimo']} el {p['fecha_saldo_minimo']}")
+    if reporte['mayor_rotacion']:
+        print("\n🔄 Mayor rotación (salidas / saldo promedio):")
+        for p in reporte['mayor_rotacion']:
+            print(f"   #{p['producto']}: {p['rotacion']} ({p['salidas']} salidas, saldo final {p['saldo_final']})")
+        print("\n🐢 Menor rotación:")
+        for p in reporte['menor_rotacion']:
+            print(f"   #{p['producto']}: {p['rotacion']} ({p['salidas']} salidas, saldo final {p['saldo_final']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analiza exportaciones de kardex en streaming')
+    parser.add_argument('archivo')
+    parser.add_argument('--procesos', type=int, default=1, help='procesos para archivos de varios GB')
+    parser.add_argument('--orden', choices=['auto', 'asc', 'desc'], default='auto',
+                        help='orden cronológico de las filas (Ktor exporta desc)')
+    parser.add_argument('--costos', help='CSV productoId,costo para valorizar el stock')
+    parser.add_argument('--saldo-inicial', type=int, default=0, help='saldo de apertura de cada producto')
+    parser.add_argument('--checkpoint', help='archivo de estado para procesar sólo lo agregado al CSV')
+    parser.add_argument('--json', help='guardar el reporte completo en este archivo')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    indices, inicio_datos, hash_cabecera = leer_cabecera(args.archivo)
+    fin = os.path.getsize(args.archivo)
+    orden = args.orden if args.orden != 'auto' else detectar_orden(args.archivo, inicio_datos, indices)
+
+    tramo = Tramo()
+    inicio = inicio_datos
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        with open(args.checkpoint, encoding='utf-8') as f:
+            estado = json.load(f)
+        if estado['cabecera'] != hash_cabecera or estado['offset'] > fin:
+            raise SystemExit("❌ El checkpoint no corresponde a este archivo (cabecera distinta o archivo truncado)")
+        tramo = Tramo.desde_dict(estado['tramo'])
+        inicio = estado['offset']
+        orden = estado['orden']
+        print(f"♻️ Retomando desde el byte {inicio:,} ({tramo.filas:,} filas ya procesadas)")
+
+    print(f"🔍 Analizando {args.archivo} ({(fin - inicio) / 1024 ** 2:,.1f} MB nuevos, orden {orden}, "
+          f"{args.procesos} proceso(s))")
+    t0 = time.monotonic()
+    # La exportación de Ktor no termina en salto de línea: la última fila queda fuera del checkpoint
+    # para no pegarla con lo que se agregue después, y se suma sólo a este reporte
+    completo = ultima_linea_completa(args.archivo, inicio, fin) if args.checkpoint else fin
+    if completo > inicio:
+        if args.procesos > 1:
+            tareas = [(args.archivo, a, b, indices, orden)
+                      for a, b in dividir_rangos(args.archivo, inicio, completo, args.procesos)]
+            with Pool(args.procesos) as pool:
+                nuevos = pool.map(procesar_rango, tareas)
+            if orden == 'desc':
+                nuevos.reverse()
+            nuevo = Tramo()
+            for parcial in nuevos:
+                nuevo.seguido_de(parcial)
+            tramo = nuevo.seguido_de(tramo) if orden == 'desc' else tramo.seguido_de(nuevo)
+        else:
+            with open(args.archivo, 'rb') as f:
+                f.seek(inicio)
+                for i, (datos, posicion) in enumerate(bloques(f, completo), 1):
+                    tramo = procesar_bloque(datos.decode('utf-8', 'replace'), indices, orden, tramo)
+                    if args.checkpoint and i % 16 == 0:
+                        guardar_checkpoint(args.checkpoint, {'cabecera': hash_cabecera, 'offset': posicion,
+                                                             'orden': orden, 'tramo': tramo.a_dict()})
+        if args.checkpoint:
+            guardar_checkpoint(args.checkpoint, {'cabecera': hash_cabecera, 'offset': completo,
+                                                 'orden': orden, 'tramo': tramo.a_dict()})
+    if fin > completo:
+        with open(args.archivo, 'rb') as f:
+            f.seek(completo)
+            cola = f.read().decode('utf-8', 'replace')
+        tramo = procesar_bloque(cola, indices, orden, tramo)
+
+    costos = cargar_costos(args.costos) if args.costos else {}
+    reporte = construir_reporte(tramo, costos, args.saldo_inicial, args.top)
+    imprimir_reporte(reporte, time.monotonic() - t0, fin - inicio)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        print(f"\n📝 Reporte completo en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Benchmark de servidor-definitivo.py: levanta el servidor con distinto número de workers (modo prefork)
+y mide throughput y latencia con varios procesos cliente (sin dependencias externas)
+
+Uso:
+    python benchmark-servidor.py                          # 1, 2, 4 ... hasta los núcleos disponibles
+    python benchmark-servidor.py --workers 1,2,4,8 --duracion 15 --ruta /ping
+    python benchmark-servidor.py --ruta /api/ventas/metricas --ktor http://localhost:8080
+    python benchmark-servidor.py --workers 1 --env PARSER_RAPIDO=0  # extremo a extremo con el parser de http.server
+    python benchmark-servidor.py --micro-parser                     # parser propio vs http.server, sin red
+    python benchmark-servidor.py --workers 1 --env ESCRITURA_VECTORIZADA=0  # cabeceras y cuerpo en writes separados
+    python benchmark-servidor.py --perfiles                         # ráfaga de accept y reinicio por PERFIL_SOCKET
+
+El generador de carga también es Python: usa varios procesos para no quedar limitado por su propio GIL.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import Pool
+
+from herramientas_comunes import cargar_servidor, percentil, puerto_libre
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+def obtener_json(puerto, ruta, timeout=2):
+    conn = http.client.HTTPConnection('127.0.0.1', puerto, timeout=timeout)
+    try:
+        conn.request('GET', ruta)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+def lanzar_servidor(workers, puerto, entorno_extra):
+    entorno = dict(os.environ, WORKERS=str(workers), PORT=str(puerto), PYTHONUNBUFFERED='1')
+    entorno.update(entorno_extra)
+    proceso = subprocess.Popen([sys.executable, os.path.join(DIRECTORIO, 'servidor-definitivo.py')], env=entorno,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    for _ in range(100):
+        try:
+            estado = obtener_json(puerto, '/estado/cluster', timeout=1)
+            if workers == 1 or sum(1 for w in estado.get('detalle', []) if w['pid']) == workers:
+                return proceso
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.1)
+    detener_servidor(proceso)
+    raise SystemExit(f'❌ El servidor con {workers} workers no respondió')
+
+
+def detener_servidor(proceso):
+    try:
+        os.killpg(proceso.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        proceso.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(proceso.pid, signal.SIGKILL)
+        proceso.wait()
+
+
+def cliente(tarea):
+    """Un proceso cliente: 'hilos' hilos pidiendo la ruta sin pausa entre 'desde' y 'fin' (reloj de pared, común
+    a todos los procesos); devuelve también cuándo terminó su última petición"""
+    puerto, ruta, hilos, desde, fin = tarea
+    latencias = []
+    errores = [0]
+    lock = threading.Lock()
+
+    def bucle():
+        propias = []
+        fallidas = 0
+        conn = None
+        time.sleep(max(0.0, desde - time.time()))
+        while time.time() < fin:
+            inicio = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection('127.0.0.1', puerto, timeout=10)
+                conn.request('GET', ruta)
+                respuesta = conn.getresponse()
+                respuesta.read()
+                if respuesta.will_close:
+                    conn.close()
+                    conn = None
+                if respuesta.status >= 500:
+                    fallidas += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                fallidas += 1
+                if conn is not None:
+                    conn.close()
+                conn = None
+                continue
+            propias.append((time.perf_counter() - inicio) * 1000)
+        with lock:
+            latencias.extend(propias)
+            errores[0] += fallidas
+
+    hilos_activos = [threading.Thread(target=bucle) for _ in range(hilos)]
+    for h in hilos_activos:
+        h.start()
+    for h in hilos_activos:
+        h.join()
+    return latencias, errores[0], time.time()
+
+
+def segmentos_tcp():
+    """Segmentos TCP enviados por toda la máquina (Linux); en loopback incluye los de ambos extremos"""
+    try:
+        with open('/proc/net/snmp') as f:
+            titulos, valores = [linea.split() for linea in f if linea.startswith('Tcp:')][:2]
+        return int(valores[titulos.index('OutSegs')])
+    except (OSError, ValueError):
+        return None
+
+
+def medir(puerto, ruta, duracion, procesos, hilos):
+    inicio = time.time() + 0.5   # margen para que todos los procesos cliente arranquen antes de medir
+    fin = inicio + duracion
+    segmentos = segmentos_tcp()
+    with Pool(procesos) as pool:
+        resultados = pool.map(cliente, [(puerto, ruta, hilos, inicio, fin)] * procesos)
+    latencias = sorted(ms for lista, _, _ in resultados for ms in lista)
+    errores = sum(e for _, e, _ in resultados)
+    segmentos_despues = segmentos_tcp()
+    # La última petición de cada hilo termina después de 'fin': se divide por la ventana real, no por 'duracion'
+    ventana = max(terminado for _, _, terminado in resultados) - inicio
+    return {
+        'peticiones': len(latencias), 'errores': errores, 'ventana_s': round(ventana, 2),
+        'req_s': round(len(latencias) / ventana, 1),
+        'p50_ms': percentil(latencias, 50, 2), 'p90_ms': percentil(latencias, 90, 2),
+        'p99_ms': percentil(latencias, 99, 2),
+        'segmentos_por_peticion': round((segmentos_despues - segmentos) / len(latencias), 2)
+        if segmentos is not None and segmentos_despues is not None and latencias else None,
+    }
+
+
+PETICIONES_MUESTRA = {
+    'minima': b'GET /ping HTTP/1.1\r\nHost: localhost\r\n\r\n',
+    'api': (b'GET /api/ventas?pagina=2&estado=PENDIENTE HTTP/1.1\r\nHost: 192.168.1.20:5000\r\n'
+            b'User-Agent: Mozilla/5.0 (Linux; Android 13) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36\r\n'
+            b'Accept: application/json, text/plain, */*\r\nAccept-Language: es-ES,es;q=0.9\r\n'
+            b'Accept-Encoding: gzip, deflate\r\nAuthorization: Bearer ' + b'x' * 180 + b'\r\n'
+            b'Origin: http://192.168.1.20:5000\r\nReferer: http://192.168.1.20:5000/ventas\r\n'
+            b'Connection: keep-alive\r\nCache-Control: no-cache\r\n\r\n'),
+    'grande': (b'POST /api/ventas HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+               b'Content-Length: 0\r\n' + b''.join(b'X-Extra-%d: %s\r\n' % (i, b'v' * 60) for i in range(40))
+               + b'Cookie: ' + b'a=1; ' * 300 + b'\r\n\r\n'),
+}
+
+
+def rafaga_conexiones(puerto, cantidad):
+    """Abre 'cantidad' conexiones a la vez (connect no bloqueante) y mide cuánto tarda cada una en tener respuesta.
+    Con el backlog lleno el kernel descarta el SYN y el cliente lo reintenta al segundo: esas son las 'lentas'"""
+    selector = selectors.DefaultSelector()
+    peticion = b'GET /ping HTTP/1.0\r\n\r\n'
+    inicio = time.perf_counter()
+    for _ in range(cantidad):
+        s = socket.socket()
+        s.setblocking(False)
+        s.connect_ex(('127.0.0.1', puerto))
+        selector.register(s, selectors.EVENT_WRITE, [False, b''])
+    tiempos = []
+    fallidas = 0
+    while selector.get_map() and time.perf_counter() - inicio < 30:
+        for clave, _ in selector.select(timeout=1):
+            s, estado = clave.fileobj, clave.data
+            try:
+                if not estado[0]:
+                    if s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+                        raise ConnectionRefusedError
+                    s.send(peticion)
+                    estado[0] = True
+                    selector.modify(s, selectors.EVENT_READ, estado)
+                    continue
+                trozo = s.recv(65536)
+                if trozo:
+                    estado[1] += trozo
+                    continue
+                if not estado[1].startswith(b'HTTP/1.0 200'):
+                    raise ConnectionResetError
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            except OSError:
+                fallidas += 1
+            selector.unregister(s)
+            s.close()
+    for clave in list(selector.get_map().values()):   # las que ni siquiera conectaron en 30 s
+        fallidas += 1
+        clave.fileobj.close()
+    total = time.perf_counter() - inicio
+    tiempos.sort()
+    return {
+        'conexiones': cantidad, 'fallidas': fallidas,
+        'conexiones_s': round(len(tiempos) / total, 1),
+        'p50_ms': percentil(tiempos, 50), 'p99_ms': percentil(tiempos, 99),
+        'lentas_1s': sum(1 for ms in tiempos if ms >= 1000),
+    }
+
+
+def responde(puerto):
+    try:
+        with socket.create_connection(('127.0.0.1', puerto), timeout=0.5) as s:
+            s.sendall(b'GET /ping HTTP/1.0\r\n\r\n')
+            return s.recv(12).startswith(b'HTTP/1.0 200')
+    except OSError:
+        return False
+
+
+def tiempo_reinicio(proceso, puerto, entorno_extra, limite):
+    """Detiene el servidor (que deja sus TIME_WAIT) y lo relanza como lo haría un supervisor hasta que responda"""
+    detener_servidor(proceso)
+    inicio = time.perf_counter()
+    entorno = dict(os.environ, PORT=str(puerto), **entorno_extra)
+    intentos = 0
+    while time.perf_counter() - inicio < limite:
+        intentos += 1
+        proceso = subprocess.Popen([sys.executable, os.path.join(DIRECTORIO, 'servidor-definitivo.py')], env=entorno,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        while proceso.poll() is None and time.perf_counter() - inicio < limite:
+            if responde(puerto):
+                segundos = time.perf_counter() - inicio
+                detener_servidor(proceso)
+                return round(segundos, 2), intentos
+            time.sleep(0.05)
+        detener_servidor(proceso)   # salió por "Puerto en uso": reintentar como un supervisor
+        time.sleep(0.2)
+    return None, intentos
+
+
+def comparar_perfiles(rafaga, limite_reinicio, entorno_extra):
+    perfiles = ['clasico', 'baja-latencia', 'alto-rendimiento', 'muchos-clientes']
+    print(f"🧪 Perfiles de socket: ráfaga de {rafaga} conexiones simultáneas y reinicio con TIME_WAIT pendientes")
+    filas = []
+    for perfil in perfiles:
+        puerto = puerto_libre()
+        entorno = dict(entorno_extra, PERFIL_SOCKET=perfil)
+        proceso = lanzar_servidor(1, puerto, entorno)
+        resultado = rafaga_conexiones(puerto, rafaga)
+        resultado['reinicio_s'], resultado['intentos_reinicio'] = tiempo_reinicio(proceso, puerto, entorno, limite_reinicio)
+        resultado['perfil'] = perfil
+        filas.append(resultado)
+        reinicio = f"{resultado['reinicio_s']} s" if resultado['reinicio_s'] is not None else f"> {limite_reinicio:g} s"
+        print(f"   🔌 {perfil:<16} {resultado['conexiones_s']:>8} conex/s  p50 {resultado['p50_ms']} ms  "
+              f"p99 {resultado['p99_ms']} ms  lentas(SYN reintentado) {resultado['lentas_1s']}  "
+              f"fallidas {resultado['fallidas']}  reinicio {reinicio} ({resultado['intentos_reinicio']} intentos)")
+    return filas
+
+
+def micro_parser(repeticiones):
+    """µs por petición de parsear_rapido() vs BaseHTTPRequestHandler.parse_request, sin sockets ni hilos"""
+    from http.server import BaseHTTPRequestHandler
+    servidor = cargar_servidor()
+
+    def preparar(datos):
+        h = servidor.RobustServer.__new__(servidor.RobustServer)
+        h.rfile = io.BufferedReader(io.BytesIO(datos))
+        h.wfile = io.BytesIO()
+        h.raw_requestline = h.rfile.readline(65537)
+        return h
+
+    def cronometrar(datos, parsear):
+        manejadores = [preparar(datos) for _ in range(repeticiones)]
+        inicio = time.perf_counter()
+        for h in manejadores:
+            parsear(h)
+        return (time.perf_counter() - inicio) / repeticiones * 1e6
+
+    estandar = BaseHTTPRequestHandler.parse_request
+    rapido = servidor.RobustServer.parsear_rapido
+    filas = []
+    print(f"🔬 Parser de cabeceras, {repeticiones} repeticiones por muestra (µs por petición)")
+    for nombre, datos in PETICIONES_MUESTRA.items():
+        assert rapido(preparar(datos)) and estandar(preparar(datos)), f'la muestra {nombre} no parsea'
+        base = cronometrar(datos, lambda h: None)   # descuenta crear el handler y el BytesIO
+        t_estandar = max(cronometrar(datos, estandar) - base, 0.01)
+        t_rapido = max(cronometrar(datos, rapido) - base, 0.01)
+        filas.append({'muestra': nombre, 'bytes': len(datos), 'http_server_us': round(t_estandar, 2),
+                      'rapido_us': round(t_rapido, 2), 'aceleracion': round(t_estandar / t_rapido, 2)})
+        print(f"   📨 {nombre:<7} {len(datos):>5} B  http.server {t_estandar:7.2f}  propio {t_rapido:7.2f}  "
+              f"x{t_estandar / t_rapido:.2f}")
+    return filas
+
+
+def main():
+    nucleos = os.cpu_count() or 1
+    por_defecto = ','.join(str(n) for n in sorted({1, 2, 4, 8, 16, nucleos}) if n <= max(nucleos, 1))
+    parser = argparse.ArgumentParser(description='Benchmark de escalamiento del servidor con workers prefork')
+    parser.add_argument('--workers', default=por_defecto, help=f'lista de workers a probar (defecto: {por_defecto})')
+    parser.add_argument('--ruta', default='/ping')
+    parser.add_argument('--duracion', type=float, default=10.0)
+    parser.add_argument('--procesos', type=int, default=max(2, nucleos), help='procesos cliente')
+    parser.add_argument('--hilos', type=int, default=8, help='hilos por proceso cliente')
+    parser.add_argument('--ktor', help='KTOR_URL para el servidor (para medir rutas /api/)')
+    parser.add_argument('--env', action='append', default=[], metavar='CLAVE=VALOR',
+                        help='variable de entorno extra para el servidor (repetible)')
+    parser.add_argument('--micro-parser', action='store_true', help='sólo comparar los parsers de cabeceras, sin red')
+    parser.add_argument('--repeticiones', type=int, default=20000, help='repeticiones por muestra en --micro-parser')
+    parser.add_argument('--perfiles', action='store_true', help='comparar los PERFIL_SOCKET: ráfaga de accept y reinicio')
+    parser.add_argument('--rafaga', type=int, default=500, help='conexiones simultáneas en --perfiles')
+    parser.add_argument('--limite-reinicio', type=float, default=20.0, help='segundos máximos esperando el reinicio')
+    parser.add_argument('--json', help='guardar resultados en este archivo')
+    args = parser.parse_args()
+
+    if args.micro_parser:
+        filas = micro_parser(args.repeticiones)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'micro_parser': filas}, f, indent=2)
+            print(f"📝 Resultados en {args.json}")
+        return
+
+    entorno_extra = {'KTOR_URL': args.ktor} if args.ktor else {}
+    entorno_extra.update(par.split('=', 1) for par in args.env)
+    if args.perfiles:
+        filas = comparar_perfiles(args.rafaga, args.limite_reinicio, entorno_extra)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'perfiles': filas}, f, indent=2)
+            print(f"📝 Resultados en {args.json}")
+        return
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise SystemExit('❌ El modo prefork necesita SO_REUSEPORT (Linux)')
+    lista = [int(n) for n in args.workers.split(',')]
+
+    print(f"🏁 {args.ruta} | {args.procesos} procesos x {args.hilos} hilos cliente | {args.duracion:.0f} s por prueba | "
+          f"{nucleos} núcleos")
+    if nucleos < max(lista):
+        print(f"⚠️ Hay más workers que núcleos: por encima de {nucleos} no se puede esperar escalamiento")
+
+    filas = []
+    for workers in lista:
+        puerto = puerto_libre()
+        proceso = lanzar_servidor(workers, puerto, entorno_extra)
+        try:
+            resultado = medir(puerto, args.ruta, args.duracion, args.procesos, args.hilos)
+            if workers > 1:
+                resultado['reparto_pct'] = obtener_json(puerto, '/estado/cluster').get('reparto_pct')
+        finally:
+            detener_servidor(proceso)
+        resultado['workers'] = workers
+        filas.append(resultado)
+        base = filas[0]['req_s'] or 1
+        print(f"   👷 {workers:>2} workers: {resultado['req_s']:>9} req/s  x{resultado['req_s'] / base:.2f}  "
+              f"p50 {resultado['p50_ms']} ms  p99 {resultado['p99_ms']} ms  errores {resultado['errores']}"
+              + (f"  {resultado['segmentos_por_peticion']} seg/pet" if resultado['segmentos_por_peticion'] else '')
+              + (f"  reparto {resultado['reparto_pct']}" if resultado.get('reparto_pct') else ''))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'ruta': args.ruta, 'nucleos': nucleos, 'resultados': filas}, f, indent=2)
+        print(f"📝 Resultados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Busca servidor-definitivo.py en la red local por mDNS / DNS-SD (_extingrafic._tcp.local) en vez de adivinar IPs
+
+Uso:
+    python buscar-servidor.py                    # pregunta por todas las interfaces y prueba /ping en cada dirección
+    python buscar-servidor.py --espera 2 --json  # esperar más respuestas y mostrar JSON
+    python buscar-servidor.py --interfaz 127.0.0.1 --sin-ping
+
+Para probar en una sola máquina Linux, el loopback necesita multicast:
+    sudo ip link set lo multicast on
+    python servidor-definitivo.py &
+    python buscar-servidor.py --interfaz 127.0.0.1
+"""
+import argparse
+import http.client
+import json
+import random
+import socket
+import ssl
+import struct
+import time
+
+from herramientas_comunes import cargar_servidor   # reutiliza el codificador/parser DNS y descubrir_interfaces()
+
+
+def buscar(srv, servicio, interfaces, espera, extra=0.15):
+    """Consulta de un solo disparo (puerto efímero => el respondedor contesta por unicast, RFC 6762 §5.1).
+    Termina 'extra' segundos después de la primera respuesta completa, o a los 'espera' segundos"""
+    ident = random.randrange(1, 65536)
+    consulta = srv.consulta_dns(servicio, srv.TIPO_PTR, ident)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 255)
+    sock.bind(('', 0))
+    inicio = time.perf_counter()
+    for ip in interfaces:
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(ip))
+            sock.sendto(consulta, (srv.MDNS_GRUPO, srv.MDNS_PUERTO))
+        except OSError as e:
+            print(f"⚠️ No pude preguntar por {ip}: {e}")
+
+    instancias = {}   # nombre -> {'host', 'puerto', 'txt', 'primera_ms', 'respondio'}
+    hosts = {}        # host -> [ips]
+    limite = inicio + espera
+    while True:
+        restante = limite - time.perf_counter()
+        if restante <= 0:
+            break
+        sock.settimeout(restante)
+        try:
+            datos, origen = sock.recvfrom(9000)
+        except socket.timeout:
+            break
+        ms = (time.perf_counter() - inicio) * 1000
+        try:
+            recibido, flags, _, registros = srv.parsear_dns(datos)
+        except (ValueError, IndexError, struct.error):
+            continue
+        if not flags & 0x8000 or recibido != ident:
+            continue
+        for nombre, tipo, _, valor in registros:
+            if tipo == srv.TIPO_PTR and nombre == servicio:
+                instancias.setdefault(valor.lower(), {'nombre': valor, 'primera_ms': round(ms, 2), 'respondio': origen[0]})
+            elif tipo == srv.TIPO_SRV:
+                instancias.setdefault(nombre, {'nombre': nombre, 'primera_ms': round(ms, 2), 'respondio': origen[0]})
+                instancias[nombre].update(puerto=valor[2], host=valor[3].lower())
+            elif tipo == srv.TIPO_TXT:
+                instancias.setdefault(nombre, {'nombre': nombre, 'primera_ms': round(ms, 2), 'respondio': origen[0]})
+                instancias[nombre]['txt'] = dict(t.split('=', 1) for t in valor if '=' in t)
+            elif tipo == srv.TIPO_A:
+                lista = hosts.setdefault(nombre, [])
+                if valor not in lista:
+                    lista.append(valor)
+        if any('host' in i and i['host'] in hosts for i in instancias.values()):
+            limite = min(limite, time.perf_counter() + extra)   # ya hay una completa: sólo esperar a los rezagados
+    sock.close()
+
+    encontrados = []
+    for datos in instancias.values():
+        if 'host' not in datos:
+            continue
+        datos['direcciones'] = hosts.get(datos['host'], [])
+        datos['nombre'] = datos['nombre'].split('.' + servicio)[0]
+        encontrados.append(datos)
+    return encontrados
+
+
+def medir_ping(ip, puerto, esquema, timeout=2.0):
+    if esquema == 'https':
+        conn = http.client.HTTPSConnection(ip, puerto, timeout=timeout, context=ssl._create_unverified_context())
+    else:
+        conn = http.client.HTTPConnection(ip, puerto, timeout=timeout)
+    inicio = time.perf_counter()
+    try:
+        conn.request('GET', '/ping')
+        ok = conn.getresponse().status == 200
+        return round((time.perf_counter() - inicio) * 1000, 2) if ok else None
+    except (OSError, http.client.HTTPException):
+        return None
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Encuentra servidor-definitivo.py por mDNS sin escribir IPs')
+    parser.add_argument('--interfaz', action='append', default=[], help='IP local por la que preguntar (repetible)')
+    parser.add_argument('--espera', type=float, default=1.0, help='segundos máximos esperando respuestas')
+    parser.add_argument('--servicio', default=None, help='tipo de servicio (defecto: _extingrafic._tcp.local)')
+    parser.add_argument('--sin-ping', action='store_true', help='no probar /ping en las direcciones encontradas')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    srv = cargar_servidor()
+    servicio = (args.servicio or srv.SERVICIO_MDNS).lower()
+    interfaces = args.interfaz or ['127.0.0.1', *srv.descubrir_interfaces()]
+    encontrados = buscar(srv, servicio, interfaces, args.espera)
+
+    for servidor in encontrados:
+        esquema = servidor.get('txt', {}).get('esquema', 'http')
+        servidor['urls'] = [f"{esquema}://{ip}:{servidor['puerto']}" for ip in servidor['direcciones']]
+        if not args.sin_ping:
+            servidor['ping_ms'] = {ip: medir_ping(ip, servidor['puerto'], esquema) for ip in servidor['direcciones']}
+
+    if args.json:
+        print(json.dumps(encontrados, indent=2, ensure_ascii=False))
+        return
+    if not encontrados:
+        print(f"🔍 Nadie anunció {servicio} en {args.espera:g} s por {', '.join(interfaces)}")
+        print("   💡 ¿Está corriendo servidor-definitivo.py (sin MDNS=0)? ¿El firewall deja pasar 5353/udp?")
+        raise SystemExit(1)
+    for servidor in encontrados:
+        print(f"📣 {servidor['nombre']} ({servidor['host']}) respondió desde {servidor['respondio']} "
+              f"en {servidor['primera_ms']} ms")
+        for url, ip in zip(servidor['urls'], servidor['direcciones']):
+            ping = servidor.get('ping_ms', {}).get(ip)
+            estado = '' if args.sin_ping else f"  ✅ /ping {ping} ms" if ping is not None else "  ❌ sin respuesta"
+            print(f"   🔗 {srv.detectar_tipo_ip(ip)}: {url}{estado}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Proxy TCP que emula el camino WAN (latencia, jitter, ancho de banda, pérdidas, pausas y resets) entre un cliente
+y cualquiera de los servidores, para probar "Celular (Universidad) -> Internet -> VPN -> PC (Casa)" en una sola máquina
+(sin dependencias externas)
+
+Uso:
+    python emulador-wan.py proxy --perfil universidad-vpn-casa --escuchar 127.0.0.1:9090 --destino 127.0.0.1:8090
+    python emulador-wan.py proxy --perfil vpn-radmin --latencia 60 --bajada 2000     # perfil con ajustes
+    python emulador-wan.py perfiles
+    python emulador-wan.py medir --destino 26.36.148.66:8090 --nombre vpn-radmin --guardar
+
+Después, cualquier herramienta apunta al proxy en vez del servidor:
+    python prueba-carga.py --url http://127.0.0.1:9090 ...
+    python reproducir-trafico.py reproducir captura-trafico.jsonl --url http://127.0.0.1:9090
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import socket
+import statistics
+import struct
+import threading
+import time
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+ARCHIVO_PERFILES = os.path.join(DIRECTORIO, 'perfiles-wan.json')
+SEGMENTO = 1400          # bytes por "paquete" emulado (MSS típico detrás de una VPN)
+COLA_SEGMENTOS = 64      # ~90 KB en vuelo por sentido: con la cola llena se deja de leer (contrapresión como TCP)
+RTO_MINIMO_S = 0.2       # Linux no retransmite antes de 200 ms
+PERFIL_VACIO = {'latencia_ms': 0, 'jitter_ms': 0, 'bajada_kbps': 0, 'subida_kbps': 0, 'perdida_pct': 0,
+                'pausa_pct': 0, 'pausa_ms': 0, 'reset_pct': 0, 'reset_max_s': 0}
+
+
+def leer_perfiles(archivo=ARCHIVO_PERFILES):
+    with open(archivo, encoding='utf-8') as f:
+        return {nombre: datos for nombre, datos in json.load(f).items() if not nombre.startswith('_')}
+
+
+def direccion(texto):
+    host, _, puerto = texto.rpartition(':')
+    return host or '127.0.0.1', int(puerto)
+
+
+class Estadisticas:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.valores = {'conexiones': 0, 'activas': 0, 'bytes_subida': 0, 'bytes_bajada': 0, 'perdidas': 0,
+                        'pausas': 0, 'resets': 0, 'errores_destino': 0}
+
+    def sumar(self, clave, cantidad=1):
+        with self.lock:
+            self.valores[clave] += cantidad
+
+    def copia(self):
+        with self.lock:
+            return dict(self.valores)
+
+
+class Enlace:
+    """Un sentido de una conexión: lee del origen, agenda cada segmento según el perfil y lo escribe a su hora"""
+
+    def __init__(self, origen, destino, perfil, kbps, sentido, estadisticas, aleatorio):
+        self.origen = origen
+        self.destino = destino
+        self.perfil = perfil
+        self.bps = kbps * 1000 / 8 if kbps else 0
+        self.sentido = sentido
+        self.estadisticas = estadisticas
+        self.aleatorio = aleatorio
+        self.cola = queue.Queue(COLA_SEGMENTOS)
+        self.libre_en = 0.0      # cuándo termina de "transmitirse" el último segmento (ancho de banda)
+        self.ultima_entrega = 0.0
+
+    def agendar(self, segmento):
+        ahora = time.monotonic()
+        p = self.perfil
+        inicio = max(ahora, self.libre_en)
+        if p['pausa_pct'] and self.aleatorio.random() * 100 < p['pausa_pct']:
+            inicio += p['pausa_ms'] / 1000   # el enlace entero se congela: todo lo que viene detrás espera
+            self.estadisticas.sumar('pausas')
+        self.libre_en = inicio + (len(segmento) / self.bps if self.bps else 0)
+        retardo = max(0.0, self.aleatorio.gauss(p['latencia_ms'], p['jitter_ms']) / 1000) if p['jitter_ms'] \
+            else p['latencia_ms'] / 1000
+        if p['perdida_pct'] and self.aleatorio.random() * 100 < p['perdida_pct']:
+            # El segmento perdido llega recién con la retransmisión (RTO ~ RTT + margen, mínimo 200 ms)
+            retardo += max(RTO_MINIMO_S, 4 * p['latencia_ms'] / 1000)
+            self.estadisticas.sumar('perdidas')
+        # TCP entrega en orden: un segmento retrasado frena a los siguientes (head-of-line blocking)
+        self.ultima_entrega = max(self.ultima_entrega, self.libre_en + retardo)
+        return self.ultima_entrega
+
+    def leer(self):
+        try:
+            while True:
+                datos = self.origen.recv(65536)
+                if not datos:
+                    break
+                for i in range(0, len(datos), SEGMENTO):
+                    segmento = datos[i:i + SEGMENTO]
+                    self.cola.put((self.agendar(segmento), segmento))
+        except OSError:
+            pass
+        self.cola.put((None, None))
+
+    def escribir(self):
+        try:
+            while True:
+                hora, segmento = self.cola.get()
+                if segmento is None:
+                    self.destino.shutdown(socket.SHUT_WR)   # medio cierre: el otro sentido sigue vivo
+                    return
+                espera = hora - time.monotonic()
+                if espera > 0:
+                    time.sleep(espera)
+                self.destino.sendall(segmento)
+                self.estadisticas.sumar(self.sentido, len(segmento))
+        except OSError:
+            # El destino murió: dejar de leer y descartar hasta el final para que leer() no quede bloqueado en put()
+            try:
+                self.origen.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+            while segmento is not None:
+                _, segmento = self.cola.get()
+
+    def iniciar(self):
+        hilos = [threading.Thread(target=self.leer, daemon=True), threading.Thread(target=self.escribir, daemon=True)]
+        for h in hilos:
+            h.start()
+        return hilos
+
+
+def resetear(*sockets):
+    """Cierre con RST (SO_LINGER 0), como cuando el túnel VPN se cae a mitad de una respuesta"""
+    for s in sockets:
+        try:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            s.shutdown(socket.SHUT_RD)   # despierta al hilo bloqueado en recv() (close() solo no lo hace)
+            s.close()
+        except OSError:
+            pass
+
+
+def atender(cliente, destino, perfil, estadisticas, aleatorio):
+    estadisticas.sumar('conexiones')
+    estadisticas.sumar('activas')
+    servidor = None
+    try:
+        # El handshake también cruza el camino: un RTT antes de que el cliente pueda hablar
+        time.sleep(2 * perfil['latencia_ms'] / 1000)
+        try:
+            servidor = socket.create_connection(destino, timeout=10)
+            servidor.settimeout(None)
+        except OSError:
+            estadisticas.sumar('errores_destino')
+            resetear(cliente)
+            return
+        for s in (cliente, servidor):
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)   # el retardo lo pone el emulador, no Nagle
+        # Un generador por sentido, sembrados antes de arrancar los hilos: compartir uno entre dos hilos hace que
+        # el orden de los sorteos (y gauss(), que guarda estado) dependa del scheduler y --semilla deja de repetir
+        subida, bajada = random.Random(aleatorio.random()), random.Random(aleatorio.random())
+        hilos = Enlace(cliente, servidor, perfil, perfil['subida_kbps'], 'bytes_subida', estadisticas, subida).iniciar()
+        hilos += Enlace(servidor, cliente, perfil, perfil['bajada_kbps'], 'bytes_bajada', estadisticas, bajada).iniciar()
+        corte = None
+        if perfil['reset_pct'] and aleatorio.random() * 100 < perfil['reset_pct']:
+            corte = time.monotonic() + aleatorio.uniform(0, perfil['reset_max_s'] or 1)
+        for h in hilos:
+            h.join(None if corte is None else max(0.0, corte - time.monotonic()))
+        if corte is not None and any(h.is_alive() for h in hilos):
+            estadisticas.sumar('resets')
+            resetear(cliente, servidor)
+    finally:
+        estadisticas.sumar('activas', -1)
+        for s in (cliente, servidor):
+            if s is not None:
+                try:
+                    s.close()
+                except OSError:
+                    pass
+
+
+def correr_proxy(args):
+    perfiles = leer_perfiles(args.archivo)
+    if args.perfil and args.perfil not in perfiles:
+        raise SystemExit(f"❌ Perfil desconocido: {args.perfil} (disponibles: {', '.join(perfiles)})")
+    perfil = dict(PERFIL_VACIO, **(perfiles[args.perfil] if args.perfil else {}))
+    ajustes = {'latencia_ms': args.latencia, 'jitter_ms': args.jitter, 'bajada_kbps': args.bajada,
+               'subida_kbps': args.subida, 'perdida_pct': args.perdida, 'pausa_pct': args.pausa_pct,
+               'pausa_ms': args.pausa_ms, 'reset_pct': args.reset_pct, 'reset_max_s': args.reset_max_s}
+    perfil.update({k: v for k, v in ajustes.items() if v is not None})
+    aleatorio = random.Random(args.semilla)
+    escuchar, destino = direccion(args.escuchar), direccion(args.destino)
+
+    oyente = socket.socket()
+    oyente.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    oyente.bind(escuchar)
+    oyente.listen(128)
+    estadisticas = Estadisticas()
+    limite = lambda kbps: f"{kbps / 1000:g} Mbit/s" if kbps else "sin límite"
+    print(f"🌍 Emulando '{args.perfil or 'a medida'}': {escuchar[0]}:{escuchar[1]} -> {destino[0]}:{destino[1]}")
+    print(f"   ⏱️ RTT agregado {2 * perfil['latencia_ms']:g} ms ± {perfil['jitter_ms']:g} | bajada {limite(perfil['bajada_kbps'])} "
+          f"| subida {limite(perfil['subida_kbps'])} | pérdida {perfil['perdida_pct']:g}% "
+          f"| pausas {perfil['pausa_pct']:g}% de {perfil['pausa_ms']:g} ms | resets {perfil['reset_pct']:g}%")
+    print("🔥 Presiona Ctrl+C para detener")
+
+    def informar():
+        anterior = estadisticas.copia()
+        while True:
+            time.sleep(args.informe)
+            actual = estadisticas.copia()
+            if actual != anterior:
+                print(f"📊 [{time.strftime('%H:%M:%S')}] conexiones {actual['conexiones']} (activas {actual['activas']}) "
+                      f"| ↓ {actual['bytes_bajada'] // 1024} KB ↑ {actual['bytes_subida'] // 1024} KB "
+                      f"| pérdidas {actual['perdidas']} pausas {actual['pausas']} resets {actual['resets']}"
+                      + (f" | destino caído {actual['errores_destino']}" if actual['errores_destino'] else ''))
+            anterior = actual
+
+    if args.informe:
+        threading.Thread(target=informar, daemon=True).start()
+    try:
+        while True:
+            cliente, _ = oyente.accept()
+            semilla = aleatorio.random()   # cada conexión con su propio generador: reproducible con --semilla
+            threading.Thread(target=atender, args=(cliente, destino, perfil, estadisticas, random.Random(semilla)),
+                             daemon=True).start()
+    except KeyboardInterrupt:
+        print(f"\n🛑 Emulador detenido: {json.dumps(estadisticas.copia())}")
+    finally:
+        oyente.close()
+
+
+def listar_perfiles(args):
+    for nombre, p in leer_perfiles(args.archivo).items():
+        print(f"🌐 {nombre:<22} RTT {2 * p['latencia_ms']:>4g} ms ±{p['jitter_ms']:<3g} "
+              f"↓{p['bajada_kbps'] / 1000:>5g} ↑{p['subida_kbps'] / 1000:>5g} Mbit/s  pérdida {p['perdida_pct']:g}%  "
+              f"[{p.get('fuente', '?')}]  {p.get('descripcion', '')}")
+
+
+def medir(args):
+    """RTT y jitter reales hasta un servidor (tiempo de connect TCP), para reemplazar los valores estimados"""
+    destino = direccion(args.destino)
+    tiempos, fallidas = [], 0
+    print(f"📏 Midiendo {args.muestras} conexiones a {destino[0]}:{destino[1]}...")
+    for _ in range(args.muestras):
+        inicio = time.perf_counter()
+        try:
+            socket.create_connection(destino, timeout=3).close()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        except OSError:
+            fallidas += 1
+        time.sleep(args.intervalo)
+    if len(tiempos) < 2:
+        raise SystemExit(f"❌ Sólo {len(tiempos)} conexiones exitosas de {args.muestras}")
+    rtt = statistics.median(tiempos)
+    medido = {
+        'latencia_ms': round(rtt / 2, 1),
+        'jitter_ms': round(statistics.pstdev(tiempos) / 2, 1),
+        'perdida_pct': round(100 * fallidas / args.muestras, 1),
+    }
+    print(f"   ⏱️ RTT mediana {rtt:.1f} ms (min {min(tiempos):.1f}, max {max(tiempos):.1f}) | "
+          f"latencia de ida {medido['latencia_ms']} ms ± {medido['jitter_ms']} | fallidas {medido['perdida_pct']}%")
+    print("   💡 El ancho de banda no se mide aquí: ajústalo con una descarga real o prueba-carga.py")
+    if args.guardar:
+        if not args.nombre:
+            raise SystemExit("❌ --guardar necesita --nombre")
+        with open(args.archivo, encoding='utf-8') as f:
+            todos = json.load(f)
+        perfil = dict(PERFIL_VACIO, **todos.get(args.nombre, {}))
+        perfil.update(medido, fuente=f"medido {time.strftime('%Y-%m-%d')} contra {args.destino}")
+        todos[args.nombre] = perfil
+        temporal = args.archivo + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(todos, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        os.replace(temporal, args.archivo)
+        print(f"📝 Perfil '{args.nombre}' actualizado en {args.archivo}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Emulador de WAN entre el celular y los servidores')
+    parser.add_argument('--archivo', default=ARCHIVO_PERFILES, help='archivo de perfiles (defecto: perfiles-wan.json)')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    proxy = sub.add_parser('proxy')
+    proxy.add_argument('--perfil', help='nombre en perfiles-wan.json')
+    proxy.add_argument('--escuchar', default='127.0.0.1:9090')
+    proxy.add_argument('--destino', default='127.0.0.1:8090')
+    proxy.add_argument('--latencia', type=float, help='ms de ida por sentido')
+    proxy.add_argument('--jitter', type=float, help='ms')
+    proxy.add_argument('--bajada', type=float, help='kbit/s servidor -> celular (0 = sin límite)')
+    proxy.add_argument('--subida', type=float, help='kbit/s celular -> servidor (0 = sin límite)')
+    proxy.add_argument('--perdida', type=float, help='%% de segmentos perdidos')
+    proxy.add_argument('--pausa-pct', type=float)
+    proxy.add_argument('--pausa-ms', type=float)
+    proxy.add_argument('--reset-pct', type=float)
+    proxy.add_argument('--reset-max-s', type=float)
+    proxy.add_argument('--semilla', type=int, help='para repetir exactamente la misma secuencia de eventos')
+    proxy.add_argument('--informe', type=float, default=5.0, help='segundos entre informes (0 = sin informes)')
+
+    sub.add_parser('perfiles')
+
+    med = sub.add_parser('medir')
+    med.add_argument('--destino', required=True, help='host:puerto real (p. ej. 26.36.148.66:8090)')
+    med.add_argument('--muestras', type=int, default=30)
+    med.add_argument('--intervalo', type=float, default=0.2)
+    med.add_argument('--nombre', help='perfil a actualizar')
+    med.add_argument('--guardar', action='store_true')
+    args = parser.parse_args()
+
+    {'proxy': correr_proxy, 'perfiles': listar_perfiles, 'medir': medir}[args.comando](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Genera un certificado autofirmado para probar el TLS de servidor-definitivo.py
+Incluye como nombres alternativos localhost y las IPs de todas las interfaces (WiFi, Radmin, OpenVPN)
+Requiere el ejecutable openssl (viene con Git para Windows y con cualquier Linux)
+
+Uso:
+    python generar-certificado.py
+    python generar-certificado.py --dir certificados --dias 825 --ip 192.168.1.24
+    TLS_CERT=certificados/servidor.pem TLS_KEY=certificados/servidor-key.pem python servidor-definitivo.py
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+
+from herramientas_comunes import cargar_servidor
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+def ips_locales():
+    """Reutiliza descubrir_interfaces() del servidor para no repetir el parseo de ipconfig/ip addr"""
+    return list(cargar_servidor().descubrir_interfaces())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Certificado autofirmado para probar TLS en el puerto 8090')
+    parser.add_argument('--dir', default=os.path.join(DIRECTORIO, 'certificados'))
+    parser.add_argument('--dias', type=int, default=365)
+    parser.add_argument('--cn', default='extingrafic-local')
+    parser.add_argument('--ip', action='append', default=[], help='IP extra para el certificado (repetible)')
+    parser.add_argument('--curva', default='prime256v1', help='ECDSA: handshakes más rápidos que RSA en celulares')
+    args = parser.parse_args()
+
+    if not shutil.which('openssl'):
+        raise SystemExit('❌ No encontré openssl en el PATH (en Windows viene con Git: C:\\Program Files\\Git\\usr\\bin)')
+    os.makedirs(args.dir, exist_ok=True)
+    certificado = os.path.join(args.dir, 'servidor.pem')
+    clave = os.path.join(args.dir, 'servidor-key.pem')
+
+    ips = ['127.0.0.1'] + [ip for ip in ips_locales() + args.ip if ip != '127.0.0.1']
+    nombres = ['DNS:localhost'] + [f'IP:{ip}' for ip in dict.fromkeys(ips)]
+
+    # Escribir a temporales y reemplazar al final: el servidor recarga al ver cambiar el archivo
+    # y nunca debe leer un certificado a medio escribir
+    with tempfile.TemporaryDirectory(dir=args.dir) as temporal:
+        cert_tmp = os.path.join(temporal, 'servidor.pem')
+        clave_tmp = os.path.join(temporal, 'servidor-key.pem')
+        subprocess.run([
+            'openssl', 'req', '-x509', '-newkey', 'ec', '-pkeyopt', f'ec_paramgen_curve:{args.curva}',
+            '-nodes', '-keyout', clave_tmp, '-out', cert_tmp, '-days', str(args.dias),
+            '-subj', f'/CN={args.cn}', '-addext', f"subjectAltName={','.join(nombres)}",
+        ], check=True, capture_output=True)
+        os.replace(clave_tmp, clave)
+        os.replace(cert_tmp, certificado)
+
+    print(f"✅ Certificado: {certificado}")
+    print(f"🔑 Clave:       {clave}")
+    print(f"🌐 Válido para: {', '.join(nombres)} por {args.dias} días")
+    print("\n▶️ Iniciar el servidor con TLS:")
+    print(f"   TLS_CERT={certificado} TLS_KEY={clave} python servidor-definitivo.py")
+    print("📱 En el celular hay que confiar en este certificado (o usar uno de una CA) antes de abrir https://<ip>:8090")
+
+
+if __name__ == "__main__":
+    main()
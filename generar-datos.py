@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Generador de datos sintéticos masivos para benchmarks de kardex y dashboard
+Escribe archivos en formato COPY de PostgreSQL por bloques, con memoria constante
+y en paralelo (sin dependencias externas)
+
+Uso:
+    python generar-datos.py --salida datos-sinteticos --escala 1 --procesos 4
+    cd datos-sinteticos && psql -h localhost -U dpozas -d dpozas_bd -f cargar.sql
+
+El resultado es idéntico para la misma semilla sin importar el número de procesos:
+cada bloque de filas usa su propia semilla derivada de (semilla, tabla, bloque).
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+FILAS_POR_BLOQUE = 100_000
+MAX_ITEMS_POR_VENTA = 5
+FECHA_FIN = datetime(2025, 12, 31, 23, 59, 59)
+DIAS_HISTORIA = 3 * 365
+
+CATEGORIAS = ['Extintores', 'Recargas', 'Señalética', 'Repuestos', 'Gabinetes', 'Mangueras', 'Detectores', 'Servicios']
+TIPOS_EXTINTOR = [('Polvo químico', 'ABC'), ('CO2', 'CO2'), ('Agua presurizada', 'AGUA'),
+                  ('Espuma', 'ESPUMA'), ('Acetato de potasio', 'K')]
+CAPACIDADES = ['1kg', '2kg', '4kg', '6kg', '10kg', '5lb', '10lb', '20lb']
+COMUNAS = ['Concepción', 'Talcahuano', 'Chillán', 'Los Ángeles', 'Coronel', 'San Pedro de la Paz', 'Hualpén', 'Tomé']
+CLIENTES = ['Constructora', 'Hospital', 'Colegio', 'Minimarket', 'Universidad', 'Transportes', 'Clínica', 'Municipalidad']
+METODOS_PAGO = ['EFECTIVO', 'TARJETA', 'TRANSFERENCIA', 'CREDITO']
+
+# Orden de carga respetando las claves foráneas
+TABLAS = {
+    'clientes': ['id', 'nombre', 'rut', 'activo', 'fecha_creacion', 'fecha_actualizacion'],
+    'sedes': ['id', 'cliente_id', 'nombre', 'direccion', 'comuna', 'lat', 'lon',
+              'fecha_creacion', 'fecha_actualizacion'],
+    'productos': ['id', 'nombre', 'codigo', 'descripcion', 'precio', 'precio_compra', 'cantidad', 'categoria',
+                  'estado', 'proveedor_id', 'stock_minimo', 'fecha_creacion', 'fecha_actualizacion'],
+    'extintores': ['id', 'codigo_qr', 'cliente_id', 'sede_id', 'tipo', 'agente', 'capacidad', 'ubicacion',
+                   'estado_logistico', 'fecha_fabricacion', 'fecha_ultima_recarga', 'fecha_proximo_vencimiento',
+                   'estado', 'fecha_creacion', 'fecha_actualizacion'],
+    'ventas': ['id', 'numero', 'cliente', 'cliente_rut', 'cliente_direccion', 'cliente_telefono', 'cliente_email',
+               'fecha', 'subtotal', 'impuestos', 'total', 'descuento', 'estado', 'metodo_pago', 'observaciones',
+               'vendedor_id', 'fecha_creacion', 'fecha_actualizacion'],
+    'venta_productos': ['id', 'venta_id', 'producto_id', 'cantidad', 'precio', 'subtotal', 'descuento', 'iva',
+                        'devuelto'],
+    'movimientos_inventario': ['id', 'producto_id', 'tipo', 'cantidad', 'motivo', 'documento', 'proveedor_id',
+                               'usuario_id', 'observaciones', 'fecha_registro', 'estado_aprobacion',
+                               'requiere_aprobacion', 'aprobado_por', 'fecha_aprobacion', 'idempotencia_key'],
+}
+
+
+def mezclar(*valores):
+    """Hash entero determinista (splitmix64) para derivar semillas y atributos por id"""
+    x = 0x9E3779B97F4A7C15
+    for v in valores:
+        x = (x ^ (v & 0xFFFFFFFFFFFFFFFF)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+        x = (x ^ (x >> 27)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+        x ^= x >> 31
+    return x
+
+
+def codigo_tabla(nombre):
+    return sum(ord(c) * 31 ** i for i, c in enumerate(nombre)) & 0xFFFFFFFF
+
+
+def copy_valor(valor):
+    """Un campo en formato texto de COPY: \\N para NULL y escapes para separadores"""
+    if valor is None:
+        return '\\N'
+    if valor is True or valor is False:
+        return 't' if valor else 'f'
+    if isinstance(valor, datetime):
+        # Las fechas generadas no llevan microsegundos: isoformat es bastante más rápido que strftime
+        return valor.isoformat(' ')
+    texto = str(valor)
+    if '\\' in texto or '\t' in texto or '\n' in texto or '\r' in texto:
+        texto = texto.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return texto
+
+
+class Config:
+    """Cantidades y rango de ids; los ids empiezan en id_base para no chocar con el DatabaseSeeder"""
+
+    def __init__(self, args):
+        self.semilla = args.semilla
+        self.id_base = args.id_base
+        self.usuarios = args.usuarios
+        escala = args.escala
+        self.cantidades = {
+            'clientes': int(500 * escala),
+            'sedes': int(1_500 * escala),
+            'productos': int(5_000 * escala),
+            'extintores': int(20_000 * escala),
+            'ventas': int(200_000 * escala),
+            'movimientos_inventario': int(2_000_000 * escala),
+        }
+        for tabla in self.cantidades:
+            valor = getattr(args, tabla, None)
+            if valor is not None:
+                self.cantidades[tabla] = valor
+
+    def rango(self, tabla):
+        return self.id_base, self.id_base + self.cantidades[tabla]
+
+    def id_aleatorio(self, rng, tabla):
+        inicio, fin = self.rango(tabla)
+        return rng.randrange(inicio, fin)
+
+    def usuario(self, rng):
+        # Los usuarios los crea el seeder (ids 1..N); sin usuarios la referencia queda NULL
+        return rng.randint(1, self.usuarios) if self.usuarios else None
+
+
+def fecha_aleatoria(rng, dias=DIAS_HISTORIA):
+    return FECHA_FIN - timedelta(seconds=rng.randrange(dias * 86_400))
+
+
+def precio_producto(config, producto_id):
+    """Precio de venta derivado del id: las ventas lo conocen sin leer la tabla productos"""
+    compra = (mezclar(config.semilla, producto_id, 1) % 400 + 2) * 500
+    return compra, compra * (120 + mezclar(config.semilla, producto_id, 2) % 60) // 100
+
+
+# ---------- Filas por tabla ----------
+
+def filas_clientes(config, rng, desde, hasta):
+    for i in range(desde, hasta):
+        creado = fecha_aleatoria(rng)
+        yield (i, f'{rng.choice(CLIENTES)} {rng.choice(COMUNAS)} {i}', f'{76_000_000 + i}-{i % 10}',
+               rng.random() > 0.03, creado, creado)
+
+
+def filas_sedes(config, rng, desde, hasta):
+    for i in range(desde, hasta):
+        creado = fecha_aleatoria(rng)
+        comuna = rng.choice(COMUNAS)
+        yield (i, config.id_aleatorio(rng, 'clientes'), f'Sede {comuna} {i}', f'Calle {rng.randint(1, 300)} #{i % 3000}',
+               comuna, round(-36.8 + rng.uniform(-0.5, 0.5), 6), round(-73.0 + rng.uniform(-0.5, 0.5), 6),
+               creado, creado)
+
+
+def filas_productos(config, rng, desde, hasta):
+    for i in range(desde, hasta):
+        categoria = rng.choice(CATEGORIAS)
+        compra, venta = precio_producto(config, i)
+        creado = fecha_aleatoria(rng)
+        yield (i, f'{categoria} modelo {i}', f'GEN-{i:08d}', None, venta, compra, rng.randint(0, 500), categoria,
+               'ACTIVO' if rng.random() > 0.05 else 'INACTIVO', None, rng.randint(0, 15),
+               creado, creado + timedelta(days=rng.randint(0, 60)))
+
+
+def filas_extintores(config, rng, desde, hasta):
+    for i in range(desde, hasta):
+        tipo, agente = rng.choice(TIPOS_EXTINTOR)
+        fabricado = fecha_aleatoria(rng, dias=10 * 365)
+        recarga = fabricado + timedelta(days=rng.randint(0, max(1, (FECHA_FIN - fabricado).days)))
+        vencimiento = recarga + timedelta(days=365)
+        dias_restantes = (vencimiento - FECHA_FIN).days
+        estado = 'VENCIDO' if dias_restantes < 0 else 'POR_VENCER' if dias_restantes <= 30 else 'VIGENTE'
+        sede = config.id_aleatorio(rng, 'sedes') if config.cantidades['sedes'] and rng.random() > 0.1 else None
+        yield (i, f'EXT-{i:09d}', config.id_aleatorio(rng, 'clientes'), sede, tipo, agente, rng.choice(CAPACIDADES),
+               f'Piso {rng.randint(1, 12)}, pasillo {rng.randint(1, 8)}',
+               rng.choices(['DISPONIBLE', 'TALLER', 'TERRENO', 'PRESTAMO', 'FUERA_SERVICIO'],
+                           weights=[70, 8, 15, 4, 3])[0],
+               fabricado, recarga, vencimiento, estado, fabricado, recarga)
+
+
+def filas_ventas(config, rng, desde, hasta):
+    """Produce pares (tabla, fila): cada venta arrastra sus venta_productos con totales coherentes"""
+    for i in range(desde, hasta):
+        fecha = fecha_aleatoria(rng)
+        subtotal = 0
+        for j in range(rng.randint(1, MAX_ITEMS_POR_VENTA)):
+            producto_id = config.id_aleatorio(rng, 'productos')
+            cantidad = rng.randint(1, 6)
+            precio = precio_producto(config, producto_id)[1]
+            subtotal += precio * cantidad
+            yield 'venta_productos', (i * MAX_ITEMS_POR_VENTA + j, i, producto_id, cantidad, precio,
+                                      precio * cantidad, 0, 0.19, 0)
+        impuestos = round(subtotal * 0.19)
+        estado = rng.choices(['COMPLETADA', 'PENDIENTE', 'CANCELADA'], weights=[85, 10, 5])[0]
+        yield 'ventas', (i, f'G-{i:010d}', f'{rng.choice(CLIENTES)} {rng.choice(COMUNAS)}', None, None, None, None,
+                         fecha, subtotal, impuestos, subtotal + impuestos, 0, estado, rng.choice(METODOS_PAGO), None,
+                         config.usuario(rng), fecha, fecha)
+
+
+def filas_movimientos(config, rng, desde, hasta):
+    for i in range(desde, hasta):
+        r = rng.random()
+        if r < 0.5:
+            tipo, cantidad, motivo = 'ENTRADA', rng.randint(5, 80), 'Compra proveedor'
+        elif r < 0.93:
+            tipo, cantidad, motivo = 'SALIDA', rng.randint(1, 20), 'Venta'
+        else:
+            tipo, cantidad, motivo = 'AJUSTE', rng.randint(-5, 5) or 1, 'Ajuste inventario'
+        fecha = fecha_aleatoria(rng)
+        requiere = tipo == 'AJUSTE' and rng.random() < 0.5
+        estado = rng.choices(['APROBADO', 'PENDIENTE', 'RECHAZADO'], weights=[80, 15, 5])[0] if requiere else 'APROBADO'
+        aprobado_por = config.usuario(rng) if requiere and estado != 'PENDIENTE' else None
+        fecha_aprobacion = fecha + timedelta(hours=rng.randint(1, 48)) if requiere and estado != 'PENDIENTE' else None
+        yield (i, config.id_aleatorio(rng, 'productos'), tipo, cantidad, motivo, f'DOC-{i}', None,
+               config.usuario(rng), None, fecha, estado, requiere, aprobado_por, fecha_aprobacion, None)
+
+
+GENERADORES = {
+    'clientes': filas_clientes,
+    'sedes': filas_sedes,
+    'productos': filas_productos,
+    'extintores': filas_extintores,
+    'ventas': filas_ventas,
+    'movimientos_inventario': filas_movimientos,
+}
+
+
+class EscritorCopy:
+    """Escribe filas COPY con un búfer acotado: la memoria no crece con el tamaño del bloque"""
+
+    def __init__(self, ruta, filas_por_escritura=5_000):
+        self.archivo = open(ruta, 'w', encoding='utf-8', newline='\n')
+        self.bufer = []
+        self.filas_por_escritura = filas_por_escritura
+        self.filas = 0
+
+    def escribir(self, fila):
+        self.bufer.append('\t'.join(map(copy_valor, fila)))
+        self.filas += 1
+        if len(self.bufer) >= self.filas_por_escritura:
+            self.vaciar()
+
+    def vaciar(self):
+        if self.bufer:
+            self.archivo.write('\n'.join(self.bufer))
+            self.archivo.write('\n')
+            self.bufer.clear()
+
+    def cerrar(self):
+        self.vaciar()
+        self.archivo.close()
+
+
+def ruta_bloque(salida, tabla, bloque):
+    return os.path.join(salida, f'{tabla}.{bloque:05d}.copy')
+
+
+def generar_bloque(tarea):
+    """Genera un bloque de una tabla; es la unidad de trabajo de cada proceso"""
+    config, salida, tabla, bloque = tarea
+    inicio_ids, fin_ids = config.rango(tabla)
+    desde = inicio_ids + bloque * FILAS_POR_BLOQUE
+    hasta = min(fin_ids, desde + FILAS_POR_BLOQUE)
+    rng = random.Random(mezclar(config.semilla, codigo_tabla(tabla), bloque))
+    inicio = time.monotonic()
+
+    if tabla == 'ventas':
+        escritores = {t: EscritorCopy(ruta_bloque(salida, t, bloque)) for t in ('ventas', 'venta_productos')}
+        for destino, fila in filas_ventas(config, rng, desde, hasta):
+            escritores[destino].escribir(fila)
+    else:
+        escritores = {tabla: EscritorCopy(ruta_bloque(salida, tabla, bloque))}
+        escritor = escritores[tabla]
+        for fila in GENERADORES[tabla](config, rng, desde, hasta):
+            escritor.escribir(fila)
+
+    filas = {}
+    for nombre, escritor in escritores.items():
+        escritor.cerrar()
+        filas[nombre] = escritor.filas
+    return tabla, bloque, filas, time.monotonic() - inicio
+
+
+def escribir_script_carga(config, salida, bloques):
+    """cargar.sql: \\copy de cada bloque en orden de claves foráneas y ajuste de secuencias"""
+    lineas = ['-- Generado por generar-datos.py; ejecutar con psql desde esta carpeta',
+              '\\set ON_ERROR_STOP on', 'BEGIN;']
+    for tabla, columnas in TABLAS.items():
+        origen = 'ventas' if tabla == 'venta_productos' else tabla
+        for bloque in range(bloques.get(origen, 0)):
+            archivo = os.path.basename(ruta_bloque(salida, tabla, bloque))
+            lineas.append(f"\\copy {tabla} ({', '.join(columnas)}) FROM '{archivo}'")
+    lineas.append('COMMIT;')
+    for tabla in TABLAS:
+        lineas.append(f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), "
+                      f"(SELECT COALESCE(MAX(id), 1) FROM {tabla}));")
+    lineas.append('ANALYZE;')
+    with open(os.path.join(salida, 'cargar.sql'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lineas) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Genera datos sintéticos en formato COPY de PostgreSQL')
+    parser.add_argument('--salida', default='datos-sinteticos')
+    parser.add_argument('--semilla', type=int, default=2025)
+    parser.add_argument('--escala', type=float, default=1.0,
+                        help='1 = 5k productos, 20k extintores, 200k ventas, 2M movimientos')
+    parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--id-base', type=int, default=1_000_000,
+                        help='primer id generado (deja libres los ids del DatabaseSeeder)')
+    parser.add_argument('--usuarios', type=int, default=0,
+                        help='usuarios existentes (ids 1..N) para vendedor/usuario; 0 deja NULL')
+    for tabla in GENERADORES:
+        parser.add_argument(f'--{tabla.replace("_", "-")}', dest=tabla, type=int, default=None,
+                            help=f'cantidad exacta de {tabla}')
+    args = parser.parse_args()
+    config = Config(args)
+    os.makedirs(args.salida, exist_ok=True)
+
+    print("🏭 GENERADOR DE DATOS SINTÉTICOS")
+    print("=" * 50)
+    for tabla, cantidad in config.cantidades.items():
+        print(f"   {tabla}: {cantidad:,}")
+    print(f"   procesos: {args.procesos} | semilla: {args.semilla} | id base: {args.id_base:,}")
+
+    bloques = {tabla: -(-cantidad // FILAS_POR_BLOQUE) for tabla, cantidad in config.cantidades.items()}
+    tareas = [(config, args.salida, tabla, b) for tabla, n in bloques.items() for b in range(n)]
+    # Los bloques grandes primero: el reparto entre procesos queda más parejo
+    tareas.sort(key=lambda t: -(config.cantidades[t[2]] if t[2] != 'ventas' else config.cantidades[t[2]] * 4))
+
+    inicio = time.monotonic()
+    totales = {}
+    with Pool(args.procesos) as pool:
+        for tabla, bloque, filas, segundos in pool.imap_unordered(generar_bloque, tareas):
+            for nombre, n in filas.items():
+                totales[nombre] = totales.get(nombre, 0) + n
+            print(f"✅ {tabla} bloque {bloque}: {sum(filas.values()):,} filas en {segundos:.1f} s")
+
+    escribir_script_carga(config, args.salida, bloques)
+    duracion = time.monotonic() - inicio
+    total_filas = sum(totales.values())
+    print("=" * 50)
+    print(f"📦 {total_filas:,} filas en {duracion:.1f} s ({total_filas / duracion:,.0f} filas/s)")
+    print(f"📝 Carga: cd {args.salida} && psql -h localhost -U dpozas -d dpozas_bd -f cargar.sql")
+
+
+if __name__ == "__main__":
+    main()
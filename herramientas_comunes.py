@@ -0,0 +1,32 @@
+"""
+Funciones compartidas por las herramientas de línea de comandos (prueba-carga.py, reproducir-trafico.py, ...)
+No es un script: los scripts con guion en el nombre lo importan desde la misma carpeta
+"""
+import importlib.util
+import os
+import socket
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+def cargar_servidor():
+    """Importa servidor-definitivo.py (el guion impide un import normal) para reutilizar sus funciones sin copiarlas"""
+    spec = importlib.util.spec_from_file_location('servidor_definitivo', os.path.join(DIRECTORIO, 'servidor-definitivo.py'))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def percentil(ordenados, p, decimales=1):
+    """Percentil p (0-100) de una lista ya ordenada, por el método del rango más cercano; None si está vacía"""
+    if not ordenados:
+        return None
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return round(ordenados[indice], decimales)
+
+
+def puerto_libre():
+    """Un puerto TCP libre en 127.0.0.1 para levantar un servidor o mock de prueba"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
@@ -0,0 +1,607 @@
+#!/usr/bin/env python3
+"""
+Servidor simulado (mock) de la API Ktor para pruebas de carga de la app
+Datos en memoria generados al iniciar, sin PostgreSQL (sin dependencias externas)
+
+Uso:
+    python mock-api-ktor.py --puerto 8080 --productos 2000 --ventas 5000
+    python mock-api-ktor.py --latencia-ms 80 --jitter-ms 40 --tasa-error 0.02
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import http.server
+import json
+import os
+import random
+import re
+import socketserver
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+
+# Mismos valores por defecto que server/.../Constants.kt, así los tokens sirven también en el servidor frontal
+JWT_SECRET = os.environ.get('JWT_SECRET', 'super-secret-key-change-me')
+JWT_ISSUER = os.environ.get('JWT_ISSUER', 'extingrafic-api')
+JWT_AUDIENCE = os.environ.get('JWT_AUDIENCE', 'extingrafic-clients')
+JWT_EXP_MINUTES = int(os.environ.get('JWT_EXP_MINUTES', '120'))
+
+PASSWORD_DEMO = 'demo123'
+CATEGORIAS = ['Extintores', 'Recargas', 'Señalética', 'Repuestos', 'Gabinetes', 'Mangueras', 'Detectores', 'Servicios']
+ROLES = ['ADMIN', 'VENTAS', 'INVENTARIO', 'SUPERVISOR']
+CLIENTES = ['Constructora Biobío', 'Hospital Regional', 'Colegio San José', 'Minimarket Don Pepe',
+            'Universidad del Bío-Bío', 'Transportes Sur', 'Clínica Andes', 'Municipalidad de Concepción']
+
+
+def fecha_iso(fecha):
+    return fecha.replace(microsecond=0).isoformat()
+
+
+def b64url(datos):
+    return base64.urlsafe_b64encode(datos).rstrip(b'=').decode('ascii')
+
+
+def b64url_decodificar(segmento):
+    return base64.urlsafe_b64decode(segmento + '=' * (-len(segmento) % 4))
+
+
+def generar_token(usuario):
+    """JWT HS256 con los mismos claims que JwtConfig.generateToken"""
+    ahora = int(time.time())
+    cabecera = b64url(json.dumps({'alg': 'HS256', 'typ': 'JWT'}).encode())
+    payload = b64url(json.dumps({
+        'iss': JWT_ISSUER, 'aud': JWT_AUDIENCE,
+        'userId': usuario['id'], 'email': usuario['email'], 'role': usuario['rol'],
+        'iat': ahora, 'exp': ahora + JWT_EXP_MINUTES * 60,
+    }).encode())
+    firma = hmac.new(JWT_SECRET.encode(), f'{cabecera}.{payload}'.encode(), hashlib.sha256).digest()
+    return f'{cabecera}.{payload}.{b64url(firma)}'
+
+
+def leer_token(token):
+    """Devuelve los claims si el token es válido, None en otro caso"""
+    try:
+        cabecera, payload, firma = token.split('.')
+        esperada = hmac.new(JWT_SECRET.encode(), f'{cabecera}.{payload}'.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(esperada, b64url_decodificar(firma)):
+            return None
+        claims = json.loads(b64url_decodificar(payload))
+        return claims if claims.get('exp', 0) > time.time() else None
+    except (ValueError, AttributeError):
+        return None
+
+
+class Almacen:
+    """Stores en memoria con índices por producto, tipo y estado; las lecturas frecuentes se sirven pre-serializadas"""
+
+    def __init__(self, semilla, n_usuarios, n_productos, n_movimientos, n_ventas):
+        self.lock = threading.RLock()
+        self.rng = random.Random(semilla)
+        self.usuarios = {}
+        self.usuarios_por_email = {}
+        self.productos = {}
+        self.movimientos = {}
+        self.movimientos_por_producto = {}
+        self.ventas = {}
+        self.ventas_por_estado = {'PENDIENTE': set(), 'COMPLETADA': set(), 'CANCELADA': set()}
+        self.cache_json = {}
+        self.generar(n_usuarios, n_productos, n_movimientos, n_ventas)
+
+    # ---------- Generación ----------
+
+    def generar(self, n_usuarios, n_productos, n_movimientos, n_ventas):
+        rng = self.rng
+        ahora = datetime.now()
+        for i in range(1, n_usuarios + 1):
+            rol = 'ADMIN' if i == 1 else ROLES[i % len(ROLES)]
+            email = 'admin@extingrafic.cl' if i == 1 else f'usuario{i}@extingrafic.cl'
+            usuario = {
+                'id': i, 'email': email, 'nombre': f'Usuario{i}', 'apellido': 'Demo', 'rol': rol,
+                'activo': True, 'fechaCreacion': fecha_iso(ahora - timedelta(days=rng.randint(30, 900))),
+                'intentosFallidos': 0, 'bloqueadoHasta': None,
+            }
+            self.usuarios[i] = usuario
+            self.usuarios_por_email[email] = usuario
+
+        for i in range(1, n_productos + 1):
+            categoria = rng.choice(CATEGORIAS)
+            precio_compra = rng.randint(2, 400) * 500
+            creado = ahora - timedelta(days=rng.randint(1, 720))
+            self.productos[i] = {
+                'id': i, 'nombre': f'{categoria[:-1] if categoria.endswith("s") else categoria} modelo {i}',
+                'codigo': f'PRD-{i:06d}', 'descripcion': None,
+                'precio': int(precio_compra * rng.uniform(1.2, 1.8)), 'precioCompra': precio_compra,
+                'cantidad': 0, 'categoria': categoria,
+                'estado': 'ACTIVO' if rng.random() > 0.05 else 'INACTIVO',
+                'proveedorId': rng.randint(1, 20), 'stockMinimo': rng.randint(0, 10),
+                'fechaCreacion': fecha_iso(creado), 'fechaActualizacion': fecha_iso(creado),
+            }
+            self.movimientos_por_producto[i] = []
+
+        for _ in range(n_movimientos):
+            producto_id = rng.randint(1, n_productos)
+            stock = self.productos[producto_id]['cantidad']
+            if stock <= 0 or rng.random() < 0.45:
+                tipo, cantidad = 'ENTRADA', rng.randint(5, 60)
+            elif rng.random() < 0.9:
+                tipo, cantidad = 'SALIDA', rng.randint(1, max(1, min(stock, 20)))
+            else:
+                tipo, cantidad = 'AJUSTE', rng.randint(-3, 3) or 1
+            fecha = ahora - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+            self.registrar_movimiento(producto_id, tipo, cantidad, fecha, usuario_id=rng.randint(1, n_usuarios))
+
+        for _ in range(n_ventas):
+            items = []
+            for producto_id in rng.sample(range(1, n_productos + 1), k=min(n_productos, rng.randint(1, 4))):
+                items.append({'id': producto_id, 'cantidad': rng.randint(1, 3)})
+            fecha = ahora - timedelta(minutes=rng.randint(0, 60 * 24 * 60))
+            estado = rng.choices(['COMPLETADA', 'PENDIENTE', 'CANCELADA'], weights=[80, 15, 5])[0]
+            self.crear_venta(rng.choice(CLIENTES), items, rng.choice(['EFECTIVO', 'TARJETA', 'TRANSFERENCIA']),
+                             vendedor_id=rng.randint(1, n_usuarios), fecha=fecha, estado=estado,
+                             mover_stock=False)
+
+    # ---------- Escrituras ----------
+
+    def registrar_movimiento(self, producto_id, tipo, cantidad, fecha=None, usuario_id=None,
+                             motivo=None, documento=None, requiere_aprobacion=False):
+        with self.lock:
+            producto = self.productos[producto_id]
+            movimiento_id = len(self.movimientos) + 1
+            movimiento = {
+                'id': movimiento_id, 'productoId': producto_id, 'tipo': tipo, 'cantidad': cantidad,
+                'motivo': motivo, 'documento': documento, 'proveedorId': None, 'usuarioId': usuario_id,
+                'observaciones': None, 'fechaRegistro': fecha_iso(fecha or datetime.now()),
+                'estadoAprobacion': 'PENDIENTE' if requiere_aprobacion else 'APROBADO',
+                'requiereAprobacion': requiere_aprobacion, 'aprobadoPor': None, 'fechaAprobacion': None,
+                'idempotenciaKey': None,
+            }
+            self.movimientos[movimiento_id] = movimiento
+            self.movimientos_por_producto[producto_id].append(movimiento_id)
+            if not requiere_aprobacion:
+                self.aplicar_movimiento(producto, movimiento)
+            return movimiento
+
+    def aplicar_movimiento(self, producto, movimiento):
+        signo = -1 if movimiento['tipo'] == 'SALIDA' else 1
+        producto['cantidad'] = max(0, producto['cantidad'] + signo * movimiento['cantidad'])
+        producto['fechaActualizacion'] = movimiento['fechaRegistro']
+        self.invalidar()
+
+    def aprobar_movimiento(self, movimiento_id, aprobado, usuario_id):
+        with self.lock:
+            movimiento = self.movimientos.get(movimiento_id)
+            if movimiento is None:
+                return None
+            if movimiento['estadoAprobacion'] != 'PENDIENTE':
+                raise ValueError('El movimiento no está pendiente')
+            movimiento['estadoAprobacion'] = 'APROBADO' if aprobado else 'RECHAZADO'
+            movimiento['aprobadoPor'] = usuario_id
+            movimiento['fechaAprobacion'] = fecha_iso(datetime.now())
+            if aprobado:
+                self.aplicar_movimiento(self.productos[movimiento['productoId']], movimiento)
+            return movimiento
+
+    def crear_venta(self, cliente, items, metodo_pago, vendedor_id=None, fecha=None,
+                    estado='PENDIENTE', mover_stock=True):
+        with self.lock:
+            productos = []
+            subtotal = 0
+            for item in items:
+                producto = self.productos.get(item['id'])
+                if producto is None:
+                    raise ValueError(f"Producto {item['id']} no existe")
+                if mover_stock and producto['cantidad'] < item['cantidad']:
+                    raise ValueError(f"Stock insuficiente para {producto['nombre']}")
+                linea = producto['precio'] * item['cantidad']
+                subtotal += linea
+                productos.append({'id': producto['id'], 'nombre': producto['nombre'], 'cantidad': item['cantidad'],
+                                  'precio': producto['precio'], 'subtotal': linea, 'descuento': 0,
+                                  'iva': 0.19, 'devuelto': 0})
+            venta_id = len(self.ventas) + 1
+            impuestos = round(subtotal * 0.19)
+            venta = {
+                'id': str(venta_id), 'numero': f'V-{venta_id:08d}', 'cliente': cliente, 'clienteFormal': None,
+                'fecha': fecha_iso(fecha or datetime.now()), 'subtotal': subtotal, 'impuestos': impuestos,
+                'total': subtotal + impuestos, 'descuento': 0, 'estado': estado, 'metodoPago': metodo_pago,
+                'vendedorId': vendedor_id, 'observaciones': None, 'totalDevuelto': 0,
+                'saldo': subtotal + impuestos, 'productos': productos,
+            }
+            self.ventas[venta_id] = venta
+            self.ventas_por_estado[estado].add(venta_id)
+            if mover_stock:
+                for item in items:
+                    self.registrar_movimiento(item['id'], 'SALIDA', item['cantidad'], usuario_id=vendedor_id,
+                                              motivo='Venta', documento=venta['numero'])
+            self.invalidar()
+            return venta
+
+    def cambiar_estado_venta(self, venta_id, estado):
+        with self.lock:
+            venta = self.ventas.get(venta_id)
+            if venta is None:
+                return None
+            if estado not in self.ventas_por_estado:
+                raise ValueError('Estado inválido')
+            self.ventas_por_estado[venta['estado']].discard(venta_id)
+            self.ventas_por_estado[estado].add(venta_id)
+            venta['estado'] = estado
+            self.invalidar()
+            return venta
+
+    def invalidar(self):
+        self.cache_json.clear()
+
+    # ---------- Lecturas ----------
+
+    def json_cacheado(self, clave, construir):
+        """Bytes JSON listos para enviar; se recalculan sólo tras una escritura"""
+        datos = self.cache_json.get(clave)
+        if datos is None:
+            with self.lock:
+                datos = json.dumps(construir(), ensure_ascii=False).encode('utf-8')
+                self.cache_json[clave] = datos
+        return datos
+
+    def productos_disponibles(self):
+        activos = [p for p in self.productos.values() if p['estado'] == 'ACTIVO' and p['cantidad'] > 0]
+        return activos[:200]
+
+    def categorias(self):
+        return sorted({p['categoria'] for p in self.productos.values() if p['estado'] == 'ACTIVO'})
+
+    def listar_movimientos(self, producto_id, tipo, estado, limit, offset):
+        with self.lock:
+            if producto_id is not None:
+                ids = self.movimientos_por_producto.get(producto_id, [])
+                candidatos = (self.movimientos[i] for i in reversed(ids))
+            else:
+                candidatos = (self.movimientos[i] for i in range(len(self.movimientos), 0, -1))
+            filtrados = [m for m in candidatos
+                         if (tipo is None or m['tipo'] == tipo) and (estado is None or m['estadoAprobacion'] == estado)]
+        return {'items': filtrados[offset:offset + limit], 'total': len(filtrados), 'limit': limit,
+                'offset': offset, 'hasMore': offset + limit < len(filtrados)}
+
+    def kardex(self, producto_id):
+        with self.lock:
+            producto = self.productos.get(producto_id)
+            if producto is None:
+                return None
+            movimientos = [self.movimientos[i] for i in self.movimientos_por_producto[producto_id]]
+        aprobados = [m for m in movimientos if m['estadoAprobacion'] == 'APROBADO']
+        entradas = sum(m['cantidad'] for m in aprobados if m['tipo'] == 'ENTRADA')
+        salidas = sum(m['cantidad'] for m in aprobados if m['tipo'] == 'SALIDA')
+        ajustes = sum(m['cantidad'] for m in aprobados if m['tipo'] == 'AJUSTE')
+        return {
+            'producto': {'id': producto['id'], 'nombre': producto['nombre'], 'codigo': producto['codigo'],
+                         'categoria': producto['categoria'], 'stockActual': producto['cantidad']},
+            'movimientos': movimientos,
+            'totalEntradas': entradas, 'totalSalidas': salidas, 'totalAjustes': ajustes,
+            'pendientes': sum(1 for m in movimientos if m['estadoAprobacion'] == 'PENDIENTE'),
+            'saldoCalculado': entradas - salidas + ajustes,
+        }
+
+    def metricas(self):
+        hoy = datetime.now().date()
+        ayer = hoy - timedelta(days=1)
+        inicio_mes = hoy.replace(day=1)
+        ventas_hoy = ventas_ayer = ordenes_hoy = ordenes_ayer = ventas_mes = 0
+        with self.lock:
+            for venta_id in self.ventas_por_estado['COMPLETADA']:
+                venta = self.ventas[venta_id]
+                dia = datetime.fromisoformat(venta['fecha']).date()
+                if dia == hoy:
+                    ventas_hoy += venta['total']
+                    ordenes_hoy += 1
+                elif dia == ayer:
+                    ventas_ayer += venta['total']
+                    ordenes_ayer += 1
+                if dia >= inicio_mes:
+                    ventas_mes += venta['total']
+
+        def crecimiento(actual, anterior):
+            return round((actual - anterior) * 100 / anterior) if anterior else 0
+
+        ticket = ventas_hoy // ordenes_hoy if ordenes_hoy else 0
+        ticket_ayer = ventas_ayer // ordenes_ayer if ordenes_ayer else 0
+        return {'ventasHoy': ventas_hoy, 'ordenesHoy': ordenes_hoy, 'ticketPromedio': ticket,
+                'ventasMes': ventas_mes, 'crecimientoVentasHoy': crecimiento(ventas_hoy, ventas_ayer),
+                'crecimientoOrdenes': crecimiento(ordenes_hoy, ordenes_ayer),
+                'crecimientoTicket': crecimiento(ticket, ticket_ayer), 'crecimientoMes': 0}
+
+
+class Estadisticas:
+    """Throughput y latencia del propio mock, por ruta"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inicio = time.monotonic()
+        self.por_ruta = {}
+        self.total = 0
+        self.errores_inyectados = 0
+
+    def registrar(self, ruta, status, segundos):
+        with self.lock:
+            self.total += 1
+            datos = self.por_ruta.setdefault(ruta, {'peticiones': 0, 'errores': 0, 'ms_total': 0.0, 'ms_max': 0.0})
+            datos['peticiones'] += 1
+            datos['errores'] += status >= 500
+            ms = segundos * 1000
+            datos['ms_total'] += ms
+            datos['ms_max'] = max(datos['ms_max'], ms)
+
+    def resumen(self):
+        with self.lock:
+            transcurrido = time.monotonic() - self.inicio
+            return {
+                'segundos': round(transcurrido, 1),
+                'peticiones': self.total,
+                'peticiones_por_segundo': round(self.total / transcurrido, 1) if transcurrido else 0.0,
+                'errores_inyectados': self.errores_inyectados,
+                'rutas': {ruta: {'peticiones': d['peticiones'], 'errores': d['errores'],
+                                 'ms_promedio': round(d['ms_total'] / d['peticiones'], 2),
+                                 'ms_max': round(d['ms_max'], 2)}
+                          for ruta, d in sorted(self.por_ruta.items())},
+            }
+
+
+RUTAS = [
+    ('POST', re.compile(r'^/api/auth/login$'), 'login', False),
+    ('GET', re.compile(r'^/api/auth/me$'), 'me', True),
+    ('GET', re.compile(r'^/api/usuarios/me$'), 'me', True),
+    ('GET', re.compile(r'^/api/auth/verify$'), 'verify', True),
+    ('GET', re.compile(r'^/api/ventas/productos/disponibles$'), 'productos_disponibles', True),
+    ('GET', re.compile(r'^/api/inventario/categorias$'), 'categorias', True),
+    ('GET', re.compile(r'^/api/movimientos$'), 'listar_movimientos', True),
+    ('POST', re.compile(r'^/api/movimientos$'), 'crear_movimiento', True),
+    ('GET', re.compile(r'^/api/movimientos/kardex$'), 'kardex', True),
+    ('POST', re.compile(r'^/api/movimientos/(\d+)/aprobar$'), 'aprobar_movimiento', True),
+    ('GET', re.compile(r'^/api/ventas/metricas$'), 'metricas', True),
+    ('POST', re.compile(r'^/api/ventas$'), 'crear_venta', True),
+    ('GET', re.compile(r'^/api/ventas/(\d+)$'), 'obtener_venta', True),
+    ('PATCH', re.compile(r'^/api/ventas/(\d+)/estado$'), 'estado_venta', True),
+    ('GET', re.compile(r'^/api/ventas/(\d+)/comprobante/pdf$'), 'comprobante_pdf', False),
+    ('GET', re.compile(r'^/health$'), 'health', False),
+    ('GET', re.compile(r'^/health/info$'), 'health_info', False),
+    ('GET', re.compile(r'^/mock/stats$'), 'stats', False),
+]
+
+
+class MockKtorHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Cabeceras y cuerpo salen en dos write(); con Nagle activo cada respuesta keep-alive espera el ACK retrasado (~40 ms)
+    disable_nagle_algorithm = True
+    almacen = None
+    estadisticas = None
+    config = None
+
+    def do_GET(self):
+        self.despachar()
+
+    def do_POST(self):
+        self.despachar()
+
+    def do_PATCH(self):
+        self.despachar()
+
+    def despachar(self):
+        inicio = time.monotonic()
+        url = urlparse(self.path)
+        self.query = parse_qs(url.query)
+        longitud = int(self.headers.get('Content-Length') or 0)
+        self.cuerpo = self.rfile.read(longitud) if longitud else b''
+
+        for metodo, patron, nombre, protegida in RUTAS:
+            coincidencia = patron.match(url.path)
+            if coincidencia and metodo == self.command:
+                break
+        else:
+            self.responder(404, {'error': 'Ruta no encontrada en el mock'})
+            self.estadisticas.registrar('404', 404, time.monotonic() - inicio)
+            return
+
+        self.inyectar_latencia()
+        if nombre not in ('stats', 'health') and self.config.rng.random() < self.config.tasa_error:
+            with self.estadisticas.lock:
+                self.estadisticas.errores_inyectados += 1
+            status = self.responder(500, {'error': 'Error inyectado por el mock'})
+        elif protegida and not self.autenticar():
+            status = self.responder(401, {'error': 'Token inválido o expirado'})
+        else:
+            try:
+                status = getattr(self, 'ruta_' + nombre)(*coincidencia.groups())
+            except (ValueError, KeyError, TypeError) as e:
+                status = self.responder(400, {'error': str(e)})
+        self.estadisticas.registrar(f'{self.command} {nombre}', status, time.monotonic() - inicio)
+
+    def inyectar_latencia(self):
+        if self.config.latencia_ms or self.config.jitter_ms:
+            ms = self.config.latencia_ms + self.config.rng.uniform(0, self.config.jitter_ms)
+            time.sleep(ms / 1000)
+
+    def autenticar(self):
+        valor = self.headers.get('Authorization', '')
+        self.claims = leer_token(valor[7:]) if valor.lower().startswith('bearer ') else None
+        return self.claims is not None
+
+    def json_cuerpo(self):
+        return json.loads(self.cuerpo or b'{}')
+
+    def responder(self, status, datos, tipo='application/json'):
+        cuerpo = datos if isinstance(datos, bytes) else json.dumps(datos, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+        return status
+
+    # ---------- Rutas ----------
+
+    def ruta_login(self):
+        datos = self.json_cuerpo()
+        usuario = self.almacen.usuarios_por_email.get(datos.get('email'))
+        if usuario is None or datos.get('password') != PASSWORD_DEMO:
+            return self.responder(401, {'success': False, 'message': 'Credenciales inválidas'})
+        return self.responder(200, {'success': True, 'message': 'Login exitoso',
+                                    'usuario': usuario, 'token': generar_token(usuario)})
+
+    def ruta_me(self):
+        usuario = self.almacen.usuarios.get(self.claims.get('userId'))
+        if usuario is None:
+            return self.responder(404, {'error': 'Usuario no encontrado'})
+        return self.responder(200, usuario)
+
+    def ruta_verify(self):
+        return self.responder(200, {'message': 'Token válido'})
+
+    def ruta_productos_disponibles(self):
+        return self.responder(200, self.almacen.json_cacheado('disponibles', self.almacen.productos_disponibles))
+
+    def ruta_categorias(self):
+        return self.responder(200, self.almacen.json_cacheado('categorias', self.almacen.categorias))
+
+    def ruta_listar_movimientos(self):
+        def param(nombre):
+            return self.query.get(nombre, [None])[0]
+        producto_id = int(param('productoId')) if param('productoId') else None
+        limit = min(200, max(1, int(param('limit') or 50)))
+        offset = max(0, int(param('offset') or 0))
+        tipo = param('tipo').upper() if param('tipo') else None
+        estado = param('estado').upper() if param('estado') else None
+        return self.responder(200, self.almacen.listar_movimientos(producto_id, tipo, estado, limit, offset))
+
+    def ruta_crear_movimiento(self):
+        datos = self.json_cuerpo()
+        if datos.get('tipo') not in ('ENTRADA', 'SALIDA', 'AJUSTE') or int(datos.get('productoId', 0)) not in self.almacen.productos:
+            return self.responder(400, {'error': 'Movimiento inválido'})
+        movimiento = self.almacen.registrar_movimiento(
+            int(datos['productoId']), datos['tipo'], int(datos['cantidad']),
+            usuario_id=datos.get('usuarioId') or self.claims.get('userId'), motivo=datos.get('motivo'),
+            documento=datos.get('documento'), requiere_aprobacion=bool(datos.get('requiereAprobacion')))
+        return self.responder(201, movimiento)
+
+    def ruta_aprobar_movimiento(self, movimiento_id):
+        datos = self.json_cuerpo()
+        movimiento = self.almacen.aprobar_movimiento(int(movimiento_id), datos.get('aprobado', True),
+                                                     self.claims.get('userId'))
+        if movimiento is None:
+            return self.responder(404, {'error': 'Movimiento no encontrado'})
+        return self.responder(200, movimiento)
+
+    def ruta_kardex(self):
+        producto_id = self.query.get('productoId', [None])[0]
+        if not producto_id:
+            return self.responder(400, {'error': 'productoId es requerido'})
+        kardex = self.almacen.kardex(int(producto_id))
+        if kardex is None:
+            return self.responder(400, {'error': 'Producto no encontrado'})
+        return self.responder(200, kardex)
+
+    def ruta_metricas(self):
+        return self.responder(200, self.almacen.json_cacheado('metricas', self.almacen.metricas))
+
+    def ruta_crear_venta(self):
+        datos = self.json_cuerpo()
+        venta = self.almacen.crear_venta(datos['cliente'], datos['productos'], datos.get('metodoPago', 'EFECTIVO'),
+                                         vendedor_id=datos.get('vendedorId') or self.claims.get('userId'))
+        return self.responder(201, venta)
+
+    def ruta_obtener_venta(self, venta_id):
+        venta = self.almacen.ventas.get(int(venta_id))
+        if venta is None:
+            return self.responder(404, {'error': 'Venta no encontrada'})
+        return self.responder(200, venta)
+
+    def ruta_estado_venta(self, venta_id):
+        venta = self.almacen.cambiar_estado_venta(int(venta_id), self.json_cuerpo().get('estado'))
+        if venta is None:
+            return self.responder(404, {'error': 'Venta no encontrada'})
+        return self.responder(200, venta)
+
+    def ruta_comprobante_pdf(self, venta_id):
+        # Igual que Ktor, las descargas aceptan el token en la query
+        token = self.query.get('token', [None])[0]
+        if not (token and leer_token(token)) and not self.autenticar():
+            return self.responder(401, {'error': 'Token inválido o expirado'})
+        venta = self.almacen.ventas.get(int(venta_id))
+        if venta is None:
+            return self.responder(404, {'error': 'Venta no encontrada'})
+        texto = f"Comprobante {venta['numero']} - {venta['cliente']} - Total {venta['total']}"
+        pdf = b'%PDF-1.4\n% comprobante simulado\n' + texto.encode('utf-8') + b'\n%%EOF\n'
+        return self.responder(200, pdf, tipo='application/pdf')
+
+    def ruta_health(self):
+        return self.responder(200, b'OK', tipo='text/plain')
+
+    def ruta_health_info(self):
+        return self.responder(200, {'status': 'OK', 'version': 'mock', 'environment': 'mock',
+                                    'db': 'UP', 'timestamp': int(time.time() * 1000)})
+
+    def ruta_stats(self):
+        return self.responder(200, self.estadisticas.resumen())
+
+    def log_message(self, format, *args):
+        pass  # El mock puede recibir miles de peticiones por segundo; el resumen periódico basta
+
+
+class ServidorMock(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+def reportar_throughput(estadisticas, intervalo):
+    anterior = 0
+    while True:
+        time.sleep(intervalo)
+        total = estadisticas.total
+        print(f"📈 {(total - anterior) / intervalo:.0f} req/s (total {total}, "
+              f"errores inyectados {estadisticas.errores_inyectados})")
+        anterior = total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock en memoria de la API Ktor para pruebas de carga')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--puerto', type=int, default=8080)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--usuarios', type=int, default=20)
+    parser.add_argument('--productos', type=int, default=1000)
+    parser.add_argument('--movimientos', type=int, default=20000)
+    parser.add_argument('--ventas', type=int, default=3000)
+    parser.add_argument('--latencia-ms', type=float, default=0.0, help='latencia fija añadida a cada respuesta')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='latencia aleatoria extra (0..jitter)')
+    parser.add_argument('--tasa-error', type=float, default=0.0, help='fracción de respuestas 500 inyectadas')
+    parser.add_argument('--reporte-s', type=float, default=10.0, help='intervalo del resumen de throughput')
+    config = parser.parse_args()
+    config.rng = random.Random(config.semilla)
+
+    print("🧪 MOCK DE LA API KTOR")
+    print("=" * 50)
+    inicio = time.monotonic()
+    almacen = Almacen(config.semilla, config.usuarios, config.productos, config.movimientos, config.ventas)
+    print(f"📦 {len(almacen.productos)} productos, {len(almacen.movimientos)} movimientos, "
+          f"{len(almacen.ventas)} ventas generados en {time.monotonic() - inicio:.1f} s")
+    print(f"🔑 Login: admin@extingrafic.cl / {PASSWORD_DEMO} (o usuarioN@extingrafic.cl)")
+    print(f"⏱️ Latencia: {config.latencia_ms} ms + jitter {config.jitter_ms} ms | errores: {config.tasa_error:.1%}")
+
+    MockKtorHandler.almacen = almacen
+    MockKtorHandler.estadisticas = Estadisticas()
+    MockKtorHandler.config = config
+    threading.Thread(target=reportar_throughput, args=(MockKtorHandler.estadisticas, config.reporte_s),
+                     daemon=True).start()
+
+    with ServidorMock((config.host, config.puerto), MockKtorHandler) as httpd:
+        print(f"✅ Escuchando en http://{config.host}:{config.puerto} (estadísticas en /mock/stats)")
+        print("🔥 Presiona Ctrl+C para detener")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\n🛑 Mock detenido")
+            print(json.dumps(MockKtorHandler.estadisticas.resumen(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga por escenarios para la API Ktor (usuarios virtuales con login, token y tiempos de espera)
+Ejecuta los flujos de la app (login → /me → crear venta → cambiar estado → comprobante) y reporta
+percentiles de latencia por paso y throughput (sin dependencias externas)
+
+Uso:
+    python prueba-carga.py --mock --usuarios 50 --duracion 60            # contra mock-api-ktor.py local
+    python prueba-carga.py --url http://localhost:8080 --email yo@empresa.cl --password ... --usuarios 20
+    python prueba-carga.py --url http://localhost:8090 --email ... --password ... --mezcla vendedor=3,bodega=1
+    python prueba-carga.py --escenarios mis-escenarios.json --json resultado.json
+
+Contra un Ktor real --email y --password son obligatorios (las credenciales de demo solo existen en el mock)
+
+Formato de --escenarios: {"nombre": [{"paso": "...", "metodo": "GET", "ruta": "/api/...{variable}",
+"cuerpo": {...}, "extraer": {"variable": "campo.subcampo" | "*.id"}, "esperado": [200]}, ...]}
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+from herramientas_comunes import percentil, puerto_libre
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Pasos de login compartidos por todos los escenarios; el token se guarda en el contexto del usuario virtual
+LOGIN = [
+    {'paso': 'login', 'metodo': 'POST', 'ruta': '/api/auth/login', 'publica': True,
+     'cuerpo': {'email': '{email}', 'password': '{password}'}, 'extraer': {'token': 'token', 'usuario_id': 'usuario.id'}},
+    {'paso': 'me', 'metodo': 'GET', 'ruta': '/api/auth/me'},
+]
+
+ESCENARIOS = {
+    'vendedor': [
+        {'paso': 'productos_disponibles', 'metodo': 'GET', 'ruta': '/api/ventas/productos/disponibles',
+         'extraer': {'producto_id': '*.id'}},
+        {'paso': 'crear_venta', 'metodo': 'POST', 'ruta': '/api/ventas', 'esperado': [200, 201],
+         'cuerpo': {'cliente': 'Cliente carga {usuario_virtual}', 'metodoPago': 'EFECTIVO',
+                    'productos': [{'id': '{producto_id}', 'cantidad': 1}]},
+         'extraer': {'venta_id': 'id'}},
+        {'paso': 'obtener_venta', 'metodo': 'GET', 'ruta': '/api/ventas/{venta_id}'},
+        {'paso': 'completar_venta', 'metodo': 'PATCH', 'ruta': '/api/ventas/{venta_id}/estado',
+         'cuerpo': {'estado': 'COMPLETADA'}},
+        {'paso': 'comprobante_pdf', 'metodo': 'GET', 'ruta': '/api/ventas/{venta_id}/comprobante/pdf'},
+    ],
+    'bodega': [
+        {'paso': 'productos_disponibles', 'metodo': 'GET', 'ruta': '/api/ventas/productos/disponibles',
+         'extraer': {'producto_id': '*.id'}},
+        {'paso': 'crear_movimiento', 'metodo': 'POST', 'ruta': '/api/movimientos', 'esperado': [200, 201],
+         'cuerpo': {'productoId': '{producto_id}', 'tipo': 'ENTRADA', 'cantidad': 5, 'motivo': 'Prueba de carga',
+                    'requiereAprobacion': True},
+         'extraer': {'movimiento_id': 'id'}},
+        {'paso': 'aprobar_movimiento', 'metodo': 'POST', 'ruta': '/api/movimientos/{movimiento_id}/aprobar',
+         'cuerpo': {'aprobado': True}},
+        {'paso': 'kardex', 'metodo': 'GET', 'ruta': '/api/movimientos/kardex?productoId={producto_id}'},
+    ],
+    'consulta': [
+        {'paso': 'metricas', 'metodo': 'GET', 'ruta': '/api/ventas/metricas'},
+        {'paso': 'categorias', 'metodo': 'GET', 'ruta': '/api/inventario/categorias'},
+        {'paso': 'movimientos', 'metodo': 'GET', 'ruta': '/api/movimientos?limit=50'},
+    ],
+}
+
+
+class PoolConexiones:
+    """Conexiones keep-alive compartidas por los usuarios virtuales (LIFO para aprovechar sockets calientes)"""
+
+    def __init__(self, url_base, maximo, timeout):
+        partes = urlparse(url_base)
+        self.https = partes.scheme == 'https'
+        self.host = partes.hostname or 'localhost'
+        self.port = partes.port or (443 if self.https else 80)
+        self.maximo = maximo
+        self.timeout = timeout
+        self.libres = []
+        self.creadas = 0
+        self.lock = threading.Lock()
+
+    def obtener(self):
+        with self.lock:
+            if self.libres:
+                return self.libres.pop()
+            self.creadas += 1
+        clase = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return clase(self.host, self.port, timeout=self.timeout)
+
+    def devolver(self, conn):
+        with self.lock:
+            if len(self.libres) < self.maximo:
+                self.libres.append(conn)
+                return
+        conn.close()
+
+
+class Metricas:
+    """Latencias por paso (en ms) y conteo de errores, compartidas entre hilos"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencias = {}
+        self.errores = {}
+        self.ejemplos_error = {}
+        self.escenarios = {}
+        self.inicio = time.monotonic()
+
+    def registrar(self, paso, ms, error=None):
+        """ms=None: el paso falló sin una petición medible (variable o extracción), solo cuenta el error"""
+        with self.lock:
+            valores = self.latencias.setdefault(paso, [])
+            if ms is not None:
+                valores.append(ms)
+            if error:
+                self.errores[paso] = self.errores.get(paso, 0) + 1
+                self.ejemplos_error.setdefault(paso, error)
+
+    def escenario_completo(self, nombre, exito):
+        with self.lock:
+            ok, fallidos = self.escenarios.get(nombre, (0, 0))
+            self.escenarios[nombre] = (ok + 1, fallidos) if exito else (ok, fallidos + 1)
+
+    def reiniciar(self):
+        """Descarta lo medido durante la rampa de subida"""
+        with self.lock:
+            self.latencias.clear()
+            self.errores.clear()
+            self.escenarios.clear()
+            self.inicio = time.monotonic()
+
+    def resumen(self):
+        with self.lock:
+            duracion = time.monotonic() - self.inicio
+            pasos = {}
+            for paso, valores in self.latencias.items():
+                ordenados = sorted(valores)
+                pasos[paso] = {
+                    'peticiones': len(ordenados),
+                    'errores': self.errores.get(paso, 0),
+                    'req_s': round(len(ordenados) / duracion, 1) if duracion else 0,
+                    'p50_ms': percentil(ordenados, 50), 'p90_ms': percentil(ordenados, 90),
+                    'p99_ms': percentil(ordenados, 99), 'max_ms': round(ordenados[-1], 1) if ordenados else None,
+                }
+            total = sum(len(v) for v in self.latencias.values())
+            return {
+                'duracion_s': round(duracion, 1),
+                'peticiones': total,
+                'req_s': round(total / duracion, 1) if duracion else 0,
+                'errores': sum(self.errores.values()),
+                'escenarios': {n: {'completos': ok, 'fallidos': f, 'por_minuto': round(ok * 60 / duracion, 1)}
+                               for n, (ok, f) in self.escenarios.items()},
+                'pasos': pasos,
+                'ejemplos_error': dict(self.ejemplos_error),
+            }
+
+
+def rellenar(valor, contexto):
+    """Sustituye {variable} en strings (recursivo); '{x}' solo conserva el tipo original de x"""
+    if isinstance(valor, str):
+        if valor.startswith('{') and valor.endswith('}') and valor[1:-1] in contexto:
+            return contexto[valor[1:-1]]
+        return valor.format_map(contexto)
+    if isinstance(valor, list):
+        return [rellenar(v, contexto) for v in valor]
+    if isinstance(valor, dict):
+        return {k: rellenar(v, contexto) for k, v in valor.items()}
+    return valor
+
+
+def extraer(datos, camino, rng):
+    """'usuario.id' navega el JSON; '*' elige un elemento al azar de una lista"""
+    for parte in camino.split('.'):
+        if parte == '*':
+            if not isinstance(datos, list) or not datos:
+                return None
+            datos = rng.choice(datos)
+        elif isinstance(datos, dict):
+            datos = datos.get(parte)
+        elif isinstance(datos, list) and parte.isdigit() and int(parte) < len(datos):
+            datos = datos[int(parte)]
+        else:
+            return None
+    return datos
+
+
+class UsuarioVirtual(threading.Thread):
+    """Repite escenarios con su propio token hasta que termina la prueba"""
+
+    def __init__(self, numero, config, pool, metricas, detener):
+        super().__init__(daemon=True)
+        self.numero = numero
+        self.config = config
+        self.pool = pool
+        self.metricas = metricas
+        self.detener = detener
+        self.rng = random.Random(config.semilla * 1000 + numero)
+        self.contexto = {'email': config.email, 'password': config.password, 'usuario_virtual': numero}
+
+    def run(self):
+        while not self.detener.is_set():
+            if 'token' not in self.contexto:
+                if not self.ejecutar('login', LOGIN):
+                    self.detener.wait(1.0)  # Sin token no tiene sentido martillar el resto del flujo
+                    continue
+            nombre = self.rng.choices(self.config.nombres, weights=self.config.pesos)[0]
+            self.ejecutar(nombre, self.config.escenarios[nombre])
+
+    def ejecutar(self, nombre, pasos):
+        for paso in pasos:
+            if self.detener.is_set():
+                return False
+            if not self.ejecutar_paso(paso):
+                self.metricas.escenario_completo(nombre, False)
+                return False
+            self.pensar()
+        self.metricas.escenario_completo(nombre, True)
+        return True
+
+    def pensar(self):
+        minimo, maximo = self.config.pensar_ms
+        if maximo > 0:
+            self.detener.wait(self.rng.uniform(minimo, maximo) / 1000)
+
+    def ejecutar_paso(self, paso):
+        try:
+            ruta = rellenar(paso['ruta'], self.contexto)
+            cuerpo = rellenar(paso.get('cuerpo'), self.contexto)
+        except KeyError as e:
+            self.metricas.registrar(paso['paso'], None, f'Variable sin valor: {e}')
+            return False
+        headers = {'Accept': 'application/json'}
+        if not paso.get('publica') and 'token' in self.contexto:
+            headers['Authorization'] = f"Bearer {self.contexto['token']}"
+        datos = None
+        if cuerpo is not None:
+            datos = json.dumps(cuerpo).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        inicio = time.perf_counter()
+        try:
+            status, respuesta = self.enviar(paso['metodo'], ruta, headers, datos)
+        except (OSError, http.client.HTTPException) as e:
+            self.metricas.registrar(paso['paso'], (time.perf_counter() - inicio) * 1000, f'{type(e).__name__}: {e}')
+            return False
+        ms = (time.perf_counter() - inicio) * 1000
+
+        if status not in paso.get('esperado', [200]):
+            self.metricas.registrar(paso['paso'], ms, f'HTTP {status}: {respuesta[:200]!r}')
+            if status == 401:
+                self.contexto.pop('token', None)  # Token vencido o revocado: volver a hacer login
+            return False
+        self.metricas.registrar(paso['paso'], ms)
+
+        if paso.get('extraer'):
+            try:
+                contenido = json.loads(respuesta)
+            except ValueError:
+                self.metricas.registrar(paso['paso'], None, 'Respuesta no es JSON')
+                return False
+            for variable, camino in paso['extraer'].items():
+                valor = extraer(contenido, camino, self.rng)
+                if valor is None:
+                    self.metricas.registrar(paso['paso'], None, f"No se encontró '{camino}' en la respuesta")
+                    return False
+                self.contexto[variable] = valor
+        return True
+
+    def enviar(self, metodo, ruta, headers, datos):
+        """Una petición sobre una conexión del pool; reintenta una vez si el keep-alive estaba cerrado"""
+        for intento in range(2):
+            conn = self.pool.obtener()
+            reutilizada = conn.sock is not None
+            try:
+                conn.request(metodo, ruta, body=datos, headers=headers)
+                respuesta = conn.getresponse()
+                cuerpo = respuesta.read()
+            except (ConnectionError, http.client.RemoteDisconnected, http.client.BadStatusLine):
+                conn.close()
+                if reutilizada and intento == 0:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if respuesta.will_close:
+                conn.close()
+            else:
+                self.pool.devolver(conn)
+            return respuesta.status, cuerpo
+
+
+def iniciar_mock(argumentos_extra):
+    """Levanta mock-api-ktor.py en un puerto libre y espera a que responda /health"""
+    puerto = puerto_libre()
+    comando = [sys.executable, os.path.join(DIRECTORIO, 'mock-api-ktor.py'), '--host', '127.0.0.1',
+               '--puerto', str(puerto), '--reporte-s', '3600'] + argumentos_extra
+    proceso = subprocess.Popen(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{puerto}'
+    for _ in range(100):
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', puerto, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return proceso, url
+        except OSError:
+            time.sleep(0.1)
+    proceso.terminate()
+    raise SystemExit('❌ El mock no respondió en 10 segundos')
+
+
+def leer_mezcla(texto, escenarios):
+    nombres, pesos = [], []
+    for parte in texto.split(','):
+        nombre, _, peso = parte.partition('=')
+        nombre = nombre.strip()
+        if nombre not in escenarios:
+            raise SystemExit(f"❌ Escenario desconocido '{nombre}'. Disponibles: {', '.join(escenarios)}")
+        nombres.append(nombre)
+        pesos.append(float(peso or 1))
+    return nombres, pesos
+
+
+def leer_pensar(texto):
+    minimo, _, maximo = texto.partition('-')
+    minimo = float(minimo)
+    return minimo, float(maximo) if maximo else minimo
+
+
+def imprimir_resumen(resumen, url, usuarios):
+    print("\n" + "=" * 78)
+    print(f"📊 {url} | {usuarios} usuarios virtuales | {resumen['duracion_s']} s medidos")
+    print(f"   {resumen['peticiones']:,} peticiones, {resumen['req_s']} req/s, {resumen['errores']:,} errores")
+    for nombre, datos in resumen['escenarios'].items():
+        print(f"   🧭 {nombre}: {datos['completos']:,} completos ({datos['por_minuto']}/min), {datos['fallidos']:,} fallidos")
+    print(f"\n   {'paso':<24}{'req':>8}{'err':>6}{'req/s':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for paso, d in resumen['pasos'].items():
+        latencias = ''.join(f"{'-' if d[k] is None else d[k]:>9}" for k in ('p50_ms', 'p90_ms', 'p99_ms', 'max_ms'))
+        print(f"   {paso:<24}{d['peticiones']:>8}{d['errores']:>6}{d['req_s']:>8}{latencias}")
+    for paso, error in resumen['ejemplos_error'].items():
+        print(f"   ⚠️ {paso}: {error}")
+    print("   (latencias en ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga por escenarios contra la API Ktor')
+    parser.add_argument('--url', default=os.environ.get('KTOR_URL', 'http://localhost:8080'),
+                        help='Ktor directo (8080/1609) o el servidor frontal (8090)')
+    parser.add_argument('--mock', action='store_true', help='levantar mock-api-ktor.py local en vez de usar --url')
+    parser.add_argument('--mock-args', default='', help="argumentos extra para el mock, ej: '--latencia-ms 50'")
+    parser.add_argument('--usuarios', type=int, default=10)
+    parser.add_argument('--duracion', type=float, default=30.0, help='segundos de medición')
+    parser.add_argument('--rampa', type=float, default=5.0, help='segundos para ir sumando usuarios (no se miden)')
+    parser.add_argument('--pensar-ms', default='200-1000', help='tiempo de espera entre pasos, fijo o rango min-max')
+    parser.add_argument('--mezcla', default='vendedor=3,bodega=1,consulta=1', help='escenarios y pesos')
+    parser.add_argument('--escenarios', help='JSON con escenarios adicionales o que reemplazan a los incluidos')
+    parser.add_argument('--email', help='obligatorio sin --mock (con --mock: admin@extingrafic.cl)')
+    parser.add_argument('--password', help='obligatorio sin --mock (con --mock: demo123)')
+    parser.add_argument('--conexiones', type=int, default=0, help='máximo de conexiones keep-alive (0 = usuarios)')
+    parser.add_argument('--timeout', type=float, default=15.0)
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--json', help='guardar el resumen en este archivo')
+    args = parser.parse_args()
+    if args.mock:
+        args.email = args.email or 'admin@extingrafic.cl'
+        args.password = args.password or 'demo123'
+    elif not (args.email and args.password):
+        parser.error(f'--email y --password son obligatorios contra {args.url} (o usa --mock)')
+
+    escenarios = dict(ESCENARIOS)
+    if args.escenarios:
+        with open(args.escenarios, encoding='utf-8') as f:
+            escenarios.update(json.load(f))
+    args.escenarios = escenarios
+    args.nombres, args.pesos = leer_mezcla(args.mezcla, escenarios)
+    args.pensar_ms = leer_pensar(args.pensar_ms)
+
+    proceso_mock = None
+    url = args.url
+    if args.mock:
+        proceso_mock, url = iniciar_mock(args.mock_args.split())
+        print(f"🧪 Mock levantado en {url}")
+
+    pool = PoolConexiones(url, args.conexiones or args.usuarios, args.timeout)
+    metricas = Metricas()
+    detener = threading.Event()
+    print(f"🚀 {args.usuarios} usuarios virtuales contra {url} | mezcla {args.mezcla} | "
+          f"espera {args.pensar_ms[0]:.0f}-{args.pensar_ms[1]:.0f} ms")
+    try:
+        for numero in range(args.usuarios):
+            UsuarioVirtual(numero, args, pool, metricas, detener).start()
+            if args.rampa > 0:
+                time.sleep(args.rampa / args.usuarios)
+        metricas.reiniciar()
+        print(f"⏱️ Rampa completa, midiendo {args.duracion:.0f} s...")
+        fin = time.monotonic() + args.duracion
+        while time.monotonic() < fin:
+            time.sleep(min(5.0, max(0.0, fin - time.monotonic())))
+            parcial = metricas.resumen()
+            print(f"   📈 {parcial['req_s']} req/s, {parcial['errores']} errores")
+    except KeyboardInterrupt:
+        print("\n🛑 Prueba interrumpida, resumen parcial:")
+    finally:
+        detener.set()
+        resumen = metricas.resumen()
+        resumen['conexiones_abiertas'] = pool.creadas
+        if proceso_mock:
+            proceso_mock.terminate()
+
+    imprimir_resumen(resumen, url, args.usuarios)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resumen, f, indent=2, ensure_ascii=False)
+        print(f"📝 Resumen guardado en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Reproduce una captura de tráfico de servidor-definitivo.py (CAPTURA_TRAFICO=captura-trafico.jsonl)
+contra cualquier destino, a velocidad real, acelerada o máxima, y compara distribuciones de latencia
+entre corridas (sin dependencias externas)
+
+Uso:
+    python reproducir-trafico.py reproducir captura-trafico.jsonl --url http://localhost:8090 --velocidad 10 --guardar corrida-a.json
+    python reproducir-trafico.py reproducir captura-trafico.jsonl* --velocidad max --login admin@extingrafic.cl:demo123
+    python reproducir-trafico.py comparar corrida-a.json corrida-b.json
+    python reproducir-trafico.py comparar captura-trafico.jsonl corrida-b.json     # contra lo medido al capturar
+"""
+import argparse
+import base64
+import heapq
+import http.client
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from herramientas_comunes import cargar_servidor, percentil
+
+MAX_MUESTRAS = 5000   # por ruta, para que la corrida guardada no crezca sin límite
+
+
+# normalizar_ruta() del servidor frontal agrupa /api/ventas/123 como /api/ventas/{id}
+normalizar_ruta = cargar_servidor().normalizar_ruta
+
+
+def leer_captura(rutas):
+    """Une la captura y sus rotaciones (.1, .2, ...) en orden de llegada"""
+    entradas = []
+    for ruta in rutas:
+        with open(ruta, encoding='utf-8') as f:
+            for linea in f:
+                linea = linea.strip()
+                if linea:
+                    try:
+                        entradas.append(json.loads(linea))
+                    except ValueError:
+                        continue  # Última línea a medio escribir si el servidor se cortó
+    entradas.sort(key=lambda e: e['t'])
+    return entradas
+
+
+def concurrencia_maxima(entradas):
+    """Peticiones simultáneas en la captura según llegada + duración medida"""
+    activas, maximo = [], 0
+    for e in entradas:
+        while activas and activas[0] <= e['t']:
+            heapq.heappop(activas)
+        heapq.heappush(activas, e['t'] + e.get('ms', 0) / 1000)
+        maximo = max(maximo, len(activas))
+    return maximo
+
+
+class Muestras:
+    """Latencias por 'METODO ruta' con reservorio acotado"""
+
+    def __init__(self, semilla=1):
+        self.lock = threading.Lock()
+        self.rutas = {}
+        self.rng = random.Random(semilla)
+
+    def agregar(self, clave, ms, status, status_original=None):
+        with self.lock:
+            r = self.rutas.setdefault(clave, {'n': 0, 'errores': 0, 'status_distinto': 0, 'status': {}, 'ms': []})
+            r['n'] += 1
+            r['status'][str(status)] = r['status'].get(str(status), 0) + 1
+            if not isinstance(status, int) or status >= 500:
+                r['errores'] += 1
+            if status_original is not None and status != status_original:
+                r['status_distinto'] += 1
+            if len(r['ms']) < MAX_MUESTRAS:
+                r['ms'].append(ms)
+            else:
+                i = self.rng.randrange(r['n'])
+                if i < MAX_MUESTRAS:
+                    r['ms'][i] = ms
+
+
+def resumir(rutas):
+    tabla = {}
+    for clave, r in sorted(rutas.items()):
+        ordenados = sorted(r['ms'])
+        tabla[clave] = {'n': r['n'], 'errores': r['errores'], 'status_distinto': r.get('status_distinto', 0),
+                        'p50': percentil(ordenados, 50), 'p90': percentil(ordenados, 90),
+                        'p99': percentil(ordenados, 99), 'max': round(ordenados[-1], 1) if ordenados else None}
+    return tabla
+
+
+class Reproductor:
+    def __init__(self, url, token, hilos, timeout):
+        partes = urlparse(url)
+        self.https = partes.scheme == 'https'
+        self.host = partes.hostname or 'localhost'
+        self.port = partes.port or (443 if self.https else 80)
+        self.token = token
+        self.timeout = timeout
+        self.local = threading.local()   # una conexión keep-alive por hilo del pool
+        self.muestras = Muestras()
+        self.retrasos = []
+        self.lock = threading.Lock()
+        self.ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='replay')
+
+    def conexion(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            clase = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = self.local.conn = clase(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def enviar(self, entrada, cuerpo, programada):
+        inicio = time.monotonic()
+        with self.lock:
+            self.retrasos.append((inicio - programada) * 1000)
+        headers = dict(entrada.get('h', {}))
+        if entrada.get('auth') and self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        if cuerpo is not None:
+            headers['Content-Length'] = str(len(cuerpo))
+        clave = f"{entrada['m']} {normalizar_ruta(urlparse(entrada['p']).path)}"
+        for intento in range(2):
+            conn = self.conexion()
+            reutilizada = conn.sock is not None
+            try:
+                conn.request(entrada['m'], entrada['p'], body=cuerpo, headers=headers)
+                respuesta = conn.getresponse()
+                respuesta.read()
+                if respuesta.will_close:
+                    conn.close()
+                status = respuesta.status
+                break
+            except (ConnectionError, http.client.RemoteDisconnected, http.client.BadStatusLine) as e:
+                conn.close()
+                if reutilizada and intento == 0:
+                    continue   # sólo un keep-alive viejo se reintenta: con conexión nueva el servidor pudo procesarla
+                status = type(e).__name__
+                break
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                status = type(e).__name__
+                break
+        self.muestras.agregar(clave, (time.monotonic() - inicio) * 1000, status, entrada.get('s'))
+
+    def reproducir(self, entradas, velocidad, incluir_escrituras):
+        """Programa cada petición en su instante relativo / velocidad; las que se solapaban vuelven a solaparse"""
+        omitidas = 0
+        t0 = entradas[0]['t']
+        inicio = time.monotonic()
+        futuros = []
+        for entrada in entradas:
+            cuerpo = None
+            if entrada.get('bl'):
+                if 'b' not in entrada or not incluir_escrituras:
+                    omitidas += 1   # Sin el cuerpo original no se puede reproducir con fidelidad
+                    continue
+                cuerpo = base64.b64decode(entrada['b'])
+            programada = inicio if velocidad is None else inicio + (entrada['t'] - t0) / velocidad
+            espera = programada - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            futuros.append(self.ejecutor.submit(self.enviar, entrada, cuerpo, programada))
+        for futuro in futuros:
+            futuro.result()
+        self.ejecutor.shutdown()
+        return time.monotonic() - inicio, omitidas
+
+
+def obtener_token(url, credenciales):
+    email, _, password = credenciales.partition(':')
+    partes = urlparse(url)
+    clase = http.client.HTTPSConnection if partes.scheme == 'https' else http.client.HTTPConnection
+    conn = clase(partes.hostname, partes.port or (443 if partes.scheme == 'https' else 80), timeout=10)
+    conn.request('POST', '/api/auth/login', body=json.dumps({'email': email, 'password': password}),
+                 headers={'Content-Type': 'application/json'})
+    respuesta = conn.getresponse()
+    datos = json.loads(respuesta.read() or b'{}')
+    conn.close()
+    if not datos.get('token'):
+        raise SystemExit(f"❌ Login falló ({respuesta.status}): {datos.get('message')}")
+    return datos['token']
+
+
+def cargar_corrida(ruta):
+    """Una corrida guardada con --guardar, o la captura misma (latencias medidas por el servidor)"""
+    if ruta.endswith('.json'):
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f)
+    muestras = Muestras()
+    entradas = leer_captura([ruta])
+    for e in entradas:
+        muestras.agregar(f"{e['m']} {normalizar_ruta(urlparse(e['p']).path)}", e.get('ms', 0.0), e.get('s'))
+    return {'origen': ruta, 'rutas': muestras.rutas}
+
+
+def ks(a, b):
+    """Distancia de Kolmogorov-Smirnov entre dos muestras (0 = misma distribución, 1 = disjuntas)"""
+    a, b = sorted(a), sorted(b)
+    i = j = 0
+    distancia = 0.0
+    while i < len(a) and j < len(b):
+        valor = min(a[i], b[j])
+        while i < len(a) and a[i] <= valor:
+            i += 1
+        while j < len(b) and b[j] <= valor:
+            j += 1
+        distancia = max(distancia, abs(i / len(a) - j / len(b)))
+    return round(distancia, 3)
+
+
+def comparar(base, nueva, minimo):
+    print(f"\n⚖️ {base.get('origen', 'base')}  →  {nueva.get('origen', 'nueva')}")
+    print(f"   {'ruta':<44}{'n':>7}{'p50':>16}{'p90':>16}{'p99':>16}{'KS':>7}")
+    tabla_a, tabla_b = resumir(base['rutas']), resumir(nueva['rutas'])
+    for clave in sorted(set(tabla_a) & set(tabla_b)):
+        a, b = tabla_a[clave], tabla_b[clave]
+        if min(a['n'], b['n']) < minimo:
+            continue
+        distancia = ks(base['rutas'][clave]['ms'], nueva['rutas'][clave]['ms'])
+        marca = '🔺' if distancia > 0.2 and b['p50'] > a['p50'] else ('🔻' if distancia > 0.2 else '  ')
+        celdas = ''.join(f"{a[p]:>7}→{b[p]:<8}" for p in ('p50', 'p90', 'p99'))
+        print(f" {marca}{clave[:44]:<44}{b['n']:>7}{celdas}{distancia:>7}")
+    solo = sorted(set(tabla_a) ^ set(tabla_b))
+    if solo:
+        print(f"   (rutas presentes en una sola corrida: {', '.join(solo[:10])}{' ...' if len(solo) > 10 else ''})")
+    print("   🔺 más lenta / 🔻 más rápida con KS > 0.2 (latencias en ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reproduce capturas de tráfico y compara latencias')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    rep = sub.add_parser('reproducir')
+    rep.add_argument('capturas', nargs='+', help='captura-trafico.jsonl y sus rotaciones .1, .2 ...')
+    rep.add_argument('--url', default='http://localhost:8090')
+    rep.add_argument('--velocidad', default='1', help="1, 10, ... o 'max' (sin esperas, misma concurrencia máxima)")
+    rep.add_argument('--hilos', type=int, default=0, help='hilos de envío (0 = automático)')
+    rep.add_argument('--token', help='token Bearer para las peticiones que iban autenticadas')
+    rep.add_argument('--login', help='email:password para obtener el token en el destino')
+    rep.add_argument('--incluir-escrituras', action='store_true',
+                     help='reproducir también peticiones con cuerpo (requiere CAPTURA_CUERPOS=1 al capturar)')
+    rep.add_argument('--filtro', help='sólo rutas que empiecen con este prefijo, ej: /api/')
+    rep.add_argument('--timeout', type=float, default=30.0)
+    rep.add_argument('--guardar', help='guardar esta corrida para compararla después')
+    rep.add_argument('--comparar', help='corrida o captura contra la cual comparar al terminar')
+
+    comp = sub.add_parser('comparar')
+    comp.add_argument('base')
+    comp.add_argument('nueva')
+    comp.add_argument('--minimo', type=int, default=5, help='muestras mínimas por ruta para compararla')
+    args = parser.parse_args()
+
+    if args.comando == 'comparar':
+        comparar(cargar_corrida(args.base), cargar_corrida(args.nueva), args.minimo)
+        return
+
+    entradas = leer_captura(args.capturas)
+    if args.filtro:
+        entradas = [e for e in entradas if e['p'].startswith(args.filtro)]
+    if not entradas:
+        raise SystemExit('❌ La captura está vacía')
+    velocidad = None if args.velocidad == 'max' else float(args.velocidad)
+    pico = concurrencia_maxima(entradas)
+    # A velocidad real basta la concurrencia capturada; acelerada se solapan más peticiones
+    hilos = args.hilos or (pico if velocidad is None else min(256, max(8, int(pico * max(1.0, velocidad)) + 4)))
+    token = args.token or (obtener_token(args.url, args.login) if args.login else None)
+    duracion_original = entradas[-1]['t'] - entradas[0]['t']
+
+    print(f"🎬 {len(entradas):,} peticiones ({duracion_original:.1f} s capturados, concurrencia máxima {pico}) "
+          f"→ {args.url} a velocidad {args.velocidad} con {hilos} hilos")
+    reproductor = Reproductor(args.url, token, hilos, args.timeout)
+    duracion, omitidas = reproductor.reproducir(entradas, velocidad, args.incluir_escrituras)
+
+    tabla = resumir(reproductor.muestras.rutas)
+    enviadas = sum(r['n'] for r in tabla.values())
+    retrasos = sorted(reproductor.retrasos)
+    print(f"\n📊 {enviadas:,} enviadas en {duracion:.1f} s ({enviadas / duracion if duracion else 0:.1f} req/s), "
+          f"{omitidas:,} omitidas por llevar cuerpo (ver --incluir-escrituras)")
+    if velocidad is not None and retrasos:
+        print(f"   ⏱️ Retraso sobre el horario programado: p50 {percentil(retrasos, 50)} ms, p99 {percentil(retrasos, 99)} ms")
+    print(f"   {'ruta':<44}{'n':>7}{'err':>6}{'≠st':>6}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for clave, r in tabla.items():
+        print(f"   {clave[:44]:<44}{r['n']:>7}{r['errores']:>6}{r['status_distinto']:>6}"
+              f"{r['p50']:>9}{r['p90']:>9}{r['p99']:>9}{r['max']:>9}")
+    print("   (≠st = status distinto al capturado; latencias en ms)")
+
+    corrida = {'origen': f"{args.url} x{args.velocidad}", 'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'duracion_s': round(duracion, 2), 'omitidas': omitidas, 'rutas': reproductor.muestras.rutas}
+    if args.guardar:
+        with open(args.guardar, 'w', encoding='utf-8') as f:
+            json.dump(corrida, f)
+        print(f"📝 Corrida guardada en {args.guardar}")
+    if args.comparar:
+        comparar(cargar_corrida(args.comparar), corrida, 5)
+
+
+if __name__ == "__main__":
+    main()
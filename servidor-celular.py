@@ -6,6 +6,7 @@ Con configuración automática y diagnóstico completo
 import http.server
 import socketserver
 import json
+import os
 import socket
 import subprocess
 import platform
@@ -13,6 +14,13 @@ import time
 import threading
 from urllib.parse import urlparse
 
+class ServidorReutilizable(socketserver.TCPServer):
+    """Sin SO_REUSEADDR, reiniciar da "Puerto en uso" mientras queden conexiones en TIME_WAIT (~60 s en Linux);
+    en Windows esa opción deja a otro proceso robar el puerto y el reinicio no la necesita"""
+    allow_reuse_address = os.name != 'nt'
+    request_queue_size = 128   # el defecto de socketserver (5) descarta SYNs cuando llegan varios celulares juntos
+
+
 class TestServer(http.server.BaseHTTPRequestHandler):
     def do_GET(self):
         client_ip = self.client_address[0]
@@ -219,6 +227,8 @@ def verificar_puerto_disponible(puerto):
     """Verifica si un puerto está disponible"""
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            if ServidorReutilizable.allow_reuse_address:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)   # los TIME_WAIT no cuentan como "en uso"
             s.bind(('', puerto))
             return True
     except:
@@ -232,13 +242,9 @@ def main():
 
     # Verificar puerto
     if not verificar_puerto_disponible(PORT):
-        print(f"❌ Puerto {PORT} ya está en uso")
-        print("   Cerrando procesos que usen el puerto...")
-        try:
-            subprocess.run(f'taskkill /F /FI "WINDOWTITLE eq *8090*"', shell=True)
-            time.sleep(2)
-        except:
-            pass
+        print(f"❌ Puerto {PORT} ya está en uso por otro proceso escuchando (no son restos de un reinicio)")
+        print("   👉 Detén el otro servidor (stop-python-server.bat / stop-server.sh) y vuelve a intentar")
+        return
 
     # Verificar firewall
     if verificar_firewall():
@@ -255,7 +261,7 @@ def main():
     print("=" * 50)
 
     try:
-        with socketserver.TCPServer(("0.0.0.0", PORT), TestServer) as httpd:
+        with ServidorReutilizable(("0.0.0.0", PORT), TestServer) as httpd:
             print(f"✅ Servidor iniciado en 0.0.0.0:{PORT}")
             print("⏳ Esperando conexiones desde tu celular...")
             httpd.serve_forever()
@@ -4,81 +4,2227 @@ Servidor de diagnóstico definitivo para conectividad celular
 Incluye pruebas automáticas y configuración avanzada
 """
 import http.server
+import http.client
 import socketserver
+import base64
+import gc
+import hashlib
+import hmac
 import json
+import mmap
+import os
+import re
+import selectors
+import shutil
+import signal
 import socket
+import ssl
+import struct
 import subprocess
+import sys
 import platform
 import time
+import tracemalloc
 import threading
 import webbrowser
-from urllib.parse import urlparse
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlparse, parse_qs
+
+# ---------- Backend Ktor (upstream) ----------
+
+KTOR_URL = os.environ.get('KTOR_URL', 'http://localhost:8080')
+
+# Plazo total en segundos por prefijo de ruta (gana el prefijo más largo)
+PLAZOS_POR_RUTA = {
+    '/api/auth/': 5.0,
+    '/api/dashboard/': 8.0,
+    '/api/ventas/export/': 30.0,
+    '/api/movimientos/export/': 30.0,
+    '/api/certificados/': 20.0,
+    '/api/': 10.0,
+}
+PLAZO_POR_DEFECTO = 10.0
+
+# GETs de solo lectura que pueden servirse desde caché vieja si Ktor no responde
+RUTAS_STALE_SEGURAS = (
+    '/api/inventario',
+    '/api/ventas/productos/disponibles',
+    '/api/ventas/metricas',
+    '/api/dashboard',
+    '/api/extintores',
+)
+MAX_ENTRADAS_STALE = 256
+MAX_BREAKERS = 128   # rutas con tokens o códigos al azar no deben crear breakers sin límite
+MAX_CUERPO_API = int(os.environ.get('MAX_CUERPO_API_MB', '10')) * 1024 * 1024   # se responde 413 antes de leerlo
+
+# Headers que no se reenvían entre cliente y upstream (Server y Date ya los escribe send_response)
+HEADERS_SALTO = {
+    'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding',
+    'te', 'trailer', 'upgrade', 'host', 'content-length', 'server', 'date',
+}
+
+METODOS_IDEMPOTENTES = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+
+
+# Segmentos no numéricos que Ktor recibe como parámetro ({token}, {codigo})
+PARAMETROS_RUTA = (
+    (re.compile(r'^/api/integraciones/[^/]+'), '/api/integraciones/{token}'),
+    (re.compile(r'^/api/extintores/scan/[^/]+'), '/api/extintores/scan/{codigo}'),
+)
+
+
+def normalizar_ruta(ruta):
+    """Agrupa rutas con IDs numéricos: /api/ventas/42/estado -> /api/ventas/{id}/estado"""
+    ruta = ruta.split('?', 1)[0]
+    for patron, reemplazo in PARAMETROS_RUTA:
+        ruta = patron.sub(reemplazo, ruta)
+    return re.sub(r'/\d+(?=/|$)', '/{id}', ruta)
+
+
+class Plazo:
+    """Presupuesto de tiempo de una petición, medido con reloj monotónico"""
+
+    def __init__(self, segundos):
+        self.limite = time.monotonic() + segundos
+
+    @classmethod
+    def para_ruta(cls, ruta, header_cliente=None):
+        """Plazo configurado para la ruta, recortado si el cliente pide uno menor (X-Deadline-Ms)"""
+        segundos = PLAZO_POR_DEFECTO
+        mejor = ''
+        for prefijo, valor in PLAZOS_POR_RUTA.items():
+            if ruta.startswith(prefijo) and len(prefijo) > len(mejor):
+                mejor, segundos = prefijo, valor
+        if header_cliente:
+            try:
+                segundos = min(segundos, max(0.0, int(header_cliente) / 1000.0))
+            except ValueError:
+                pass
+        return cls(segundos)
+
+    def restante(self):
+        return max(0.0, self.limite - time.monotonic())
+
+    def vencido(self):
+        return self.restante() <= 0.0
+
+
+class UpstreamNoDisponible(Exception):
+    """Fallo rápido hacia el cliente (breaker abierto, plazo vencido o error de Ktor)"""
+
+    def __init__(self, status, motivo, reintentar_en=None):
+        super().__init__(motivo)
+        self.status = status
+        self.motivo = motivo
+        self.reintentar_en = reintentar_en
+
+
+class CircuitBreaker:
+    """Breaker por ruta: cerrado -> abierto tras N fallos seguidos -> semiabierto (una sonda)"""
+
+    def __init__(self, ruta, umbral_fallos=5, enfriamiento=15.0):
+        self.ruta = ruta
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento = enfriamiento
+        self.estado = 'cerrado'
+        self.fallos_seguidos = 0
+        self.abierto_desde = 0.0
+        self.sonda_en_curso = False
+        self.exitos = 0
+        self.fallos = 0
+        self.rechazos = 0
+        self.aperturas = 0
+        self.lock = threading.Lock()
+
+    def permitir(self):
+        """Indica si se puede llamar a Ktor; en semiabierto deja pasar una sola sonda"""
+        with self.lock:
+            if self.estado == 'abierto':
+                if time.monotonic() - self.abierto_desde < self.enfriamiento:
+                    self.rechazos += 1
+                    return False
+                self.estado = 'semiabierto'
+                self.sonda_en_curso = False
+            if self.estado == 'semiabierto':
+                if self.sonda_en_curso:
+                    self.rechazos += 1
+                    return False
+                self.sonda_en_curso = True
+            return True
+
+    def registrar_exito(self):
+        with self.lock:
+            self.exitos += 1
+            self.fallos_seguidos = 0
+            self.sonda_en_curso = False
+            self.estado = 'cerrado'
+
+    def registrar_fallo(self):
+        with self.lock:
+            self.fallos += 1
+            self.fallos_seguidos += 1
+            self.sonda_en_curso = False
+            if self.estado == 'semiabierto' or self.fallos_seguidos >= self.umbral_fallos:
+                if self.estado != 'abierto':
+                    self.aperturas += 1
+                self.estado = 'abierto'
+                self.abierto_desde = time.monotonic()
+
+    def segundos_para_reintento(self):
+        with self.lock:
+            if self.estado != 'abierto':
+                return 0
+            return max(0, int(self.enfriamiento - (time.monotonic() - self.abierto_desde)) + 1)
+
+    def resumen(self):
+        with self.lock:
+            return {
+                'estado': self.estado,
+                'fallos_seguidos': self.fallos_seguidos,
+                'exitos': self.exitos,
+                'fallos': self.fallos,
+                'rechazos': self.rechazos,
+                'aperturas': self.aperturas,
+            }
+
+
+class PoolConexiones:
+    """Conexiones keep-alive reutilizables hacia Ktor (LIFO para aprovechar sockets calientes)"""
+
+    def __init__(self, url_base, maximo=16):
+        partes = urlparse(url_base)
+        self.https = partes.scheme == 'https'
+        self.host = partes.hostname or 'localhost'
+        self.port = partes.port or (443 if self.https else 80)
+        self.maximo = maximo
+        self.libres = []
+        self.lock = threading.Lock()
+
+    def obtener(self, timeout):
+        """Devuelve (conexión, reutilizada)"""
+        with self.lock:
+            conn = self.libres.pop() if self.libres else None
+        if conn is None:
+            clase = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            return clase(self.host, self.port, timeout=timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def devolver(self, conn):
+        with self.lock:
+            if len(self.libres) < self.maximo:
+                self.libres.append(conn)
+                return
+        conn.close()
+
+    def vaciar(self):
+        """Cierra las conexiones ociosas (p. ej. salían por una dirección que ya no existe)"""
+        with self.lock:
+            libres, self.libres = self.libres, []
+        for conn in libres:
+            conn.close()
+        return len(libres)
+
+
+class RespuestaUpstream:
+    __slots__ = ('status', 'headers', 'cuerpo', 'origen')
+
+    def __init__(self, status, headers, cuerpo, origen='ktor'):
+        self.status = status
+        self.headers = headers
+        self.cuerpo = cuerpo
+        self.origen = origen
+
+
+class ClienteKtor:
+    """Llamadas a Ktor con plazo por ruta, circuit breaker por ruta y caché stale de respaldo"""
+
+    def __init__(self, url_base):
+        self.url_base = url_base
+        self.pool = PoolConexiones(url_base)
+        self.breakers = {}
+        self.stale = OrderedDict()
+        self.lock = threading.Lock()
+        self.contadores = {
+            'peticiones': 0,
+            'rechazos_breaker': 0,
+            'plazos_vencidos': 0,
+            'errores_upstream': 0,
+            'stale_servidos': 0,
+        }
+
+    def contar(self, clave):
+        with self.lock:
+            self.contadores[clave] += 1
+
+    def breaker(self, ruta_normalizada):
+        with self.lock:
+            breaker = self.breakers.get(ruta_normalizada)
+            if breaker is None:
+                clave = ruta_normalizada if len(self.breakers) < MAX_BREAKERS else '/api/(otras)'
+                breaker = self.breakers.get(clave)
+                if breaker is None:
+                    breaker = self.breakers[clave] = CircuitBreaker(clave)
+            return breaker
+
+    def enviar(self, metodo, ruta, headers, cuerpo, plazo):
+        """Reenvía la petición a Ktor; lanza UpstreamNoDisponible si hay que fallar rápido"""
+        self.contar('peticiones')
+        ruta_norm = normalizar_ruta(ruta)
+        breaker = self.breaker(ruta_norm)
+        clave_stale = self.clave_stale(metodo, ruta, headers)
+
+        if plazo.vencido():
+            self.contar('plazos_vencidos')
+            return self.respaldo_stale(clave_stale, UpstreamNoDisponible(504, 'Plazo agotado antes de llamar a Ktor'))
+        if not breaker.permitir():
+            self.contar('rechazos_breaker')
+            return self.respaldo_stale(clave_stale, UpstreamNoDisponible(
+                503, f'Circuito abierto para {ruta_norm}', breaker.segundos_para_reintento()))
+
+        try:
+            respuesta = self.llamar(metodo, ruta, headers, cuerpo, plazo)
+        except socket.timeout:
+            self.contar('plazos_vencidos')
+            breaker.registrar_fallo()
+            return self.respaldo_stale(clave_stale, UpstreamNoDisponible(504, 'Ktor no respondió dentro del plazo'))
+        except (OSError, http.client.HTTPException) as e:
+            self.contar('errores_upstream')
+            breaker.registrar_fallo()
+            return self.respaldo_stale(clave_stale, UpstreamNoDisponible(502, f'Ktor no disponible: {e}'))
+        except Exception as e:
+            # p. ej. ValueError de http.client por un header inválido: sin esto una sonda semiabierta
+            # quedaría tomada para siempre y la ruta respondería 503 hasta reiniciar
+            self.contar('errores_upstream')
+            breaker.registrar_fallo()
+            raise UpstreamNoDisponible(502, f'No pude reenviar la petición a Ktor: {e}') from e
+
+        if respuesta.status >= 500:
+            breaker.registrar_fallo()
+            self.contar('errores_upstream')
+            return self.buscar_stale(clave_stale) or respuesta
+        else:
+            breaker.registrar_exito()
+        if clave_stale and respuesta.status == 200:
+            self.guardar_stale(clave_stale, respuesta)
+        return respuesta
+
+    def llamar(self, metodo, ruta, headers, cuerpo, plazo):
+        headers = dict(headers)
+        headers['X-Deadline-Ms'] = str(int(plazo.restante() * 1000))
+        conn, reutilizada = self.pool.obtener(plazo.restante())
+        try:
+            conn.request(metodo, ruta, body=cuerpo, headers=headers)
+            resp = conn.getresponse()
+        except (ConnectionError, http.client.RemoteDisconnected, http.client.CannotSendRequest):
+            conn.close()
+            # Un socket keep-alive viejo no es un fallo de Ktor: un reintento con conexión nueva
+            if not reutilizada or metodo not in METODOS_IDEMPOTENTES or plazo.vencido():
+                raise
+            conn, _ = self.pool.obtener(plazo.restante())
+            conn.request(metodo, ruta, body=cuerpo, headers=headers)
+            resp = conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+        try:
+            datos = resp.read()
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self.pool.devolver(conn)
+        return RespuestaUpstream(resp.status, resp.getheaders(), datos)
+
+    def clave_stale(self, metodo, ruta, headers):
+        if metodo != 'GET' or not ruta.startswith(RUTAS_STALE_SEGURAS):
+            return None
+        # La caché se separa por token: cada usuario sólo ve sus propios datos viejos. Sin token no se guarda
+        # ni se sirve nada (la clave vacía la compartirían todos los anónimos); el nombre del header no distingue
+        # mayúsculas, así que 'authorization:' cuenta igual que 'Authorization:'
+        autorizacion = next((v for k, v in headers.items() if k.lower() == 'authorization'), '')
+        if len(autorizacion.split()) < 2:
+            return None
+        return (ruta, autorizacion.strip())
+
+    def guardar_stale(self, clave, respuesta):
+        with self.lock:
+            self.stale[clave] = (time.time(), respuesta)
+            self.stale.move_to_end(clave)
+            while len(self.stale) > MAX_ENTRADAS_STALE:
+                self.stale.popitem(last=False)
+
+    def respaldo_stale(self, clave, error):
+        """Sirve la última respuesta buena si la ruta lo permite, si no propaga el error"""
+        respuesta = self.buscar_stale(clave)
+        if respuesta is None:
+            raise error
+        return respuesta
+
+    def buscar_stale(self, clave):
+        if clave is None:
+            return None
+        with self.lock:
+            entrada = self.stale.get(clave)
+        if entrada is None:
+            return None
+        guardado_en, original = entrada
+        self.contar('stale_servidos')
+        edad = int(time.time() - guardado_en)
+        headers = [(k, v) for k, v in original.headers if k.lower() not in ('age', 'warning')]
+        headers += [('Age', str(edad)), ('Warning', '110 - "Response is Stale"'), ('X-Cache', 'STALE')]
+        return RespuestaUpstream(original.status, headers, original.cuerpo, origen='stale')
+
+    def resumen(self):
+        with self.lock:
+            breakers = dict(self.breakers)
+            contadores = dict(self.contadores)
+            entradas_stale = len(self.stale)
+        return {
+            'upstream': self.url_base,
+            'contadores': contadores,
+            'entradas_stale': entradas_stale,
+            'breakers': {ruta: b.resumen() for ruta, b in sorted(breakers.items())},
+        }
+
+
+cliente_ktor = ClienteKtor(KTOR_URL)
+
+
+# ---------- Verificación local de tokens JWT ----------
+
+# Mismos valores por defecto que server/.../Constants.kt
+JWT_SECRET = os.environ.get('JWT_SECRET', 'super-secret-key-change-me')
+JWT_ISSUER = os.environ.get('JWT_ISSUER', 'extingrafic-api')
+JWT_AUDIENCE = os.environ.get('JWT_AUDIENCE', 'extingrafic-clients')
+VERIFICAR_TOKENS = os.environ.get('VERIFICAR_TOKENS', '1') != '0'
+MAX_TOKENS_CACHE = 4096
+TTL_MAXIMO_TOKEN = 15 * 60   # nunca se confía en un token cacheado más de 15 min
+MAX_LARGO_TOKEN = 4096
+
+
+class TokenInvalido(Exception):
+    pass
+
+
+def b64url_decodificar(segmento):
+    return base64.urlsafe_b64decode(segmento + '=' * (-len(segmento) % 4))
+
+
+class CacheTokens:
+    """Verifica cada JWT HS256 una sola vez y guarda sus claims en un LRU hasta que expira"""
+
+    def __init__(self, secreto, emisor, audiencia, maximo=MAX_TOKENS_CACHE, ttl_maximo=TTL_MAXIMO_TOKEN):
+        self.secreto = secreto.encode('utf-8')
+        self.emisor = emisor
+        self.audiencia = audiencia
+        self.maximo = maximo
+        self.ttl_maximo = ttl_maximo
+        self.entradas = OrderedDict()   # token -> (claims, válido_hasta)
+        self.revocados = {}             # token -> exp (se purga al expirar)
+        self.usuarios_revocados = {}    # userId -> instante de revocación
+        self.lock = threading.Lock()
+        self.contadores = {'hits': 0, 'misses': 0, 'expulsiones': 0}
+        self.rechazos = {}
+
+    def verificar(self, token):
+        """Devuelve los claims del token o lanza TokenInvalido"""
+        ahora = time.time()
+        with self.lock:
+            entrada = self.entradas.get(token)
+            if entrada is not None:
+                claims, valido_hasta = entrada
+                if valido_hasta > ahora and not self.esta_revocado(token, claims):
+                    self.entradas.move_to_end(token)
+                    self.contadores['hits'] += 1
+                    return claims
+                del self.entradas[token]
+            self.contadores['misses'] += 1
+
+        try:
+            claims = self.validar_firma_y_claims(token, ahora)
+            with self.lock:
+                if self.esta_revocado(token, claims):
+                    raise TokenInvalido('revocado')
+                self.entradas[token] = (claims, min(claims['exp'], ahora + self.ttl_maximo))
+                while len(self.entradas) > self.maximo:
+                    self.entradas.popitem(last=False)
+                    self.contadores['expulsiones'] += 1
+            return claims
+        except TokenInvalido as e:
+            with self.lock:
+                self.rechazos[str(e)] = self.rechazos.get(str(e), 0) + 1
+            raise
+
+    def validar_firma_y_claims(self, token, ahora):
+        if len(token) > MAX_LARGO_TOKEN or not token.isascii() or token.count('.') != 2:
+            raise TokenInvalido('malformado')
+        cabecera_b64, payload_b64, firma_b64 = token.split('.')
+        try:
+            cabecera = json.loads(b64url_decodificar(cabecera_b64))
+            firma = b64url_decodificar(firma_b64)
+        except ValueError:
+            raise TokenInvalido('malformado')
+        if not isinstance(cabecera, dict) or cabecera.get('alg') != 'HS256':
+            raise TokenInvalido('algoritmo')
+        esperada = hmac.new(self.secreto, f'{cabecera_b64}.{payload_b64}'.encode('ascii'), hashlib.sha256).digest()
+        if not hmac.compare_digest(esperada, firma):
+            raise TokenInvalido('firma')
+        try:
+            claims = json.loads(b64url_decodificar(payload_b64))
+        except ValueError:
+            raise TokenInvalido('malformado')
+        if not isinstance(claims, dict) or not isinstance(claims.get('exp'), (int, float)):
+            raise TokenInvalido('malformado')
+        if claims['exp'] <= ahora:
+            raise TokenInvalido('expirado')
+        if claims.get('nbf', 0) > ahora:
+            raise TokenInvalido('aun_no_valido')
+        audiencia = claims.get('aud')
+        audiencias = audiencia if isinstance(audiencia, list) else [audiencia]
+        if claims.get('iss') != self.emisor or self.audiencia not in audiencias:
+            raise TokenInvalido('emisor_o_audiencia')
+        # Igual que el validate de Application.kt: sin rol o sin userId el token no sirve
+        if not claims.get('role') or not isinstance(claims.get('userId'), int):
+            raise TokenInvalido('claims_incompletos')
+        return claims
+
+    def esta_revocado(self, token, claims):
+        if token in self.revocados:
+            return True
+        revocado_en = self.usuarios_revocados.get(claims.get('userId'))
+        return revocado_en is not None and claims.get('iat', 0) < revocado_en
+
+    def revocar(self, token=None, user_id=None):
+        """Revoca un token concreto o todos los emitidos hasta ahora para un usuario"""
+        ahora = time.time()
+        with self.lock:
+            if token:
+                entrada = self.entradas.pop(token, None)
+                self.revocados[token] = entrada[0]['exp'] if entrada else ahora + self.ttl_maximo * 8
+            if user_id is not None:
+                # iat viene en segundos enteros: los tokens del mismo segundo de la revocación se aceptan, si no
+                # el login que el usuario hace justo después quedaría rechazado hasta que expire
+                self.usuarios_revocados[user_id] = int(ahora)
+                for clave in [t for t, (c, _) in self.entradas.items() if c.get('userId') == user_id]:
+                    del self.entradas[clave]
+            # Un token revocado que ya expiró no necesita seguir en memoria
+            for clave in [t for t, exp in self.revocados.items() if exp <= ahora]:
+                del self.revocados[clave]
+
+    def resumen(self):
+        with self.lock:
+            total = self.contadores['hits'] + self.contadores['misses']
+            return {
+                'entradas': len(self.entradas),
+                'maximo': self.maximo,
+                'ttl_maximo_s': self.ttl_maximo,
+                **self.contadores,
+                'tasa_hit': round(self.contadores['hits'] / total, 3) if total else 0.0,
+                'rechazos': dict(self.rechazos),
+                'tokens_revocados': len(self.revocados),
+                'usuarios_revocados': len(self.usuarios_revocados),
+            }
+
+
+cache_tokens = CacheTokens(JWT_SECRET, JWT_ISSUER, JWT_AUDIENCE)
+
+
+def token_bearer(headers):
+    valor = headers.get('Authorization', '')
+    if valor[:7].lower() != 'bearer ':
+        return None
+    return valor[7:].strip()
+
+
+# Rutas que Ktor deja fuera de authenticate("auth-jwt") (Application.kt): login y registro, integraciones con API key
+# y descargas con el token en la query. La app manda el token guardado también aquí, aunque esté vencido
+RUTAS_PUBLICAS_KTOR = re.compile(
+    r'^/api/(auth/(login|registro|verify)$|integraciones/|(ventas|movimientos)/export/|ventas/\d+/comprobante/)')
+
+
+def ruta_protegida(ruta):
+    return not RUTAS_PUBLICAS_KTOR.match(ruta)
+
+
+def es_local(ip):
+    return ip.startswith('127.') or ip == '::1'
+
+
+# ---------- /batch: varias llamadas a Ktor en un solo viaje ----------
+
+MAX_BATCH = 10
+MAX_CUERPO_BATCH = 1024 * 1024   # /batch no pide token: el tamaño se revisa antes de leer
+METODOS_BATCH = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE'}
+NOMBRE_HEADER = re.compile(r"^[!#$%&'*+.^_`|~0-9A-Za-z-]+$")
+HEADERS_FIJOS_BATCH = {'x-forwarded-for'}   # los pone el servidor; un elemento no los puede cambiar
+ejecutor_batch = ThreadPoolExecutor(max_workers=16, thread_name_prefix='batch')
+
+
+def validar_sub_peticion(item):
+    """Devuelve el motivo por el que un elemento del batch no se puede reenviar, o None si está bien"""
+    metodo = item.get('method', 'GET')
+    if not isinstance(metodo, str) or metodo.upper() not in METODOS_BATCH:
+        return f"method debe ser uno de {', '.join(sorted(METODOS_BATCH))}"
+    ruta = item.get('path', '')
+    if not isinstance(ruta, str) or not ruta.startswith('/api/') or any(c <= ' ' or c == '\x7f' for c in ruta):
+        return 'path debe comenzar con /api/ y no tener espacios ni caracteres de control'
+    headers = item.get('headers')
+    if headers is None:
+        return None
+    if not isinstance(headers, dict):
+        return 'headers debe ser un objeto {nombre: valor}'
+    for clave, valor in headers.items():
+        if not NOMBRE_HEADER.match(clave) or not isinstance(valor, str) or '\r' in valor or '\n' in valor:
+            return f'header inválido: {clave!r} (nombre y valor deben ser texto, sin saltos de línea)'
+    return None
+
+
+def ejecutar_sub_peticion(indice, item, headers_base, header_plazo, token_rechazado=False):
+    """Ejecuta un elemento del batch contra Ktor y devuelve su resultado con tiempos; nunca lanza: un elemento
+    que falla sólo afecta a su propia entrada"""
+    inicio = time.monotonic()
+    resultado = {'id': item.get('id', indice)}
+    try:
+        error = validar_sub_peticion(item)
+        if error is not None:
+            resultado.update({'status': 400, 'body': {'error': error}, 'ms': 0.0})
+            return resultado
+        token_propio = any(k.lower() == 'authorization' for k in item.get('headers') or {})
+        if token_rechazado and not token_propio and ruta_protegida(urlparse(item['path']).path):
+            resultado.update({'status': 401, 'body': {'error': 'Token inválido o expirado'}, 'ms': 0.0})
+            return resultado
+        enviar_sub_peticion(item, headers_base, header_plazo, resultado)
+    except Exception as e:
+        print(f"💥 Batch: el elemento {resultado['id']!r} falló: {e!r}")
+        resultado.update({'status': 500, 'body': {'error': f'Error interno procesando el elemento: {e}'}})
+    resultado['ms'] = round((time.monotonic() - inicio) * 1000, 1)
+    return resultado
+
+
+def combinar_headers(base, propios):
+    """Headers del batch más los del elemento; los nombres no distinguen mayúsculas, así que un 'authorization'
+    del elemento reemplaza al 'Authorization' del batch en vez de viajar los dos"""
+    headers = dict(base)
+    for clave, valor in propios.items():
+        minuscula = clave.lower()
+        if minuscula in HEADERS_SALTO or minuscula in HEADERS_FIJOS_BATCH:
+            continue
+        for existente in [k for k in headers if k.lower() == minuscula]:
+            del headers[existente]
+        headers[clave] = valor
+    return headers
+
+
+def enviar_sub_peticion(item, headers_base, header_plazo, resultado):
+    """Reenvía un elemento ya validado y completa 'resultado' con status, origen y body"""
+    metodo = item.get('method', 'GET').upper()
+    ruta = item['path']
+    headers = combinar_headers(headers_base, item.get('headers') or {})
+    cuerpo = item.get('body')
+    if cuerpo is not None and not isinstance(cuerpo, str):
+        cuerpo = json.dumps(cuerpo)
+        if not any(k.lower() == 'content-type' for k in headers):
+            headers['Content-Type'] = 'application/json'
+    if cuerpo is not None:
+        cuerpo = cuerpo.encode('utf-8')
+
+    plazo = Plazo.para_ruta(urlparse(ruta).path, header_plazo)
+    try:
+        respuesta = cliente_ktor.enviar(metodo, ruta, headers, cuerpo, plazo)
+        resultado['status'] = respuesta.status
+        resultado['origen'] = respuesta.origen
+        tipo = next((v for k, v in respuesta.headers if k.lower() == 'content-type'), '')
+        resultado['content_type'] = tipo
+        if 'json' in tipo:
+            try:
+                resultado['body'] = json.loads(respuesta.cuerpo)
+            except ValueError:
+                resultado['body'] = respuesta.cuerpo.decode('utf-8', 'replace')
+        elif tipo.startswith('text/') or not respuesta.cuerpo:
+            resultado['body'] = respuesta.cuerpo.decode('utf-8', 'replace')
+        else:
+            resultado['body'] = base64.b64encode(respuesta.cuerpo).decode('ascii')
+            resultado['encoding'] = 'base64'
+    except UpstreamNoDisponible as e:
+        resultado.update({'status': e.status, 'body': {'error': e.motivo}})
+
+
+# ---------- Salud completa del stack ----------
+
+PORT = int(os.environ.get('PORT', '8090'))
+PG_HOST = os.environ.get('PG_HOST', 'localhost')
+PG_PORT = int(os.environ.get('PG_PORT', '5432'))
+PLAZO_SALUD = 2.0           # segundos para todas las sondas juntas
+TTL_SALUD = 5.0             # segundos que se reutiliza el veredicto
+DISCO_MINIMO_LIBRE = 0.10   # fracción libre por debajo de la cual el disco se marca degradado
+
+
+def descubrir_interfaces():
+    """Devuelve {ip: nombre_interfaz} de las direcciones IPv4 locales (sin loopback)"""
+    interfaces = {}
+    try:
+        if platform.system().lower() == 'windows':
+            salida = subprocess.run(['ipconfig'], capture_output=True, text=True, timeout=5).stdout
+            adaptador = None
+            for linea in salida.split('\n'):
+                linea = linea.strip()
+                if 'adaptador' in linea.lower() or 'adapter' in linea.lower():
+                    adaptador = linea.rstrip(':')
+                elif 'IPv4' in linea and adaptador:
+                    ip_match = re.search(r'(\d+\.\d+\.\d+\.\d+)', linea)
+                    if ip_match:
+                        interfaces[ip_match.group(1)] = adaptador
+        else:
+            try:
+                salida = subprocess.run(['ip', '-o', '-4', 'addr', 'show'],
+                                        capture_output=True, text=True, timeout=5).stdout
+                for linea in salida.splitlines():
+                    partes = linea.split()
+                    if len(partes) >= 4 and partes[2] == 'inet':
+                        interfaces[partes[3].split('/')[0]] = partes[1]
+            except FileNotFoundError:
+                # macOS / BSD sin iproute2
+                salida = subprocess.run(['ifconfig'], capture_output=True, text=True, timeout=5).stdout
+                nombre = None
+                for linea in salida.splitlines():
+                    if linea and not linea[0].isspace():
+                        nombre = linea.split(':')[0]
+                    ip_match = re.search(r'inet (\d+\.\d+\.\d+\.\d+)', linea)
+                    if ip_match and nombre:
+                        interfaces[ip_match.group(1)] = nombre
+    except Exception as e:
+        print(f"❌ Error descubriendo interfaces: {e}")
+    return {ip: nombre for ip, nombre in interfaces.items() if not ip.startswith('127.')}
+
+
+def sonda_ktor(plazo):
+    partes = urlparse(KTOR_URL)
+    clase = http.client.HTTPSConnection if partes.scheme == 'https' else http.client.HTTPConnection
+    conn = clase(partes.hostname or 'localhost', partes.port, timeout=plazo.restante())
+    try:
+        conn.request('GET', '/health/info', headers={'X-Deadline-Ms': str(int(plazo.restante() * 1000))})
+        resp = conn.getresponse()
+        cuerpo = resp.read()
+    finally:
+        conn.close()
+    detalle = {'http_status': resp.status}
+    try:
+        info = json.loads(cuerpo)
+        detalle.update({'db': info.get('db'), 'version': info.get('version')})
+    except ValueError:
+        pass
+    ok = resp.status == 200 and detalle.get('db', 'UP') == 'UP'
+    return ('ok' if ok else 'caido'), detalle
+
+
+def sonda_tcp(host, puerto, plazo):
+    with socket.create_connection((host, puerto), timeout=plazo.restante()):
+        pass
+    return 'ok', {'destino': f'{host}:{puerto}'}
+
+
+def sonda_interfaz(ip, nombre):
+    """La dirección sigue asignada y usable (bind sólo acepta IPs locales) y el enlace no está abajo
+    No se conecta al propio puerto: serían conexiones vacías en las estadísticas y handshakes TLS fallidos"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind((ip, 0))
+    detalle = {'interfaz': nombre, 'tipo': detectar_tipo_ip(ip)}
+    try:
+        with open(f'/sys/class/net/{nombre}/operstate') as f:   # sólo Linux; en túneles VPN suele ser 'unknown'
+            detalle['enlace'] = f.read().strip()
+    except OSError:
+        pass
+    return ('caido' if detalle.get('enlace') == 'down' else 'ok'), detalle
+
+
+def sonda_disco():
+    uso = shutil.disk_usage(os.path.dirname(os.path.abspath(__file__)))
+    libre = uso.free / uso.total
+    detalle = {'libre_gb': round(uso.free / 1024 ** 3, 2), 'libre_pct': round(libre * 100, 1)}
+    return ('ok' if libre >= DISCO_MINIMO_LIBRE else 'degradado'), detalle
+
+
+def detectar_tipo_ip(ip):
+    """Tipo de red por prefijo; el único clasificador, para que la página, las estadísticas y la captura coincidan"""
+    if ip.startswith('127.'):
+        return "Localhost"
+    elif ip.startswith('192.168.'):
+        return "WiFi Local"
+    elif ip.startswith('26.'):
+        return "Radmin VPN"
+    elif ip.startswith('10.0.11.'):
+        return "OpenVPN"
+    elif ip.startswith('10.'):
+        return "Red VPN"
+    return "Red Externa"
+
+
+class SaludCompleta:
+    """Sondea Ktor, PostgreSQL, interfaces y disco en paralelo y cachea el veredicto"""
+
+    # Sondas cuyo fallo deja al stack caído; el resto sólo lo degrada
+    CRITICAS = ('ktor', 'postgresql')
+
+    def __init__(self):
+        self.ejecutor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='salud')
+        self.lock = threading.Lock()
+        self.veredicto = None
+        self.calculado_en = 0.0
+
+    def obtener(self):
+        """Veredicto cacheado; sólo un hilo recalcula cuando vence el TTL"""
+        with self.lock:
+            if self.veredicto is None or time.monotonic() - self.calculado_en > TTL_SALUD:
+                self.veredicto = self.calcular()
+                self.calculado_en = time.monotonic()
+            return self.veredicto
+
+    def calcular(self):
+        plazo = Plazo(PLAZO_SALUD)
+        inicio = time.monotonic()
+        sondas = {
+            'ktor': lambda: sonda_ktor(plazo),
+            'postgresql': lambda: sonda_tcp(PG_HOST, PG_PORT, plazo),
+            'disco': sonda_disco,
+        }
+        # ipconfig / ip addr puede tardar: también corre en el pool y dentro del mismo plazo
+        descubrimiento = self.ejecutor.submit(descubrir_interfaces)
+        futuros = {nombre: self.ejecutor.submit(self.medir, sonda) for nombre, sonda in sondas.items()}
+        wait([descubrimiento], timeout=plazo.restante())
+        if descubrimiento.done():
+            for ip, nombre in descubrimiento.result().items():
+                futuros[f'interfaz {ip}'] = self.ejecutor.submit(
+                    self.medir, lambda ip=ip, nombre=nombre: sonda_interfaz(ip, nombre))
+        wait(futuros.values(), timeout=plazo.restante())
+
+        resultados = {}
+        for nombre, futuro in futuros.items():
+            if futuro.done():
+                resultados[nombre] = futuro.result()
+            else:
+                resultados[nombre] = {'estado': 'caido', 'error': 'sin respuesta dentro del plazo'}
+        if not descubrimiento.done():
+            resultados['interfaces'] = {'estado': 'degradado', 'error': 'no se listaron las interfaces dentro del plazo'}
+
+        estados = {nombre: r['estado'] for nombre, r in resultados.items()}
+        if any(estados[nombre] != 'ok' for nombre in self.CRITICAS):
+            estado = 'caido'
+        elif any(e != 'ok' for e in estados.values()):
+            estado = 'degradado'
+        else:
+            estado = 'ok'
+        return {
+            'status': estado,
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'duracion_ms': round((time.monotonic() - inicio) * 1000, 1),
+            'ttl_s': TTL_SALUD,
+            'componentes': resultados,
+        }
+
+    @staticmethod
+    def medir(sonda):
+        inicio = time.monotonic()
+        try:
+            estado, detalle = sonda()
+            resultado = {'estado': estado, **detalle}
+        except Exception as e:
+            resultado = {'estado': 'caido', 'error': str(e) or e.__class__.__name__}
+        resultado['ms'] = round((time.monotonic() - inicio) * 1000, 1)
+        return resultado
+
+
+salud_completa = SaludCompleta()
+
+
+# ---------- Perfilador por muestreo (/debug/profile) ----------
+
+MAX_SEGUNDOS_PERFIL = 60
+rutas_en_curso = {}   # id de hilo -> "GET /api/ventas/{id}"; un set/pop por petición es todo el costo en reposo
+
+
+class PerfiladorMuestreo:
+    """Muestrea las pilas de los hilos con sys._current_frames(); sólo corre mientras alguien lo pide"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def perfilar(self, segundos, hz=100, todos=False, con_lineas=False, top=15):
+        if not self.lock.acquire(blocking=False):
+            return None  # Un perfil a la vez: dos muestreadores se medirían entre sí
+        try:
+            return self.muestrear(segundos, hz, todos, con_lineas, top)
+        finally:
+            self.lock.release()
+
+    def muestrear(self, segundos, hz, todos, con_lineas, top):
+        propio = threading.get_ident()
+        nombres = {}
+        pilas = {}
+        por_ruta = {}
+        propias = {}
+        muestras = 0
+        intervalo = 1.0 / hz
+        fin = time.monotonic() + segundos
+        siguiente = time.monotonic()
+        while time.monotonic() < fin:
+            for ident, frame in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                ruta = rutas_en_curso.get(ident)
+                if ruta is None:
+                    if not todos:
+                        continue  # Hilos ociosos (accept, pool de batch esperando) no aportan
+                    if ident not in nombres:
+                        nombres = {t.ident: t.name for t in threading.enumerate()}
+                    ruta = f'[{nombres.get(ident, ident)}]'
+                marcos = []
+                while frame is not None and len(marcos) < 64:
+                    codigo = frame.f_code
+                    etiqueta = f'{codigo.co_name} ({os.path.basename(codigo.co_filename)}'
+                    marcos.append(etiqueta + (f':{frame.f_lineno})' if con_lineas else ')'))
+                    frame = frame.f_back
+                marcos.append(ruta)
+                clave = ';'.join(reversed(marcos))
+                pilas[clave] = pilas.get(clave, 0) + 1
+                por_ruta[ruta] = por_ruta.get(ruta, 0) + 1
+                propias[marcos[0]] = propias.get(marcos[0], 0) + 1
+                muestras += 1
+            siguiente += intervalo
+            espera = siguiente - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            else:
+                siguiente = time.monotonic()  # Si nos atrasamos no intentamos recuperar ráfagas
+
+        def ranking(conteos):
+            return [{'nombre': k, 'muestras': v, 'pct': round(v * 100 / muestras, 1)}
+                    for k, v in sorted(conteos.items(), key=lambda kv: -kv[1])[:top]]
+
+        return {
+            'segundos': segundos, 'hz': hz, 'muestras': muestras,
+            'top_rutas': ranking(por_ruta),
+            'top_funciones': ranking(propias),  # tiempo propio: la función en la punta de la pila
+            'collapsed': '\n'.join(f'{pila} {n}' for pila, n in sorted(pilas.items())),
+        }
+
+
+perfilador = PerfiladorMuestreo()
+
+
+# ---------- Trazas por petición (Server-Timing + histogramas en /debug/tiempos) ----------
+
+MAX_RUTAS_TIEMPOS = 200   # escáneres con rutas al azar no deben hacer crecer los histogramas sin límite
+LIMITES_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Traza:
+    """Fases consecutivas de una petición: marcar('render') cierra la fase anterior y abre la siguiente"""
+    __slots__ = ('ruta', 'fases', 'fase', 'desde', 'inicio')
+
+    def __init__(self, ruta, inicio):
+        self.ruta = ruta
+        self.fases = {}
+        self.fase = 'parse'
+        self.desde = inicio
+        self.inicio = inicio
+
+    def marcar(self, fase):
+        ahora = time.perf_counter()
+        if self.fase is not None:
+            self.fases[self.fase] = self.fases.get(self.fase, 0.0) + ahora - self.desde
+        self.fase = fase
+        self.desde = ahora
+
+    def cerrar(self):
+        self.marcar(None)
+
+    def server_timing(self):
+        """Header con lo medido hasta ahora; la fase abierta (normalmente write) va parcial"""
+        ahora = time.perf_counter()
+        fases = dict(self.fases)
+        if self.fase is not None:
+            fases[self.fase] = fases.get(self.fase, 0.0) + ahora - self.desde
+        partes = [f'{nombre};dur={segundos * 1000:.2f}' for nombre, segundos in fases.items()]
+        partes.append(f'total;dur={(ahora - self.inicio) * 1000:.2f}')
+        return ', '.join(partes)
+
+
+class TiemposFases:
+    """Histograma por ruta y fase con cubetas fijas: registrar es O(fases) y la memoria no crece con el tráfico"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rutas = {}
+        self.desde = time.time()
+
+    def registrar(self, traza):
+        total = sum(traza.fases.values())
+        with self.lock:
+            fases = self.rutas.get(traza.ruta)
+            if fases is None:
+                clave = traza.ruta if len(self.rutas) < MAX_RUTAS_TIEMPOS else f"{traza.ruta.split(' ', 1)[0]} (otras)"
+                fases = self.rutas.setdefault(clave, {})
+            for nombre, segundos in list(traza.fases.items()) + [('total', total)]:
+                ms = segundos * 1000
+                h = fases.get(nombre)
+                if h is None:
+                    h = fases[nombre] = {'n': 0, 'suma': 0.0, 'max': 0.0, 'cubetas': [0] * (len(LIMITES_MS) + 1)}
+                h['n'] += 1
+                h['suma'] += ms
+                if ms > h['max']:
+                    h['max'] = ms
+                i = 0
+                while i < len(LIMITES_MS) and ms > LIMITES_MS[i]:
+                    i += 1
+                h['cubetas'][i] += 1
+
+    def reiniciar(self):
+        with self.lock:
+            self.rutas = {}
+            self.desde = time.time()
+
+    @staticmethod
+    def percentil(h, p):
+        """Límite superior de la cubeta donde cae el percentil (estimación conservadora)"""
+        objetivo = p / 100 * h['n']
+        acumulado = 0
+        for i, cantidad in enumerate(h['cubetas']):
+            acumulado += cantidad
+            if acumulado >= objetivo:
+                return LIMITES_MS[i] if i < len(LIMITES_MS) else round(h['max'], 2)
+        return round(h['max'], 2)
+
+    def resumen(self, prefijo=None):
+        with self.lock:
+            copia = {ruta: {f: dict(h, cubetas=list(h['cubetas'])) for f, h in fases.items()}
+                     for ruta, fases in self.rutas.items() if not prefijo or ruta.split(' ', 1)[-1].startswith(prefijo)}
+        rutas = {}
+        for ruta, fases in sorted(copia.items()):
+            rutas[ruta] = {
+                fase: {'n': h['n'], 'promedio_ms': round(h['suma'] / h['n'], 3), 'p50_ms': self.percentil(h, 50),
+                       'p90_ms': self.percentil(h, 90), 'p99_ms': self.percentil(h, 99), 'max_ms': round(h['max'], 2),
+                       'cubetas': dict(zip([f'<={l}' for l in LIMITES_MS] + ['>10000'], h['cubetas']))}
+                for fase, h in fases.items()
+            }
+        return {'desde': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.desde)), 'rutas': rutas}
+
+
+tiempos_fases = TiemposFases()
+
+
+# ---------- Memoria: RSS, GC y diferencias de tracemalloc (/debug/memoria) ----------
+
+MAX_SNAPSHOTS = 5   # cada snapshot puede pesar varios MB
+
+
+def rss_actual():
+    """Memoria residente del proceso en bytes (None si la plataforma no la expone)"""
+    try:
+        with open('/proc/self/status') as f:
+            for linea in f:
+                if linea.startswith('VmRSS:'):
+                    return int(linea.split()[1]) * 1024
+    except OSError:
+        pass
+    if platform.system() == 'Windows':
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class Contadores(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + \
+                           [(n, ctypes.c_size_t) for n in ('PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+                                                            'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage',
+                                                            'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+            contadores = Contadores()
+            contadores.cb = ctypes.sizeof(contadores)
+            proceso = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(proceso, ctypes.byref(contadores), contadores.cb):
+                return contadores.WorkingSetSize
+        except (AttributeError, OSError):
+            pass
+    return None
+
+
+class MonitorMemoria:
+    """Arranca/detiene tracemalloc y guarda snapshots para comparar qué sitios crecen entre ellos"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshots = OrderedDict()   # id -> (hora, snapshot)
+        self.siguiente_id = 1
+        self.inicio = time.time()
+
+    def estado(self):
+        rss = rss_actual()
+        datos = {
+            'uptime_s': round(time.time() - self.inicio),
+            'rss_mb': round(rss / 1024 ** 2, 1) if rss is not None else None,
+            'gc': {'umbrales': gc.get_threshold(), 'pendientes_por_generacion': gc.get_count(),
+                   'colecciones': [g['collections'] for g in gc.get_stats()],
+                   'no_recolectables': len(gc.garbage)},
+            'hilos': threading.active_count(),
+            'tracemalloc': tracemalloc.is_tracing(),
+            'snapshots': [{'id': i, 'hora': hora} for i, (hora, _) in self.snapshots.items()],
+        }
+        if tracemalloc.is_tracing():
+            actual, pico = tracemalloc.get_traced_memory()
+            datos['trazado_mb'] = round(actual / 1024 ** 2, 2)
+            datos['pico_trazado_mb'] = round(pico / 1024 ** 2, 2)
+            datos['overhead_tracemalloc_mb'] = round(tracemalloc.get_tracemalloc_memory() / 1024 ** 2, 2)
+        return datos
+
+    def iniciar(self, marcos):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(marcos)
+        return self.estado()
+
+    def detener(self):
+        tracemalloc.stop()
+        with self.lock:
+            self.snapshots.clear()
+        return self.estado()
+
+    def tomar_snapshot(self):
+        if not tracemalloc.is_tracing():
+            raise ValueError('tracemalloc no está activo (usa accion=iniciar)')
+        snapshot = self.filtrar(tracemalloc.take_snapshot())
+        with self.lock:
+            identificador = self.siguiente_id
+            self.siguiente_id += 1
+            self.snapshots[identificador] = (time.strftime('%H:%M:%S'), snapshot)
+            while len(self.snapshots) > MAX_SNAPSHOTS:
+                self.snapshots.popitem(last=False)
+        return identificador
+
+    @staticmethod
+    def filtrar(snapshot):
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        ))
+
+    @staticmethod
+    def sitio(traza, agrupar):
+        if agrupar == 'filename':
+            return traza[0].filename
+        if agrupar == 'lineno':
+            return f'{traza[0].filename}:{traza[0].lineno}'
+        return [f'{marco.filename}:{marco.lineno}' for marco in traza][-8:]  # del más antiguo al más reciente
+
+    def diferencia(self, desde=None, hasta=None, agrupar='lineno', top=15):
+        """Sitios que más crecieron de 'desde' a 'hasta' (por defecto: los dos últimos, o el último contra ahora)"""
+        if agrupar not in ('lineno', 'filename', 'traceback'):
+            raise ValueError("agrupar debe ser lineno, filename o traceback")
+        with self.lock:
+            ids = list(self.snapshots)
+        if not ids:
+            raise ValueError('No hay snapshots (usa accion=snapshot)')
+        if hasta is None:
+            hasta = self.tomar_snapshot() if len(ids) == 1 else ids[-1]
+            ids = list(self.snapshots)
+        if desde is None:
+            desde = ids[ids.index(hasta) - 1] if hasta in ids and ids.index(hasta) > 0 else ids[0]
+        with self.lock:
+            if desde not in self.snapshots or hasta not in self.snapshots:
+                raise ValueError(f'Snapshots disponibles: {list(self.snapshots)}')
+            hora_a, a = self.snapshots[desde]
+            hora_b, b = self.snapshots[hasta]
+        estadisticas = b.compare_to(a, agrupar)
+        crecimiento = sum(e.size_diff for e in estadisticas)
+        return {
+            'desde': {'id': desde, 'hora': hora_a}, 'hasta': {'id': hasta, 'hora': hora_b},
+            'crecimiento_total_kb': round(crecimiento / 1024, 1),
+            'top': [{
+                'sitio': self.sitio(e.traceback, agrupar),
+                'crecimiento_kb': round(e.size_diff / 1024, 2), 'bloques_nuevos': e.count_diff,
+                'total_kb': round(e.size / 1024, 2), 'bloques': e.count,
+            } for e in estadisticas[:top] if e.size_diff > 0],
+        }
+
+
+monitor_memoria = MonitorMemoria()
+
+
+# ---------- TLS propio (sin apache delante): reanudación de sesiones, ALPN y recarga del certificado ----------
+
+TLS_CERT = os.environ.get('TLS_CERT', '')            # PEM del certificado (cadena completa); vacío = HTTP plano
+TLS_KEY = os.environ.get('TLS_KEY', '')              # PEM de la clave privada (por defecto, el mismo archivo del certificado)
+TLS_RECARGA_S = float(os.environ.get('TLS_RECARGA_S', '30'))
+PLAZO_HANDSHAKE = 10.0
+
+
+class ContextoTLS:
+    """SSLContext intercambiable en caliente; cuenta handshakes completos vs. sesiones reanudadas"""
+
+    def __init__(self, certificado, clave=None, recarga_s=TLS_RECARGA_S):
+        self.certificado = certificado
+        self.clave = clave or certificado
+        self.recarga_s = recarga_s
+        self.lock = threading.Lock()
+        self.contexto = self.crear()
+        self.firma = self.firma_archivos()
+        self.cargado = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.recargas = 0
+        self.errores_recarga = 0
+        self.handshakes = 0
+        self.reanudadas = 0
+        self.fallidos = 0
+        self.ms_completos = 0.0
+        self.ms_reanudados = 0.0
+        self.versiones = {}
+        self.alpn = {}
+
+    def crear(self):
+        contexto = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        contexto.minimum_version = ssl.TLSVersion.TLSv1_2
+        contexto.load_cert_chain(self.certificado, self.clave)
+        contexto.set_alpn_protocols(['http/1.1'])
+        contexto.options |= ssl.OP_NO_COMPRESSION
+        # Caché de sesiones del servidor (TLS 1.2) y tickets (TLS 1.2 y 1.3) vienen activos en OpenSSL;
+        # dos tickets por conexión permiten que la app abra dos conexiones paralelas reanudando ambas
+        contexto.num_tickets = 2
+        return contexto
+
+    def firma_archivos(self):
+        return tuple(os.stat(ruta).st_mtime_ns for ruta in {self.certificado, self.clave})
+
+    def envolver(self, conexion):
+        """Se llama en el hilo que acepta: sin E/S, el handshake se hace después en el hilo de la conexión"""
+        return self.contexto.wrap_socket(conexion, server_side=True, do_handshake_on_connect=False)
+
+    def negociar(self, conexion, direccion):
+        inicio = time.perf_counter()
+        try:
+            conexion.settimeout(PLAZO_HANDSHAKE)
+            conexion.do_handshake()
+            conexion.settimeout(None)
+        except (ssl.SSLError, OSError) as e:
+            with self.lock:
+                self.fallidos += 1
+            motivo = getattr(e, 'reason', None) or type(e).__name__
+            print(f"🔐 Handshake TLS fallido con {direccion[0]}: {motivo}")
+            return False
+        ms = (time.perf_counter() - inicio) * 1000
+        version = conexion.version()
+        protocolo = conexion.selected_alpn_protocol() or 'sin ALPN'
+        with self.lock:
+            self.handshakes += 1
+            if conexion.session_reused:
+                self.reanudadas += 1
+                self.ms_reanudados += ms
+            else:
+                self.ms_completos += ms
+            self.versiones[version] = self.versiones.get(version, 0) + 1
+            self.alpn[protocolo] = self.alpn.get(protocolo, 0) + 1
+        return True
+
+    def recargar(self, forzar=False):
+        """Si el certificado cambió en disco (renovación), las conexiones nuevas usan el nuevo; las abiertas siguen"""
+        try:
+            firma = self.firma_archivos()
+        except OSError:
+            return False
+        if firma == self.firma and not forzar:
+            return False
+        try:
+            nuevo = self.crear()
+        except (ssl.SSLError, OSError) as e:
+            self.errores_recarga += 1
+            print(f"⚠️ Certificado nuevo inválido, sigo con el anterior: {e}")
+            return False
+        with self.lock:
+            self.contexto = nuevo
+            self.firma = firma
+            self.cargado = time.strftime('%Y-%m-%d %H:%M:%S')
+            self.recargas += 1
+        print(f"🔐 Certificado TLS recargado desde {self.certificado}")
+        return True
+
+    def vigilar(self):
+        """Hilo de recarga; se inicia dentro del proceso que atiende (los hilos no sobreviven a fork())"""
+        def bucle():
+            while True:
+                time.sleep(self.recarga_s)
+                self.recargar()
+        threading.Thread(target=bucle, daemon=True, name='tls-recarga').start()
+
+    def resumen(self):
+        with self.lock:
+            completos = self.handshakes - self.reanudadas
+            return {
+                'certificado': self.certificado, 'cargado': self.cargado, 'recargas': self.recargas,
+                'errores_recarga': self.errores_recarga,
+                'handshakes': self.handshakes, 'reanudados': self.reanudadas, 'fallidos': self.fallidos,
+                'pct_reanudados': round(self.reanudadas * 100 / self.handshakes, 1) if self.handshakes else None,
+                'ms_promedio_completo': round(self.ms_completos / completos, 2) if completos else None,
+                'ms_promedio_reanudado': round(self.ms_reanudados / self.reanudadas, 2) if self.reanudadas else None,
+                'versiones': dict(self.versiones), 'alpn': dict(self.alpn),
+                'openssl': self.contexto.session_stats(),
+                'pid': os.getpid(),
+            }
+
+
+contexto_tls = None   # se crea en main() si TLS_CERT está definido
+
+
+def iniciar_tls_proceso():
+    """Recarga periódica y por SIGHUP del certificado en el proceso que atiende conexiones"""
+    if contexto_tls is None:
+        return
+    contexto_tls.vigilar()
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda *_: contexto_tls.recargar(forzar=True))
+
+
+# ---------- Parser HTTP/1.1 propio (reemplaza email.parser de http.server) ----------
+
+PARSER_RAPIDO = os.environ.get('PARSER_RAPIDO', '1') != '0'   # 0 = volver al parser de la biblioteca estándar
+MAX_LINEA_PETICION = 8192
+MAX_BYTES_CABECERAS = 16384
+MAX_CABECERAS = 100
+FIN_CABECERAS = re.compile(rb'\n\r?\n')   # primera línea vacía, con \r\n o con \n solo (igual que el camino lento)
+buffers_cabeceras = threading.local()
+
+
+class ErrorPeticion(Exception):
+    def __init__(self, status, motivo):
+        super().__init__(motivo)
+        self.status = status
+        self.motivo = motivo
+
+
+class Cabeceras:
+    """Lo que el resto del servidor usa de email.message.Message: get/[]/in/items, sin distinguir mayúsculas"""
+    __slots__ = ('pares', 'indice')
+
+    def __init__(self, pares):
+        self.pares = pares
+        self.indice = {}
+        for nombre, valor in pares:
+            self.indice.setdefault(nombre.lower(), valor)   # como Message.get: gana la primera aparición
+
+    def get(self, nombre, defecto=None):
+        return self.indice.get(nombre.lower(), defecto)
+
+    def __getitem__(self, nombre):
+        return self.indice.get(nombre.lower())
+
+    def __contains__(self, nombre):
+        return nombre.lower() in self.indice
+
+    def get_all(self, nombre, defecto=None):
+        nombre = nombre.lower()
+        valores = [v for n, v in self.pares if n.lower() == nombre]
+        return valores or defecto
+
+    def items(self):
+        return list(self.pares)
+
+    def keys(self):
+        return [n for n, _ in self.pares]
+
+    def values(self):
+        return [v for _, v in self.pares]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.pares)
+
+    def __str__(self):
+        return ''.join(f'{n}: {v}\r\n' for n, v in self.pares) + '\r\n'
+
+
+class PeticionHTTP:
+    __slots__ = ('metodo', 'destino', 'version', 'cabeceras')
+
+    def __init__(self, metodo, destino, version, cabeceras):
+        self.metodo = metodo
+        self.destino = destino
+        self.version = version
+        self.cabeceras = cabeceras
+
+
+def leer_bloque_cabeceras(rfile):
+    """Copia las cabeceras a un bytearray reutilizado por hilo; devuelve (buffer, largo)"""
+    buffer = getattr(buffers_cabeceras, 'buffer', None)
+    if buffer is None:
+        buffer = buffers_cabeceras.buffer = bytearray(MAX_BYTES_CABECERAS)
+    # Camino rápido: el readline() de la línea de petición ya dejó las cabeceras en el buffer del socket
+    disponible = rfile.peek(MAX_BYTES_CABECERAS)
+    vacia = 2 if disponible[:2] == b'\r\n' else 1 if disponible[:1] == b'\n' else 0
+    if vacia:
+        rfile.read(vacia)
+        return buffer, 0
+    fin = FIN_CABECERAS.search(disponible, 0, MAX_BYTES_CABECERAS)
+    if fin:
+        largo = fin.end()
+        rfile.readinto(memoryview(buffer)[:largo])
+        return buffer, largo
+    # Camino lento: cabeceras repartidas en varios segmentos TCP
+    largo = 0
+    for _ in range(MAX_CABECERAS + 1):
+        linea = rfile.readline(MAX_LINEA_PETICION + 1)
+        if len(linea) > MAX_LINEA_PETICION:
+            raise ErrorPeticion(431, 'Cabecera demasiado larga')
+        if linea in (b'\r\n', b'\n', b''):
+            return buffer, largo
+        if largo + len(linea) > MAX_BYTES_CABECERAS:
+            raise ErrorPeticion(431, 'Cabeceras demasiado grandes')
+        buffer[largo:largo + len(linea)] = linea
+        largo += len(linea)
+    raise ErrorPeticion(431, 'Demasiadas cabeceras')
+
+
+def parsear_cabeceras(buffer, largo):
+    pares = []
+    posicion = 0
+    while posicion < largo:
+        fin = buffer.find(b'\n', posicion, largo)
+        if fin == -1:
+            fin = largo
+        linea = buffer[posicion:fin]
+        posicion = fin + 1
+        if linea[-1:] == b'\r':
+            linea = linea[:-1]
+        if not linea:
+            break
+        if linea[0] in (0x20, 0x09):
+            raise ErrorPeticion(400, 'Cabecera plegada (obs-fold) no permitida')
+        separador = linea.find(b':')
+        if separador <= 0 or linea[separador - 1] in (0x20, 0x09):
+            raise ErrorPeticion(400, 'Cabecera mal formada')
+        pares.append((linea[:separador].decode('latin-1'), linea[separador + 1:].strip(b' \t').decode('latin-1')))
+        if len(pares) > MAX_CABECERAS:
+            raise ErrorPeticion(431, 'Demasiadas cabeceras')
+    return pares
+
+
+def parsear_peticion(linea_cruda, rfile):
+    """Línea de petición + cabeceras -> PeticionHTTP; ErrorPeticion con el status a responder si algo no cuadra"""
+    if len(linea_cruda) > MAX_LINEA_PETICION:
+        raise ErrorPeticion(414, 'Línea de petición demasiado larga')
+    partes = linea_cruda.rstrip(b'\r\n').split(b' ')
+    if len(partes) != 3 or not partes[0] or not partes[1]:
+        raise ErrorPeticion(400, f'Línea de petición inválida ({bytes(linea_cruda[:80])!r})')
+    metodo, destino, version = partes
+    if not (metodo.isalpha() and metodo.isupper()):
+        raise ErrorPeticion(400, 'Método inválido')
+    if version not in (b'HTTP/1.1', b'HTTP/1.0'):
+        if version.startswith(b'HTTP/') and version[5:6].isdigit() and version[5:6] >= b'2':
+            raise ErrorPeticion(505, 'Versión HTTP no soportada')
+        raise ErrorPeticion(400, 'Versión HTTP inválida')
+    if destino[:1] != b'/' and destino != b'*' and not destino.startswith((b'http://', b'https://')):
+        raise ErrorPeticion(400, 'Destino de la petición inválido')
+
+    cabeceras = Cabeceras(parsear_cabeceras(*leer_bloque_cabeceras(rfile)))
+    # Defensa contra request smuggling: un solo largo de cuerpo y sin chunked (el servidor no lo decodifica)
+    if 'Transfer-Encoding' in cabeceras:
+        raise ErrorPeticion(501, 'Transfer-Encoding no soportado; usa Content-Length')
+    largos = cabeceras.get_all('Content-Length')
+    if largos and (len(set(largos)) > 1 or not largos[0].isdigit()):
+        raise ErrorPeticion(400, 'Content-Length inválido')
+    return PeticionHTTP(metodo.decode('ascii'), destino.decode('latin-1'), version.decode('ascii'), cabeceras)
+
+
+# ---------- Escritura de respuestas en una sola llamada (sendmsg / writev) ----------
+
+ESCRITURA_VECTORIZADA = os.environ.get('ESCRITURA_VECTORIZADA', '1') != '0'   # 0 = cabeceras y cuerpo por separado
+
+
+def escribir_vectorizado(conexion, partes):
+    """Manda todas las partes con sendmsg (writev) y reintenta sólo lo que quede si el envío fue parcial"""
+    if not hasattr(conexion, 'sendmsg') or isinstance(conexion, ssl.SSLSocket):
+        conexion.sendall(b''.join(partes))   # SSLSocket no tiene sendmsg: un solo registro TLS igual
+        return
+    while partes:
+        enviados = conexion.sendmsg(partes)
+        while partes and enviados >= len(partes[0]):
+            enviados -= len(partes[0])
+            partes.pop(0)
+        if enviados:
+            partes[0] = partes[0][enviados:]
+
+
+# ---------- Plazos por conexión (clientes lentos o mudos) con una rueda de temporización ----------
+
+PLAZOS_CONEXION = {
+    'inactivo': float(os.environ.get('PLAZO_INACTIVO_S', '15')),     # conexión abierta sin línea de petición
+    'cabeceras': float(os.environ.get('PLAZO_CABECERAS_S', '10')),   # línea de petición recibida, cabeceras a medias
+    'cuerpo': float(os.environ.get('PLAZO_CUERPO_S', '30')),         # cuerpo anunciado en Content-Length sin llegar
+    'total': float(os.environ.get('PLAZO_TOTAL_S', '120')),          # toda la conexión, incluida la respuesta
+}
+
+
+class RuedaTemporizadores:
+    """Rueda de temporización: un solo hilo vence los plazos de todas las conexiones, sin un Timer por socket.
+    programar() y cancelar() son O(1); la precisión es de una ranura (resolucion segundos)"""
+
+    def __init__(self, resolucion=0.25, ranuras=512):
+        self.resolucion = resolucion
+        self.ranuras = [{} for _ in range(ranuras)]
+        self.origen = time.monotonic()
+        self.tick = 0
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def programar(self, segundos, accion, *args):
+        if self.pid != os.getpid():   # perezoso: en prefork cada worker necesita su propio hilo después de fork()
+            self.iniciar()
+        with self.lock:
+            objetivo = max(self.tick + 1, int((time.monotonic() - self.origen + segundos) / self.resolucion) + 1)
+            entrada = (objetivo, accion, args)
+            ranura = self.ranuras[objetivo % len(self.ranuras)]
+            ranura[id(entrada)] = entrada
+        return ranura, entrada
+
+    def cancelar(self, temporizador):
+        if temporizador is not None:
+            ranura, entrada = temporizador
+            with self.lock:
+                ranura.pop(id(entrada), None)
+
+    def iniciar(self):
+        """Arranca el hilo una sola vez por proceso; bajo el lock para que dos conexiones simultáneas no lancen
+        dos hilos ni vacíen las ranuras que la otra ya programó"""
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.ranuras = [{} for _ in self.ranuras]   # lo heredado de fork() es del proceso padre
+            threading.Thread(target=self.girar, daemon=True, name='rueda-plazos').start()
+
+    def girar(self):
+        while True:
+            actual = int((time.monotonic() - self.origen) / self.resolucion)
+            vencidos = []
+            with self.lock:
+                while self.tick < actual:   # si el hilo se atrasó, se ponen al día todas las ranuras pendientes
+                    self.tick += 1
+                    ranura = self.ranuras[self.tick % len(self.ranuras)]
+                    for clave, entrada in list(ranura.items()):
+                        if entrada[0] <= self.tick:   # las de vueltas futuras se quedan en la ranura
+                            vencidos.append(entrada)
+                            del ranura[clave]
+            for _, accion, args in vencidos:
+                try:
+                    accion(*args)
+                except Exception as e:
+                    print(f"⚠️ Error venciendo un plazo: {e}")
+            time.sleep(self.origen + (actual + 1) * self.resolucion - time.monotonic())
+
+
+class VigilanciaConexiones:
+    """Cierra las conexiones que se pasan de su plazo y cuenta los vencimientos por motivo y tipo de red"""
+
+    def __init__(self):
+        self.rueda = RuedaTemporizadores()
+        self.lock = threading.Lock()
+        self.vencimientos = {}
+        self.vigiladas = 0
+        self.activas = {}   # handler -> IP local por la que entró la conexión
+
+    def alta(self, handler):
+        with self.lock:
+            self.vigiladas += 1
+            self.activas[handler] = handler.ip_local
+
+    def baja(self, handler):
+        with self.lock:
+            self.activas.pop(handler, None)
+
+    def drenar(self, ips, segundos):
+        """Da 'segundos' a las conexiones que entraron por direcciones desaparecidas (ips=None: a todas, al detenerse)
+        para terminar lo que tengan en curso"""
+        with self.lock:
+            afectadas = [h for h, ip in self.activas.items() if ips is None or ip in ips]
+        for handler in afectadas:
+            self.rueda.cancelar(handler.plazo_drenaje)
+            handler.plazo_drenaje = self.rueda.programar(segundos, self.vencer, handler, 'drenaje')
+        return len(afectadas)
+
+    def cancelar_drenaje(self, ips):
+        """La dirección volvió (la VPN se reconectó) antes de que venciera el drenaje"""
+        with self.lock:
+            afectadas = [h for h, ip in self.activas.items() if ip in ips]
+        for handler in afectadas:
+            self.rueda.cancelar(handler.plazo_drenaje)
+            handler.plazo_drenaje = None
+
+    def vencer(self, handler, motivo):
+        if handler not in self.activas:   # terminó justo mientras vencía su plazo
+            return
+        handler.plazo_vencido = motivo
+        red = detectar_tipo_ip(handler.client_address[0])
+        with self.lock:
+            por_red = self.vencimientos.setdefault(motivo, {})
+            por_red[red] = por_red.get(red, 0) + 1
+        if handler.server.estadisticas is not None:
+            handler.server.estadisticas.contar('plazos_vencidos')
+        print(f"⏱️ [{time.strftime('%H:%M:%S')}] Plazo '{motivo}' vencido para {handler.client_address[0]} ({red}): cerrando")
+        try:
+            # shutdown despierta al hilo bloqueado en recv()/send() sin cerrar el descriptor bajo sus pies
+            handler.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def resumen(self):
+        with self.lock:
+            vencimientos = {motivo: dict(por_red) for motivo, por_red in self.vencimientos.items()}
+            vigiladas = self.vigiladas
+        return {
+            'plazos_s': PLAZOS_CONEXION,
+            'conexiones_vigiladas': vigiladas,
+            'vencimientos': vencimientos,
+            'total_vencidas': sum(sum(por_red.values()) for por_red in vencimientos.values()),
+            'pendientes': sum(len(ranura) for ranura in self.rueda.ranuras),
+            'activas': len(self.activas),
+        }
+
+
+vigilancia = VigilanciaConexiones()
+
+
+# ---------- Captura de tráfico (JSONL) para reproducirlo después ----------
+
+CAPTURA_TRAFICO = os.environ.get('CAPTURA_TRAFICO', '')        # ruta del archivo; vacío = desactivada
+CAPTURA_MAX_BYTES = int(float(os.environ.get('CAPTURA_MAX_MB', '50')) * 1024 * 1024)
+CAPTURA_RESPALDOS = int(os.environ.get('CAPTURA_RESPALDOS', '5'))
+CAPTURA_CUERPOS = os.environ.get('CAPTURA_CUERPOS', '0') == '1'  # guarda el cuerpo en base64 (ojo: incluye contraseñas del login)
+HEADERS_CAPTURADOS = ('Accept', 'Accept-Language', 'Content-Type', 'User-Agent', 'X-Deadline-Ms', 'X-Request-Id')
+
+
+def clase_cliente(user_agent):
+    agente = user_agent.lower()
+    if any(x in agente for x in ('okhttp', 'ktor', 'dalvik', 'cfnetwork', 'darwin')):
+        return 'app'
+    if any(x in agente for x in ('curl', 'python', 'postman', 'wget', 'insomnia')):
+        return 'herramienta'
+    if 'mozilla' in agente:
+        return 'navegador-movil' if any(x in agente for x in ('mobile', 'android', 'iphone', 'ipad')) else 'navegador'
+    return 'otro'
+
+
+class CapturaTrafico:
+    """Escritor JSONL con buffer: los hilos sólo encolan; un hilo vacía cada segundo y rota por tamaño"""
+
+    def __init__(self, ruta, max_bytes=CAPTURA_MAX_BYTES, respaldos=CAPTURA_RESPALDOS, intervalo=1.0):
+        self.ruta = ruta
+        self.max_bytes = max_bytes
+        self.respaldos = respaldos
+        self.intervalo = intervalo
+        self.pendientes = []
+        self.lock = threading.Lock()
+        self.lleno = threading.Event()
+        self.escritas = 0
+        self.archivo = open(ruta, 'a', encoding='utf-8')
+        self.tamano = self.archivo.tell()
+        threading.Thread(target=self.vaciar_periodicamente, daemon=True, name='captura').start()
+
+    def registrar(self, entrada):
+        linea = json.dumps(entrada, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self.lock:
+            self.pendientes.append(linea)
+            if len(self.pendientes) >= 512:
+                self.lleno.set()
+
+    def vaciar_periodicamente(self):
+        while True:
+            self.lleno.wait(self.intervalo)
+            self.lleno.clear()
+            self.vaciar()
+
+    def vaciar(self):
+        with self.lock:
+            lineas, self.pendientes = self.pendientes, []
+        if not lineas:
+            return
+        bloque = ''.join(lineas)
+        self.archivo.write(bloque)
+        self.archivo.flush()
+        self.escritas += len(lineas)
+        self.tamano += len(bloque.encode('utf-8'))
+        if self.tamano >= self.max_bytes:
+            self.rotar()
+
+    def rotar(self):
+        """captura.jsonl -> captura.jsonl.1 -> ... -> captura.jsonl.N (el más antiguo se descarta)"""
+        self.archivo.close()
+        for n in range(self.respaldos - 1, 0, -1):
+            if os.path.exists(f'{self.ruta}.{n}'):
+                os.replace(f'{self.ruta}.{n}', f'{self.ruta}.{n + 1}')
+        if self.respaldos > 0:
+            os.replace(self.ruta, f'{self.ruta}.1')
+        else:
+            os.remove(self.ruta)
+        self.archivo = open(self.ruta, 'a', encoding='utf-8')
+        self.tamano = 0
+
+
+captura_trafico = None   # se crea en iniciar_captura(): en modo prefork cada worker escribe su propio archivo
+
+
+def iniciar_captura(sufijo=''):
+    """El hilo que vacía el buffer no sobrevive a fork(), así que la captura se abre ya dentro del proceso que atiende"""
+    global captura_trafico
+    if CAPTURA_TRAFICO and captura_trafico is None:
+        base, extension = os.path.splitext(CAPTURA_TRAFICO)
+        captura_trafico = CapturaTrafico(f'{base}{sufijo}{extension}' if sufijo else CAPTURA_TRAFICO)
+    return captura_trafico
+
 
 class RobustServer(http.server.BaseHTTPRequestHandler):
+    def setup(self):
+        super().setup()
+        self.plazo_vencido = None
+        self.plazo_fase = None
+        self.plazo_drenaje = None
+        try:
+            self.ip_local = self.connection.getsockname()[0]
+        except OSError:
+            self.ip_local = None
+        vigilancia.alta(self)
+        self.plazo_total = vigilancia.rueda.programar(PLAZOS_CONEXION['total'], vigilancia.vencer, self, 'total')
+
+    def finish(self):
+        self.fijar_plazo(None)
+        vigilancia.rueda.cancelar(self.plazo_total)
+        vigilancia.rueda.cancelar(self.plazo_drenaje)
+        vigilancia.baja(self)
+        super().finish()
+
+    def fijar_plazo(self, motivo):
+        """Reemplaza el plazo de la fase actual (inactivo, cabeceras, cuerpo); None = sin plazo de fase"""
+        vigilancia.rueda.cancelar(self.plazo_fase)
+        self.plazo_fase = None
+        if motivo is not None:
+            self.plazo_fase = vigilancia.rueda.programar(PLAZOS_CONEXION[motivo], vigilancia.vencer, self, motivo)
+
+    def handle_one_request(self):
+        self.llegada = time.time()
+        self.cuerpo_leido = None
+        self.status_enviado = None
+        self.traza = None
+        self.bytes_enviados = 0
+        self.fijar_plazo('inactivo')
+        try:
+            super().handle_one_request()
+        except OSError as e:
+            if self.plazo_vencido is None and not isinstance(e, ConnectionAbortedError):
+                raise
+            self.close_connection = True   # ya se contó y se avisó en vencer(); no hace falta el traceback
+        finally:
+            self.fijar_plazo(None)
+            rutas_en_curso.pop(threading.get_ident(), None)
+            if self.traza is not None:
+                self.traza.cerrar()
+                tiempos_fases.registrar(self.traza)
+                if estadisticas_cluster is not None:
+                    estadisticas_cluster.salida(self.status_enviado, (time.perf_counter() - self.traza.inicio) * 1000)
+            if self.traza is not None or self.status_enviado is not None:
+                if self.server.estadisticas is not None:
+                    self.server.estadisticas.registrar(self)
+                clientes_recientes.registrar(self)
+        if captura_trafico is not None and getattr(self, 'command', None) and self.status_enviado:
+            self.capturar()
+
+    def capturar(self):
+        entrada = {
+            't': round(self.llegada, 4),
+            'm': self.command,
+            'p': self.path,
+            'h': {k: self.headers[k] for k in HEADERS_CAPTURADOS if k in self.headers},
+            'cl': clase_cliente(self.headers.get('User-Agent', '')),
+            'red': detectar_tipo_ip(self.client_address[0]),
+            's': self.status_enviado,
+            'ms': round((time.time() - self.llegada) * 1000, 1),
+        }
+        if 'Authorization' in self.headers:
+            entrada['auth'] = True  # El token nunca se guarda; el reproductor usa uno propio
+        if self.cuerpo_leido:
+            entrada['bh'] = hashlib.sha256(self.cuerpo_leido).hexdigest()[:16]
+            entrada['bl'] = len(self.cuerpo_leido)
+            if CAPTURA_CUERPOS:
+                entrada['b'] = base64.b64encode(self.cuerpo_leido).decode('ascii')
+        captura_trafico.registrar(entrada)
+
+    def parse_request(self):
+        inicio = time.perf_counter()
+        self.fijar_plazo('cabeceras')
+        valido = self.parsear_rapido() if PARSER_RAPIDO else super().parse_request()
+        self.fijar_plazo(None)
+        if valido:
+            ruta = f'{self.command} {normalizar_ruta(urlparse(self.path).path)}'
+            rutas_en_curso[threading.get_ident()] = ruta
+            self.traza = Traza(ruta, inicio)
+            self.traza.marcar('route')
+            if estadisticas_cluster is not None:
+                estadisticas_cluster.entrada()
+        return valido
+
+    def parsear_rapido(self):
+        """Mismo contrato que BaseHTTPRequestHandler.parse_request, con parsear_peticion() por debajo"""
+        self.command = None
+        self.request_version = self.default_request_version
+        self.close_connection = True
+        self.requestline = str(self.raw_requestline[:MAX_LINEA_PETICION], 'iso-8859-1').rstrip('\r\n')
+        if not self.requestline.strip():
+            return False
+        try:
+            peticion = parsear_peticion(self.raw_requestline, self.rfile)
+        except ErrorPeticion as e:
+            self.request_version = 'HTTP/1.0'   # con HTTP/0.9 send_error omitiría la línea de estado
+            self.send_error(e.status, e.motivo)
+            return False
+        self.peticion = peticion
+        self.command = peticion.metodo
+        self.path = peticion.destino
+        if self.path.startswith('//'):
+            self.path = '/' + self.path.lstrip('/')   # Igual que http.server (gh-87389): evita redirecciones abiertas
+        self.request_version = peticion.version
+        self.headers = peticion.cabeceras
+
+        http11 = peticion.version == 'HTTP/1.1' and self.protocol_version >= 'HTTP/1.1'
+        self.close_connection = not http11
+        conexion = self.headers.get('Connection', '').lower()
+        if conexion == 'close':
+            self.close_connection = True
+        elif conexion == 'keep-alive' and self.protocol_version >= 'HTTP/1.1':
+            self.close_connection = False
+        if http11 and self.headers.get('Expect', '').lower() == '100-continue':
+            return self.handle_expect_100()
+        return True
+
+    def marcar(self, fase):
+        if self.traza is not None:
+            self.traza.marcar(fase)
+
+    def end_headers(self):
+        if self.traza is not None:
+            self.send_header('Server-Timing', self.traza.server_timing())
+        super().end_headers()
+
+    def flush_headers(self):
+        if hasattr(self, '_headers_buffer'):
+            self.bytes_enviados += sum(map(len, self._headers_buffer))
+        super().flush_headers()
+
+    def enviar(self, cuerpo=b''):
+        """end_headers() + wfile.write(cuerpo), pero línea de estado, cabeceras y cuerpo salen en un solo sendmsg"""
+        if not ESCRITURA_VECTORIZADA:
+            self.end_headers()
+            if cuerpo:
+                self.wfile.write(cuerpo)
+                self.bytes_enviados += len(cuerpo)
+            return
+        if self.traza is not None:
+            self.send_header('Server-Timing', self.traza.server_timing())
+        self._headers_buffer.append(b'\r\n')
+        partes = [memoryview(b''.join(self._headers_buffer))]
+        self._headers_buffer = []
+        if cuerpo:
+            partes.append(memoryview(cuerpo))
+        self.bytes_enviados += sum(map(len, partes))
+        escribir_vectorizado(self.connection, partes)
+
+    def leer_cuerpo(self):
+        longitud = int(self.headers.get('Content-Length') or 0)
+        if not longitud:
+            self.cuerpo_leido = b''
+            return self.cuerpo_leido
+        self.fijar_plazo('cuerpo')
+        self.cuerpo_leido = self.rfile.read(longitud)
+        self.fijar_plazo(None)
+        if len(self.cuerpo_leido) < longitud:
+            # Cliente que cortó o plazo vencido: no reenviar a Ktor un JSON truncado
+            raise ConnectionAbortedError(f'Cuerpo incompleto ({len(self.cuerpo_leido)} de {longitud} bytes)')
+        return self.cuerpo_leido
+
+    def log_request(self, code='-', size='-'):
+        if isinstance(code, int):  # send_response pasa por aquí (HTTPStatus también es int)
+            self.status_enviado = int(code)
+
     def do_GET(self):
+        if self.path.startswith('/api/'):
+            self.proxy_ktor()
+            return
+        if self.path == '/estado/upstream':
+            self.responder_json(200, cliente_ktor.resumen())
+            return
+        if self.path == '/estado/cluster':
+            datos = estadisticas_cluster.resumen() if estadisticas_cluster is not None else {'modo': 'un proceso', 'pid': os.getpid()}
+            self.responder_json(200, datos)
+            return
+        if self.path == '/estado/tls':
+            self.responder_json(200, contexto_tls.resumen() if contexto_tls is not None else {'tls': False})
+            return
+        if self.path == '/estado/interfaces':
+            grupo = self.server.grupo
+            self.responder_json(200, grupo.resumen() if grupo is not None else
+                                {'modo': 'una-direccion', 'escuchas': [self.server.estadisticas.resumen()]})
+            return
+        if self.path == '/estado/mdns':
+            self.responder_json(200, respondedor_mdns.resumen() if respondedor_mdns is not None else {'mdns': False})
+            return
+        if self.path == '/estado/red':
+            self.responder_json(200, vigia_red.resumen() if vigia_red is not None else {'vigilancia': False})
+            return
+        if self.path == '/estado/socket':
+            self.responder_json(200, self.server.resumen_socket())
+            return
+        if self.path == '/estado/plazos':
+            self.responder_json(200, vigilancia.resumen())
+            return
+        if self.path == '/estado/tokens':
+            self.responder_json(200, cache_tokens.resumen())
+            return
+        if self.path.startswith('/debug/profile'):
+            self.marcar('profile')
+            self.perfilar()
+            return
+        if self.path.startswith('/debug/memoria'):
+            self.marcar('memoria')
+            self.memoria()
+            return
+        if self.path.startswith('/debug/tiempos'):
+            self.tiempos()
+            return
+        if self.path == '/rutas/estadisticas':
+            self.responder_json(200, estadisticas_rutas.resumen())
+            return
+        if self.path == '/clients' or self.path.startswith('/clients?'):
+            self.clientes()
+            return
+        if self.path == '/health/full':
+            self.marcar('salud')
+            veredicto = salud_completa.obtener()
+            self.responder_json(503 if veredicto['status'] == 'caido' else 200, veredicto)
+            return
+
         client_ip = self.client_address[0]
         timestamp = time.strftime('%H:%M:%S')
 
-        # Log detallado
-        print(f"\n🎯 [{timestamp}] CONEXIÓN DETECTADA:")
-        print(f"   📍 IP Cliente: {client_ip}")
-        print(f"   🌐 Ruta: {self.path}")
-        print(f"   📱 User-Agent: {self.headers.get('User-Agent', 'No especificado')}")
-
-        # Headers robustos para evitar cualquier problema
-        self.send_response(200)
-        self.send_header('Content-Type', 'text/html; charset=utf-8')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS, PUT, DELETE')
-        self.send_header('Access-Control-Allow-Headers', '*')
-        self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-        self.send_header('Pragma', 'no-cache')
-        self.send_header('Expires', '0')
-        self.end_headers()
+        # Log detallado (no para /ping: la página /rutas lo sondea cada 2 s por cada dirección)
+        self.marcar('log')
+        if self.path != '/ping':
+            print(f"\n🎯 [{timestamp}] CONEXIÓN DETECTADA:")
+            print(f"   📍 IP Cliente: {client_ip}")
+            print(f"   🌐 Ruta: {self.path}")
+            print(f"   📱 User-Agent: {self.headers.get('User-Agent', 'No especificado')}")
 
         # Detectar tipo de dispositivo y conexión
+        self.marcar('classify')
         user_agent = self.headers.get('User-Agent', '').lower()
         is_mobile = any(x in user_agent for x in ['mobile', 'android', 'iphone', 'ipad'])
 
         connection_type = self.detect_connection_type(client_ip)
 
         # Respuesta HTML optimizada
+        self.marcar('render')
+        tipo = 'text/html; charset=utf-8'
         if self.path == '/':
             response = self.generate_main_page(client_ip, connection_type, is_mobile, timestamp)
         elif self.path == '/test':
             response = self.generate_test_page(client_ip, connection_type)
+        elif self.path == '/rutas':
+            response = self.generate_rutas_page()
         elif self.path == '/ping':
             response = f'{{"status": "ok", "timestamp": "{timestamp}", "client_ip": "{client_ip}"}}'
-            self.send_header('Content-Type', 'application/json')
+            tipo = 'application/json'
         else:
             response = self.generate_main_page(client_ip, connection_type, is_mobile, timestamp)
 
-        self.wfile.write(response.encode('utf-8'))
-        print(f"✅ [{timestamp}] Respuesta enviada exitosamente a {client_ip}")
+        self.marcar('encode')
+        cuerpo = response.encode('utf-8')
+
+        # Headers robustos para evitar cualquier problema (se envían ya con el tiempo de cada fase)
+        self.marcar('write')
+        self.send_response(200)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS, PUT, PATCH, DELETE')
+        self.send_header('Access-Control-Allow-Headers', '*')
+        self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+        self.send_header('Pragma', 'no-cache')
+        self.send_header('Expires', '0')
+        self.enviar(cuerpo)
+        if self.path != '/ping':
+            print(f"✅ [{timestamp}] Respuesta enviada exitosamente a {client_ip}")
+
+    def do_POST(self):
+        if self.path == '/batch':
+            self.procesar_batch()
+            return
+        if self.path == '/tokens/revocar':
+            self.revocar_token()
+            return
+        if self.path == '/rutas/reporte':
+            self.reportar_rutas()
+            return
+        self.do_GET()
+
+    def do_PUT(self):
+        self.proxy_ktor()
+
+    def do_PATCH(self):
+        self.proxy_ktor()
+
+    def do_DELETE(self):
+        self.proxy_ktor()
+
+    def proxy_ktor(self):
+        """Reenvía /api/* a Ktor con plazo por ruta; falla rápido si Ktor está caído o lento"""
+        client_ip = self.client_address[0]
+        ruta = urlparse(self.path).path
+        plazo = Plazo.para_ruta(ruta, self.headers.get('X-Deadline-Ms'))
+
+        if self.longitud_cuerpo(MAX_CUERPO_API) is None:
+            return
+        cuerpo = self.leer_cuerpo() or None
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HEADERS_SALTO}
+        headers['X-Forwarded-For'] = client_ip
+
+        token = token_bearer(self.headers)
+        if VERIFICAR_TOKENS and token is not None and (ruta_protegida(ruta) or ruta == '/api/auth/verify'):
+            self.marcar('auth')
+            try:
+                cache_tokens.verificar(token)
+            except TokenInvalido as e:
+                if ruta_protegida(ruta):
+                    print(f"🚫 Token rechazado ({e}) para {client_ip} en {ruta}")
+                    self.responder_json(401, {'error': 'Token inválido o expirado'})
+                    return
+                # /api/auth/verify es pública en Ktor: con un token malo decide Ktor, como sin este proxy
+            else:
+                if ruta == '/api/auth/verify':
+                    self.responder_json(200, {'message': 'Token válido'})
+                    return
+
+        self.marcar('upstream')
+        inicio = time.monotonic()
+        try:
+            respuesta = cliente_ktor.enviar(self.command, self.path, headers, cuerpo, plazo)
+        except UpstreamNoDisponible as e:
+            print(f"⚠️ [{time.strftime('%H:%M:%S')}] {self.command} {ruta} -> {e.status}: {e.motivo}")
+            extra = {'Retry-After': str(e.reintentar_en)} if e.reintentar_en else None
+            self.responder_json(e.status, {'error': e.motivo, 'ruta': ruta}, extra)
+            return
+
+        duracion = (time.monotonic() - inicio) * 1000
+        self.marcar('log')
+        print(f"🔁 {self.command} {ruta} -> {respuesta.status} ({respuesta.origen}, {duracion:.0f} ms) para {client_ip}")
+        self.marcar('write')
+        self.send_response(respuesta.status)
+        for clave, valor in respuesta.headers:
+            if clave.lower() not in HEADERS_SALTO and not clave.lower().startswith('access-control-'):
+                self.send_header(clave, valor)
+        self.send_header('Content-Length', str(len(respuesta.cuerpo)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.enviar(respuesta.cuerpo)
+
+    def perfilar(self):
+        """GET /debug/profile?seconds=N[&hz=100&todos=1&lineas=1&formato=collapsed]; sólo desde la propia máquina"""
+        if not es_local(self.client_address[0]):
+            self.responder_json(403, {'error': 'Sólo disponible desde localhost'})
+            return
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            segundos = min(MAX_SEGUNDOS_PERFIL, max(0.1, float(query.get('seconds', ['5'])[0])))
+            hz = min(1000, max(1, int(query.get('hz', ['100'])[0])))
+            top = max(1, int(query.get('top', ['15'])[0]))
+        except ValueError:
+            self.responder_json(400, {'error': 'seconds, hz y top deben ser números'})
+            return
+        print(f"🔬 Perfilando {segundos:g} s a {hz} Hz por pedido de {self.client_address[0]}")
+        resultado = perfilador.perfilar(segundos, hz, query.get('todos', ['0'])[0] == '1',
+                                        query.get('lineas', ['0'])[0] == '1', top)
+        if resultado is None:
+            self.responder_json(409, {'error': 'Ya hay un perfil en curso'})
+            return
+        if query.get('formato', [''])[0] == 'collapsed':
+            # Directo a flamegraph.pl o speedscope: curl .../debug/profile?seconds=10&formato=collapsed > perfil.txt
+            cuerpo = (resultado['collapsed'] + '\n').encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.enviar(cuerpo)
+            return
+        self.responder_json(200, resultado)
+
+    def clientes(self):
+        """GET /clients[?limite=N]: los clientes más recientes primero"""
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            limite = max(1, int(query['limite'][0])) if 'limite' in query else None
+        except ValueError:
+            self.responder_json(400, {'error': 'limite debe ser un número'})
+            return
+        self.responder_json(200, clientes_recientes.resumen(limite))
+
+    def tiempos(self):
+        """GET /debug/tiempos[?ruta=/api/ventas&reiniciar=1]: histogramas por ruta y fase; sólo localhost"""
+        if not es_local(self.client_address[0]):
+            self.responder_json(403, {'error': 'Sólo disponible desde localhost'})
+            return
+        query = parse_qs(urlparse(self.path).query)
+        resumen = tiempos_fases.resumen(query.get('ruta', [None])[0])
+        if query.get('reiniciar', ['0'])[0] == '1':
+            tiempos_fases.reiniciar()
+        self.responder_json(200, resumen)
+
+    def memoria(self):
+        """GET /debug/memoria[?accion=iniciar|snapshot|diff|gc|detener]; sólo desde la propia máquina"""
+        if not es_local(self.client_address[0]):
+            self.responder_json(403, {'error': 'Sólo disponible desde localhost'})
+            return
+        query = parse_qs(urlparse(self.path).query)
+
+        def param(nombre, defecto=None):
+            return query.get(nombre, [defecto])[0]
+
+        accion = param('accion', 'estado')
+        try:
+            if accion == 'estado':
+                datos = monitor_memoria.estado()
+            elif accion == 'iniciar':
+                datos = monitor_memoria.iniciar(min(64, max(1, int(param('marcos', '1')))))
+            elif accion == 'detener':
+                datos = monitor_memoria.detener()
+            elif accion == 'snapshot':
+                datos = {'snapshot': monitor_memoria.tomar_snapshot(), **monitor_memoria.estado()}
+            elif accion == 'diff':
+                desde, hasta = param('desde'), param('hasta')
+                datos = monitor_memoria.diferencia(int(desde) if desde else None, int(hasta) if hasta else None,
+                                                   param('agrupar', 'lineno'), int(param('top', '15')))
+            elif accion == 'gc':
+                recolectados = gc.collect()
+                datos = {'recolectados': recolectados, **monitor_memoria.estado()}
+            else:
+                raise ValueError('accion debe ser estado, iniciar, snapshot, diff, gc o detener')
+        except ValueError as e:
+            self.responder_json(400, {'error': str(e)})
+            return
+        self.responder_json(200, datos)
+
+    def revocar_token(self):
+        """POST /tokens/revocar {"token": "..."} o {"userId": N}; sólo desde la propia máquina"""
+        if not es_local(self.client_address[0]):
+            self.responder_json(403, {'error': 'Sólo disponible desde localhost'})
+            return
+        if self.longitud_cuerpo(MAX_CUERPO_BATCH) is None:
+            return
+        try:
+            datos = json.loads(self.leer_cuerpo() or b'{}')
+        except ValueError:
+            datos = None
+        if not isinstance(datos, dict) or not (datos.get('token') or isinstance(datos.get('userId'), int)):
+            self.responder_json(400, {'error': 'Indica "token" o "userId"'})
+            return
+        cache_tokens.revocar(token=datos.get('token'), user_id=datos.get('userId'))
+        self.responder_json(200, {'revocado': True, **cache_tokens.resumen()})
+
+    def procesar_batch(self):
+        """POST /batch: arreglo JSON de sub-peticiones ejecutadas en paralelo contra Ktor"""
+        inicio = time.monotonic()
+        if self.longitud_cuerpo(MAX_CUERPO_BATCH) is None:
+            return
+        try:
+            items = json.loads(self.leer_cuerpo() or b'null')
+        except ValueError:
+            self.responder_json(400, {'error': 'El cuerpo debe ser JSON'})
+            return
+        if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+            self.responder_json(400, {'error': 'Se esperaba un arreglo de objetos {method, path, headers, body}'})
+            return
+        if not items or len(items) > MAX_BATCH:
+            self.responder_json(413 if items else 400, {'error': f'El batch debe tener entre 1 y {MAX_BATCH} elementos'})
+            return
 
-    def do_POST(self):
-        self.do_GET()
+        # Headers comunes: el token del celular vale para todas las sub-peticiones
+        headers_base = {'X-Forwarded-For': self.client_address[0]}
+        for clave in ('Authorization', 'Accept-Language', 'X-Request-Id'):
+            if self.headers.get(clave):
+                headers_base[clave] = self.headers[clave]
+        header_plazo = self.headers.get('X-Deadline-Ms')
+
+        # Un token vencido sólo invalida los elementos de rutas protegidas: un login dentro del batch debe pasar
+        token = token_bearer(self.headers)
+        token_rechazado = False
+        if VERIFICAR_TOKENS and token is not None:
+            try:
+                cache_tokens.verificar(token)
+            except TokenInvalido:
+                token_rechazado = True
+
+        self.marcar('upstream')
+        futuros = [ejecutor_batch.submit(ejecutar_sub_peticion, i, item, headers_base, header_plazo, token_rechazado)
+                   for i, item in enumerate(items)]
+        resultados = [f.result() for f in futuros]
+        total_ms = round((time.monotonic() - inicio) * 1000, 1)
+        print(f"📦 Batch de {len(items)} llamadas para {self.client_address[0]} en {total_ms} ms")
+        self.responder_json(200, {'total_ms': total_ms, 'resultados': resultados})
+
+    def longitud_cuerpo(self, maximo):
+        """Content-Length validado; si no sirve responde 400/413 sin leer el cuerpo y devuelve None"""
+        try:
+            longitud = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            longitud = -1
+        if longitud < 0:
+            self.responder_json(400, {'error': 'Content-Length inválido'})
+            return None
+        if longitud > maximo:
+            self.close_connection = True   # el cuerpo queda sin leer en el socket
+            self.responder_json(413, {'error': f'Cuerpo de más de {maximo} bytes'})
+            return None
+        return longitud
+
+    def reportar_rutas(self):
+        """POST /rutas/reporte: lo manda la página /rutas cada 10 s y al cerrarse (sendBeacon)"""
+        if self.longitud_cuerpo(MAX_CUERPO_REPORTE) is None:
+            return
+        try:
+            estadisticas_rutas.registrar(json.loads(self.leer_cuerpo() or b'null'), self.client_address[0])
+        except (ValueError, TypeError) as e:
+            self.responder_json(400, {'error': f'Reporte inválido: {e}'})
+            return
+        self.responder_json(200, {'ok': True})
+
+    def responder_json(self, status, datos, headers_extra=None):
+        self.marcar('encode')
+        cuerpo = json.dumps(datos, indent=2, ensure_ascii=False).encode('utf-8')
+        self.marcar('write')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+        for clave, valor in (headers_extra or {}).items():
+            self.send_header(clave, valor)
+        self.enviar(cuerpo)
 
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS, PUT, DELETE')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS, PUT, PATCH, DELETE')
         self.send_header('Access-Control-Allow-Headers', '*')
-        self.end_headers()
+        self.enviar()
 
     def detect_connection_type(self, client_ip):
-        if client_ip.startswith('192.168.1.'):
-            return "WiFi Local"
-        elif client_ip.startswith('26.36.148.'):
-            return "Radmin VPN"
-        elif client_ip.startswith('10.0.11.'):
-            return "OpenVPN"
-        elif client_ip.startswith('10.'):
-            return "Red VPN"
-        elif client_ip.startswith('127.'):
-            return "Localhost"
-        else:
-            return f"Red Externa ({client_ip})"
+        tipo = detectar_tipo_ip(client_ip)
+        return f"{tipo} ({client_ip})" if tipo == "Red Externa" else tipo
 
     def generate_main_page(self, client_ip, connection_type, is_mobile, timestamp):
         device_type = "📱 Móvil" if is_mobile else "💻 Escritorio"
@@ -222,6 +2368,7 @@ class RobustServer(http.server.BaseHTTPRequestHandler):
                 <div class="buttons">
                     <a href="/test" class="btn">🧪 Probar API</a>
                     <a href="/ping" class="btn">📡 Ping Test</a>
+                    <a href="/rutas" class="btn">🏁 Ruta más rápida</a>
                     <a href="/" class="btn">🔄 Recargar</a>
                 </div>
 
@@ -316,9 +2463,1290 @@ class RobustServer(http.server.BaseHTTPRequestHandler):
         </html>
         """
 
+    def generate_rutas_page(self):
+        esquema = 'https' if contexto_tls is not None else 'http'
+        rutas = []
+        # Primero la dirección con la que el celular abrió esta página: seguro que funciona. El puerto sale del
+        # Host y no de PORT, porque la página pudo llegar por un proxy (apache) en otro puerto
+        try:
+            pedido = urlparse('//' + (self.headers.get('Host') or ''))
+            host, puerto = pedido.hostname, pedido.port or (443 if esquema == 'https' else 80)
+        except ValueError:
+            host = puerto = None
+        if host:
+            destino = f'[{host}]' if ':' in host else host
+            rutas.append({'url': f'{esquema}://{destino}:{puerto}', 'red': 'Esta página'})
+        for ip in direcciones_anunciadas():
+            if (ip, PORT) != (host, puerto):
+                rutas.append({'url': f'{esquema}://{ip}:{PORT}', 'red': detectar_tipo_ip(ip)})
+        # json.dumps no escapa "</": se evita que una dirección rara cierre el <script>
+        config = json.dumps(rutas, ensure_ascii=False).replace('</', '<\\/')
+        return f"""
+        <!DOCTYPE html>
+        <html lang="es">
+        <head>
+            <meta charset="UTF-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>🏁 Ruta más rápida</title>
+            <style>
+                body {{
+                    font-family: monospace;
+                    background: #1a1a1a;
+                    color: #00ff00;
+                    padding: 20px;
+                    line-height: 1.6;
+                }}
+                .container {{
+                    max-width: 800px;
+                    margin: 0 auto;
+                }}
+                table {{
+                    width: 100%;
+                    border-collapse: collapse;
+                }}
+                td, th {{
+                    border-bottom: 1px solid #00ff0055;
+                    padding: 6px;
+                    text-align: left;
+                }}
+                tr.elegida {{
+                    background: #00ff0022;
+                    font-weight: bold;
+                }}
+                .result {{
+                    background: #2a2a2a;
+                    border: 1px solid #00ff00;
+                    border-radius: 8px;
+                    padding: 20px;
+                    margin: 10px 0;
+                }}
+                .back-btn {{
+                    background: #00ff00;
+                    color: #1a1a1a;
+                    padding: 10px 20px;
+                    text-decoration: none;
+                    border-radius: 5px;
+                    font-weight: bold;
+                    display: inline-block;
+                    margin: 5px 0;
+                }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <h1>🏁 CARRERA DE RUTAS</h1>
+                <div class="result">
+                    <p>Este celular prueba <strong>/ping</strong> por cada dirección del servidor cada 2 s y se queda con la más rápida.</p>
+                    <p id="eleccion">⏳ Midiendo...</p>
+                    <a id="abrir" href="/" class="back-btn" style="display:none">📱 Abrir por la ruta elegida</a>
+                </div>
+                <div class="result">
+                    <table>
+                        <thead><tr><th>Red</th><th>Dirección</th><th>Último</th><th>Mediana</th><th>Pérdida</th></tr></thead>
+                        <tbody id="filas"></tbody>
+                    </table>
+                </div>
+                <a href="/" class="back-btn">← Volver al Inicio</a>
+            </div>
+            <script>
+            const RUTAS = {config}.map(r => ({{...r, muestras: [], ok: 0, perdidas: 0, okReporte: 0, perdidasReporte: 0,
+                                                fallosSeguidos: 0, ultimo: null}}));
+            let elegida = null;
+
+            function mediana(valores) {{
+                if (!valores.length) return null;
+                const orden = [...valores].sort((a, b) => a - b);
+                return orden[Math.floor(orden.length / 2)];
+            }}
+
+            async function sondear(ruta) {{
+                const control = new AbortController();
+                const limite = setTimeout(() => control.abort(), 2500);
+                const inicio = performance.now();
+                try {{
+                    const respuesta = await fetch(ruta.url + '/ping', {{cache: 'no-store', signal: control.signal}});
+                    await respuesta.text();
+                    if (!respuesta.ok) throw new Error(respuesta.status);
+                    ruta.ultimo = performance.now() - inicio;
+                    ruta.muestras.push(ruta.ultimo);
+                    if (ruta.muestras.length > 15) ruta.muestras.shift();   // ventana móvil: se adapta si la red cambia
+                    ruta.ok++; ruta.okReporte++; ruta.fallosSeguidos = 0;
+                }} catch (e) {{
+                    ruta.ultimo = null;
+                    ruta.perdidas++; ruta.perdidasReporte++; ruta.fallosSeguidos++;
+                }} finally {{
+                    clearTimeout(limite);
+                }}
+            }}
+
+            function elegir() {{
+                const vivas = RUTAS.filter(r => r.fallosSeguidos < 2 && r.muestras.length);
+                if (!vivas.length) return;
+                const mejor = vivas.reduce((a, b) => mediana(a.muestras) <= mediana(b.muestras) ? a : b);
+                // Histéresis: sólo se cambia si la actual se cayó o la nueva es al menos 20% más rápida
+                if (!elegida || !vivas.includes(elegida) || mediana(mejor.muestras) < 0.8 * mediana(elegida.muestras)) {{
+                    if (elegida !== mejor) {{
+                        elegida = mejor;
+                        try {{ localStorage.setItem('rutaElegida', elegida.url); }} catch (e) {{}}
+                        reportar();
+                    }}
+                }}
+            }}
+
+            function pintar() {{
+                const ms = v => v == null ? '—' : v.toFixed(1) + ' ms';
+                document.getElementById('filas').innerHTML = RUTAS.map(r => {{
+                    const intentos = r.ok + r.perdidas;
+                    const perdida = intentos ? (100 * r.perdidas / intentos).toFixed(0) + '%' : '—';
+                    const estado = r.fallosSeguidos >= 2 ? '❌ ' : r === elegida ? '⭐ ' : '✅ ';
+                    return `<tr class="${{r === elegida ? 'elegida' : ''}}"><td>${{estado}}${{r.red}}</td><td>${{r.url}}</td>` +
+                           `<td>${{ms(r.ultimo)}}</td><td>${{ms(mediana(r.muestras))}}</td><td>${{perdida}}</td></tr>`;
+                }}).join('');
+                if (elegida) {{
+                    document.getElementById('eleccion').textContent =
+                        `⭐ Ruta elegida: ${{elegida.red}} (${{elegida.url}}) con mediana ${{ms(mediana(elegida.muestras))}}`;
+                    const abrir = document.getElementById('abrir');
+                    abrir.href = elegida.url + '/';
+                    abrir.style.display = 'inline-block';
+                }}
+            }}
+
+            function reporte() {{
+                const rutas = {{}};
+                for (const r of RUTAS) {{
+                    rutas[r.url] = {{mediana_ms: mediana(r.muestras), ok: r.okReporte, perdidas: r.perdidasReporte}};
+                    r.okReporte = 0; r.perdidasReporte = 0;   // el servidor suma: se mandan sólo las novedades
+                }}
+                return JSON.stringify({{elegida: elegida ? elegida.url : null, rutas}});
+            }}
+
+            function reportar() {{
+                fetch('/rutas/reporte', {{method: 'POST', body: reporte(), keepalive: true}}).catch(() => {{}});
+            }}
+
+            async function ronda() {{
+                await Promise.all(RUTAS.map(sondear));   // todas a la vez: misma condición de red para cada una
+                elegir();
+                pintar();
+            }}
+
+            ronda();
+            setInterval(ronda, 2000);
+            setInterval(reportar, 10000);
+            addEventListener('pagehide', () => navigator.sendBeacon && navigator.sendBeacon('/rutas/reporte', reporte()));
+            </script>
+        </body>
+        </html>
+        """
+
     def log_message(self, format, *args):
         pass  # Silenciar logs automáticos para usar nuestros logs personalizados
 
+# ---------- Perfiles del socket de escucha ----------
+
+# keepalive = (segundos sin tráfico antes de sondear, segundos entre sondas, sondas fallidas para dar la conexión por muerta)
+PERFILES_SOCKET = {
+    'clasico': {          # lo que deja socketserver por defecto; sólo para comparar en benchmark-servidor.py
+        'reutilizar_direccion': False, 'backlog': 5, 'nodelay': False,
+        'keepalive': None, 'defer_accept_s': 0, 'fastopen': 0,
+    },
+    'baja-latencia': {    # pocos celulares interactivos: respuesta inmediata, muertos detectados en ~1 min
+        'reutilizar_direccion': True, 'backlog': 1024, 'nodelay': True,
+        'keepalive': (30, 10, 3), 'defer_accept_s': 0, 'fastopen': 64,
+    },
+    'alto-rendimiento': {  # ráfagas de carga (batch, reproducir-trafico.py --velocidad max)
+        'reutilizar_direccion': True, 'backlog': 1024, 'nodelay': True,
+        'keepalive': (120, 30, 4), 'defer_accept_s': 5, 'fastopen': 256,
+    },
+    'muchos-clientes': {  # muchas conexiones casi ociosas por VPN: accept sólo cuando llegan datos
+        'reutilizar_direccion': True, 'backlog': 4096, 'nodelay': True,
+        'keepalive': (60, 15, 4), 'defer_accept_s': 10, 'fastopen': 1024,
+    },
+}
+PERFIL_SOCKET = os.environ.get('PERFIL_SOCKET', 'baja-latencia')
+
+
+def maximo_backlog():
+    """El kernel recorta el backlog de listen() a net.core.somaxconn sin avisar"""
+    try:
+        with open('/proc/sys/net/core/somaxconn') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def aplicar_keepalive(conexion, keepalive):
+    inactivo, intervalo, sondas = keepalive
+    conexion.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        conexion.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, inactivo)
+        conexion.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, intervalo)
+        conexion.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, sondas)
+    elif hasattr(socket, 'SIO_KEEPALIVE_VALS'):   # Windows: milisegundos y sin número de sondas
+        conexion.ioctl(socket.SIO_KEEPALIVE_VALS, (1, inactivo * 1000, intervalo * 1000))
+
+
+def preparar_escucha(sock, perfil):
+    """Opciones del perfil que van en el socket de escucha antes del bind (también las usa supervisor-servidor.py)"""
+    if perfil['defer_accept_s'] and hasattr(socket, 'TCP_DEFER_ACCEPT'):
+        # accept() sólo despierta cuando llega la petición: las conexiones mudas no ocupan un hilo
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT, perfil['defer_accept_s'])
+    if perfil['fastopen'] and hasattr(socket, 'TCP_FASTOPEN'):
+        try:
+            # La petición puede venir en el mismo SYN (si el kernel lo permite: net.ipv4.tcp_fastopen & 2)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_FASTOPEN, perfil['fastopen'])
+        except OSError:
+            pass
+
+
+class ServidorHilos(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Un hilo por conexión: una llamada lenta a Ktor no bloquea al resto de celulares"""
+    daemon_threads = True
+    reutilizar_puerto = False
+    tls = None
+    estadisticas = None
+    grupo = None   # ServidorMultiInterfaz al que pertenece, si escucha por interfaz
+
+    def __init__(self, direccion, manejador, perfil=None, heredado=None):
+        self.nombre_perfil = perfil or PERFIL_SOCKET
+        if self.nombre_perfil not in PERFILES_SOCKET:
+            raise ValueError(f"PERFIL_SOCKET desconocido: {self.nombre_perfil} (opciones: {', '.join(PERFILES_SOCKET)})")
+        self.perfil = PERFILES_SOCKET[self.nombre_perfil]
+        # Sin SO_REUSEADDR, reiniciar deja "Puerto en uso" mientras duren los TIME_WAIT (~60 s en Linux).
+        # En Windows SO_REUSEADDR deja a otro proceso robar el puerto, y allí el reinicio no lo necesita.
+        self.allow_reuse_address = self.perfil['reutilizar_direccion'] and os.name != 'nt'
+        self.request_queue_size = self.perfil['backlog']
+        super().__init__(direccion, manejador, bind_and_activate=heredado is None)
+        if heredado is not None:
+            # Socket ya escuchando, abierto por supervisor-servidor.py: sin bind ni listen propios
+            self.socket.close()
+            self.socket = heredado
+            self.server_address = heredado.getsockname()
+
+    def server_bind(self):
+        if self.reutilizar_puerto:
+            # Varios workers con el mismo puerto: el kernel reparte las conexiones entre ellos
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        preparar_escucha(self.socket, self.perfil)
+        super().server_bind()
+
+    def get_request(self):
+        conexion, direccion = super().get_request()
+        if self.estadisticas is not None:
+            self.estadisticas.contar('conexiones')
+        if self.perfil['nodelay'] and ESCRITURA_VECTORIZADA:
+            # Nagle + ACK retardado suman ~40 ms a respuestas chicas (ESCRITURA_VECTORIZADA=0 = como antes)
+            conexion.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.perfil['keepalive']:
+            try:
+                aplicar_keepalive(conexion, self.perfil['keepalive'])
+            except OSError:
+                pass
+        if self.tls is not None:
+            conexion = self.tls.envolver(conexion)
+        return conexion, direccion
+
+    def cambiar_direcciones(self, agregadas, quitadas):
+        """En 0.0.0.0 el kernel ya acepta por las direcciones nuevas: no hay que reabrir nada"""
+
+    def resumen_socket(self):
+        """Opciones efectivas del socket de escucha, leídas de vuelta del kernel"""
+        leer = self.socket.getsockopt
+        resumen = {
+            'perfil': self.nombre_perfil,
+            'so_reuseaddr': bool(leer(socket.SOL_SOCKET, socket.SO_REUSEADDR)),
+            'backlog': self.request_queue_size,
+            'somaxconn': maximo_backlog(),
+            'nodelay': self.perfil['nodelay'] and ESCRITURA_VECTORIZADA,
+            'keepalive': dict(zip(('inactivo_s', 'intervalo_s', 'sondas'), self.perfil['keepalive'] or ())) or None,
+        }
+        if hasattr(socket, 'TCP_DEFER_ACCEPT'):
+            resumen['defer_accept_s'] = leer(socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT)
+        if hasattr(socket, 'TCP_FASTOPEN'):
+            resumen['fastopen_cola'] = leer(socket.IPPROTO_TCP, socket.TCP_FASTOPEN)
+        return resumen
+
+    def finish_request(self, request, client_address):
+        # El handshake corre en el hilo de la conexión: un celular lento no frena el accept de los demás
+        if self.tls is not None and not self.tls.negociar(request, client_address):
+            return
+        super().finish_request(request, client_address)
+
+
+# ---------- Escucha por interfaz: un socket por dirección y un solo bucle de selectors ----------
+
+ESCUCHA_POR_INTERFAZ = os.environ.get('ESCUCHA_POR_INTERFAZ', '0') == '1'   # 0 = un solo socket en 0.0.0.0
+
+
+class EstadisticasEscucha:
+    """Contadores de un socket de escucha: por qué camino (Wi-Fi, Radmin, OpenVPN) llegan de verdad los celulares"""
+
+    def __init__(self, ip, interfaz):
+        self.ip = ip
+        self.interfaz = interfaz
+        self.red = 'Todas' if ip == '0.0.0.0' else detectar_tipo_ip(ip)
+        self.lock = threading.Lock()
+        self.contadores = {'conexiones': 0, 'peticiones': 0, 'errores': 0, 'rechazos_4xx': 0, 'plazos_vencidos': 0,
+                           'bytes_entrada': 0, 'bytes_salida': 0}
+        self.latencia = {'n': 0, 'suma': 0.0, 'max': 0.0, 'cubetas': [0] * (len(LIMITES_MS) + 1)}
+        self.ultima = None
+
+    def contar(self, clave):
+        with self.lock:
+            self.contadores[clave] += 1
+
+    def registrar(self, handler):
+        status = handler.status_enviado
+        ms = (time.perf_counter() - handler.traza.inicio) * 1000 if handler.traza is not None else 0.0
+        entrada = len(handler.raw_requestline or b'') + len(handler.cuerpo_leido or b'')
+        if getattr(handler, 'headers', None) is not None:
+            entrada += sum(len(k) + len(v) + 4 for k, v in handler.headers.items()) + 2
+        i = 0
+        while i < len(LIMITES_MS) and ms > LIMITES_MS[i]:
+            i += 1
+        with self.lock:
+            self.contadores['peticiones'] += 1
+            if status is None or status >= 500:
+                self.contadores['errores'] += 1
+            elif status >= 400:
+                self.contadores['rechazos_4xx'] += 1
+            self.contadores['bytes_entrada'] += entrada
+            self.contadores['bytes_salida'] += handler.bytes_enviados
+            h = self.latencia
+            h['n'] += 1
+            h['suma'] += ms
+            if ms > h['max']:
+                h['max'] = ms
+            h['cubetas'][i] += 1
+            self.ultima = time.time()
+
+    def resumen(self):
+        with self.lock:
+            contadores = dict(self.contadores)
+            h = dict(self.latencia, cubetas=list(self.latencia['cubetas']))
+            ultima = self.ultima
+        resumen = {'ip': self.ip, 'interfaz': self.interfaz, 'red': self.red, **contadores,
+                   'ultima_peticion': time.strftime('%H:%M:%S', time.localtime(ultima)) if ultima else None}
+        if h['n']:
+            resumen.update(promedio_ms=round(h['suma'] / h['n'], 2), p50_ms=TiemposFases.percentil(h, 50),
+                           p99_ms=TiemposFases.percentil(h, 99), max_ms=round(h['max'], 2))
+        return resumen
+
+
+def direcciones_escucha():
+    """{ip: interfaz} de las direcciones reales de la máquina, más localhost para las herramientas locales"""
+    direcciones = {'127.0.0.1': 'loopback'}
+    direcciones.update(descubrir_interfaces())
+    return direcciones
+
+
+class ServidorMultiInterfaz:
+    """Un ServidorHilos por dirección local, todos atendidos por un único bucle selectors (el accept);
+    cada conexión sigue yendo a su propio hilo como en el modo de un solo socket"""
+
+    def __init__(self, clase, direcciones, puerto):
+        self.clase = clase
+        self.puerto = puerto
+        self.servidores = []
+        self.retirados = []   # escuchas de direcciones que desaparecieron; se conservan sus estadísticas
+        self.selector = selectors.DefaultSelector()
+        self.cambios = []
+        self.lock = threading.Lock()
+        for ip, interfaz in direcciones.items():
+            self.escuchar(ip, interfaz)
+        if not self.servidores:
+            raise OSError(f"No pude escuchar en ninguna dirección del puerto {puerto}")
+        self.nombre_perfil = self.servidores[0].nombre_perfil
+        self.request_queue_size = self.servidores[0].request_queue_size
+        self.detenido = threading.Event()
+
+    def escuchar(self, ip, interfaz):
+        try:
+            servidor = self.clase((ip, self.puerto), RobustServer)
+        except OSError as e:
+            print(f"⚠️ No pude escuchar en {ip}:{self.puerto} ({interfaz}): {e}")
+            return None
+        servidor.tls = contexto_tls
+        servidor.estadisticas = EstadisticasEscucha(ip, interfaz)
+        servidor.grupo = self
+        servidor.socket.setblocking(False)   # el selector ya dijo que hay conexión; accept() nunca debe bloquear
+        self.selector.register(servidor, selectors.EVENT_READ, servidor)
+        self.servidores.append(servidor)
+        return servidor
+
+    def dejar_de_escuchar(self, ip):
+        for servidor in list(self.servidores):
+            if servidor.estadisticas.ip == ip:
+                self.selector.unregister(servidor)
+                servidor.server_close()   # sólo el socket de escucha: las conexiones ya aceptadas siguen vivas
+                self.servidores.remove(servidor)
+                self.retirados.append(servidor)
+
+    def cambiar_direcciones(self, agregadas, quitadas):
+        """Lo llama VigiaRed desde su hilo; el bucle de serve_forever lo aplica entre dos select()"""
+        with self.lock:
+            self.cambios.append((agregadas, quitadas))
+
+    def aplicar_cambios(self):
+        with self.lock:
+            cambios, self.cambios = self.cambios, []
+        for agregadas, quitadas in cambios:
+            for ip in quitadas:
+                self.dejar_de_escuchar(ip)
+                print(f"➖ Ya no escucho en {ip}:{self.puerto}")
+            for ip, interfaz in agregadas.items():
+                if self.escuchar(ip, interfaz) is not None:
+                    print(f"➕ Escuchando también en {ip}:{self.puerto} ({interfaz})")
+
+    def serve_forever(self, intervalo=0.5):
+        while not self.detenido.is_set():
+            for clave, _ in self.selector.select(intervalo):
+                clave.data._handle_request_noblock()
+            for servidor in self.servidores:
+                servidor.service_actions()
+            if self.cambios:
+                self.aplicar_cambios()
+
+    def shutdown(self):
+        self.detenido.set()
+
+    def server_close(self):
+        self.selector.close()
+        for servidor in self.servidores:
+            servidor.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def resumen(self):
+        return {'modo': 'por-interfaz', 'escuchas': [s.estadisticas.resumen() for s in self.servidores],
+                'retiradas': [s.estadisticas.resumen() for s in self.retirados]}
+
+
+# ---------- Cambios de red en vivo (VPN que sube o baja, Wi-Fi que cambia de IP) ----------
+
+VIGILAR_RED = os.environ.get('VIGILAR_RED', '1') != '0'
+SONDEO_RED_S = float(os.environ.get('SONDEO_RED_S', '5'))   # sólo donde no hay netlink (Windows, macOS)
+DRENAJE_S = float(os.environ.get('DRENAJE_S', '10'))        # gracia para conexiones de una dirección desaparecida
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+MENSAJES_NETLINK = {16: 'RTM_NEWLINK', 17: 'RTM_DELLINK', 20: 'RTM_NEWADDR', 21: 'RTM_DELADDR'}
+
+
+class VigiaRed:
+    """Sigue las direcciones de la máquina y adapta el servidor sin reiniciarlo: netlink en Linux, sondeo en el resto"""
+
+    def __init__(self, httpd):
+        self.httpd = httpd
+        self.direcciones = descubrir_interfaces()
+        self.modo = None
+        self.lock = threading.Lock()
+        self.cambios = []
+        self.notificaciones = 0
+
+    def iniciar(self):
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR))
+        except (AttributeError, OSError):
+            self.modo = 'sondeo'
+            objetivo, argumentos = self.sondear, ()
+        else:
+            self.modo = 'netlink'
+            objetivo, argumentos = self.escuchar_netlink, (sock,)
+        threading.Thread(target=objetivo, args=argumentos, daemon=True, name='vigia-red').start()
+        return self
+
+    @staticmethod
+    def tipos_netlink(datos):
+        """Tipos de los mensajes (cabecera nlmsghdr: largo u32, tipo u16, ...) que trae un datagrama"""
+        tipos = []
+        posicion = 0
+        while posicion + 16 <= len(datos):
+            largo, tipo = struct.unpack_from('=IH', datos, posicion)
+            if largo < 16:
+                break
+            tipos.append(tipo)
+            posicion += (largo + 3) & ~3
+        return tipos
+
+    def escuchar_netlink(self, sock):
+        while True:
+            if not any(t in MENSAJES_NETLINK for t in self.tipos_netlink(sock.recv(65536))):
+                continue
+            # Una VPN que sube manda una ráfaga (enlace, dirección, rutas): se agrupa antes de releer las interfaces
+            sock.settimeout(0.3)
+            try:
+                while True:
+                    sock.recv(65536)
+            except (socket.timeout, BlockingIOError):
+                pass
+            sock.settimeout(None)
+            with self.lock:
+                self.notificaciones += 1
+            self.revisar()
+
+    def sondear(self):
+        while True:
+            time.sleep(SONDEO_RED_S)
+            self.revisar()
+
+    def revisar(self):
+        nuevas = descubrir_interfaces()
+        with self.lock:
+            anteriores, self.direcciones = self.direcciones, nuevas
+        agregadas = {ip: nombre for ip, nombre in nuevas.items() if ip not in anteriores}
+        quitadas = {ip: nombre for ip, nombre in anteriores.items() if ip not in nuevas}
+        if not agregadas and not quitadas:
+            return
+        hora = time.strftime('%H:%M:%S')
+        for ip, nombre in agregadas.items():
+            print(f"🌐 [{hora}] Nueva dirección {ip} ({nombre}, {detectar_tipo_ip(ip)})")
+        for ip, nombre in quitadas.items():
+            print(f"🔌 [{hora}] Desapareció {ip} ({nombre}); sus conexiones tienen {DRENAJE_S:g} s para terminar")
+
+        vigilancia.cancelar_drenaje(agregadas)
+        drenadas = vigilancia.drenar(quitadas, DRENAJE_S)
+        if self.httpd is not None:   # None en el maestro prefork: sólo sigue las direcciones para mDNS
+            self.httpd.cambiar_direcciones(agregadas, quitadas)
+        # Datos derivados de las interfaces que quedaron viejos
+        with salud_completa.lock:
+            salud_completa.veredicto = None
+        cerradas = cliente_ktor.pool.vaciar()
+        if respondedor_mdns is not None:
+            respondedor_mdns.actualizar(nuevas)
+        with self.lock:
+            self.cambios.append({'hora': hora, 'agregadas': agregadas, 'quitadas': quitadas,
+                                 'conexiones_drenando': drenadas, 'pool_ktor_cerradas': cerradas})
+            del self.cambios[:-20]
+
+    def resumen(self):
+        with self.lock:
+            return {'modo': self.modo, 'direcciones': dict(self.direcciones), 'notificaciones': self.notificaciones,
+                    'drenaje_s': DRENAJE_S, 'cambios': list(self.cambios)}
+
+
+vigia_red = None
+
+
+def iniciar_vigia_red(httpd):
+    global vigia_red
+    if VIGILAR_RED:
+        vigia_red = VigiaRed(httpd).iniciar()
+
+
+# ---------- Descubrimiento sin configuración: DNS-SD sobre multicast DNS (RFC 6762 / 6763) ----------
+
+MDNS = os.environ.get('MDNS', '1') != '0'
+MDNS_GRUPO = '224.0.0.251'
+MDNS_PUERTO = 5353
+SERVICIO_MDNS = '_extingrafic._tcp.local'
+META_SERVICIOS_MDNS = '_services._dns-sd._udp.local'
+TIPO_A, TIPO_PTR, TIPO_TXT, TIPO_SRV, TIPO_ANY = 1, 12, 16, 33, 255
+TTL_MDNS_HOST = 120      # registros que dependen de la dirección (A, SRV)
+TTL_MDNS_SERVICIO = 4500  # PTR y TXT casi nunca cambian
+TTL_MDNS_UNICAST = 10     # respuestas "legacy unicast" (RFC 6762 §6.7)
+
+
+def codificar_nombre(nombre):
+    etiquetas = [e.encode('utf-8') for e in nombre.rstrip('.').split('.')]
+    return b''.join(bytes([len(e)]) + e for e in etiquetas) + b'\0'
+
+
+def leer_nombre(datos, posicion):
+    """Nombre DNS con punteros de compresión; devuelve (nombre, posición siguiente)"""
+    etiquetas = []
+    fin = None
+    saltos = 0
+    while True:
+        largo = datos[posicion]
+        if largo & 0xC0 == 0xC0:
+            if fin is None:
+                fin = posicion + 2
+            posicion = ((largo & 0x3F) << 8) | datos[posicion + 1]
+            saltos += 1
+            if saltos > 20:
+                raise ValueError('Bucle de punteros de compresión')
+            continue
+        posicion += 1
+        if largo == 0:
+            break
+        etiquetas.append(datos[posicion:posicion + largo].decode('utf-8', 'replace'))
+        posicion += largo
+    return '.'.join(etiquetas), fin if fin is not None else posicion
+
+
+def parsear_dns(datos):
+    """(id, flags, preguntas [(nombre, tipo, clase)], registros [(nombre, tipo, ttl, valor)]); nombres en minúsculas
+    salvo los valores de PTR/SRV. ValueError/IndexError/struct.error si el paquete viene roto"""
+    ident, flags, n_preguntas, n_respuestas, n_autoridad, n_adicionales = struct.unpack_from('!6H', datos)
+    posicion = 12
+    preguntas = []
+    for _ in range(n_preguntas):
+        nombre, posicion = leer_nombre(datos, posicion)
+        tipo, clase = struct.unpack_from('!HH', datos, posicion)
+        posicion += 4
+        preguntas.append((nombre.lower(), tipo, clase))
+    registros = []
+    for _ in range(n_respuestas + n_autoridad + n_adicionales):
+        nombre, posicion = leer_nombre(datos, posicion)
+        tipo, _, ttl, largo = struct.unpack_from('!HHIH', datos, posicion)
+        inicio = posicion + 10
+        posicion = inicio + largo
+        if tipo == TIPO_PTR:
+            valor = leer_nombre(datos, inicio)[0]
+        elif tipo == TIPO_SRV:
+            prioridad, peso, puerto = struct.unpack_from('!HHH', datos, inicio)
+            valor = (prioridad, peso, puerto, leer_nombre(datos, inicio + 6)[0])
+        elif tipo == TIPO_TXT:
+            valor = []
+            i = inicio
+            while i < posicion:
+                valor.append(datos[i + 1:i + 1 + datos[i]].decode('utf-8', 'replace'))
+                i += 1 + datos[i]
+        elif tipo == TIPO_A and largo == 4:
+            valor = socket.inet_ntoa(datos[inicio:posicion])
+        else:
+            valor = bytes(datos[inicio:posicion])
+        registros.append((nombre.lower(), tipo, ttl, valor))
+    return ident, flags, preguntas, registros
+
+
+def registro_dns(nombre, tipo, ttl, rdata, unico=False):
+    # Bit cache-flush en registros únicos: el celular descarta las direcciones viejas de este host
+    return codificar_nombre(nombre) + struct.pack('!HHIH', tipo, 1 | (0x8000 if unico else 0), ttl, len(rdata)) + rdata
+
+
+def consulta_dns(nombre, tipo=TIPO_PTR, ident=0):
+    return struct.pack('!6H', ident, 0, 1, 0, 0, 0) + codificar_nombre(nombre) + struct.pack('!HH', tipo, 1)
+
+
+class RespondedorMDNS:
+    """Anuncia _extingrafic._tcp.local con cada dirección actual y el puerto, y contesta las consultas.
+    Puede convivir con Avahi/Bonjour (SO_REUSEADDR/SO_REUSEPORT en el 5353)"""
+
+    def __init__(self, puerto, direcciones, esquema='http'):
+        host = re.sub(r'[^a-z0-9-]', '-', socket.gethostname().split('.')[0].lower()) or 'extingrafic'
+        self.host = f'{host}.local'
+        self.instancia = f"{os.environ.get('MDNS_NOMBRE', f'Extingrafic en {host}').replace('.', '-')}.{SERVICIO_MDNS}"
+        self.puerto = puerto
+        self.esquema = esquema
+        self.direcciones = dict(direcciones)
+        self.lock = threading.Lock()
+        self.contadores = {'consultas': 0, 'respuestas': 0, 'anuncios': 0, 'errores': 0}
+        self.unidas = set()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.sock.bind(('', MDNS_PUERTO))
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 255)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        self.unirse(['127.0.0.1', *self.direcciones])
+
+    def unirse(self, ips):
+        for ip in ips:
+            if ip in self.unidas:
+                continue
+            try:
+                self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                                     socket.inet_aton(MDNS_GRUPO) + socket.inet_aton(ip))
+                self.unidas.add(ip)
+            except OSError:
+                pass   # interfaz sin multicast (lo en Linux por defecto) o ya unida
+
+    def registros(self, ttl_host=TTL_MDNS_HOST, ttl_servicio=TTL_MDNS_SERVICIO, con_loopback=False, unico=True):
+        txt = b''.join(bytes([len(t)]) + t for t in (b'path=/', b'ping=/ping', f'esquema={self.esquema}'.encode()))
+        ips = (['127.0.0.1'] if con_loopback else []) + list(self.direcciones)
+        return {
+            'ptr': registro_dns(SERVICIO_MDNS, TIPO_PTR, ttl_servicio, codificar_nombre(self.instancia)),
+            'meta': registro_dns(META_SERVICIOS_MDNS, TIPO_PTR, ttl_servicio, codificar_nombre(SERVICIO_MDNS)),
+            'srv': registro_dns(self.instancia, TIPO_SRV, ttl_host,
+                                struct.pack('!HHH', 0, 0, self.puerto) + codificar_nombre(self.host), unico),
+            'txt': registro_dns(self.instancia, TIPO_TXT, ttl_servicio, txt, unico),
+            'a': [registro_dns(self.host, TIPO_A, ttl_host, socket.inet_aton(ip), unico) for ip in ips],
+        }
+
+    def armar_respuesta(self, preguntas, origen, legacy):
+        r = self.registros(*((TTL_MDNS_UNICAST,) * 2 if legacy else ()), con_loopback=origen.startswith('127.'),
+                           unico=not legacy)
+        respuestas, adicionales = [], []
+        instancia, host = self.instancia.lower(), self.host
+        for nombre, tipo, _ in preguntas:
+            if nombre == SERVICIO_MDNS and tipo in (TIPO_PTR, TIPO_ANY):
+                respuestas.append(r['ptr'])
+                adicionales += [r['srv'], r['txt'], *r['a']]   # todo en un viaje: el buscador no pregunta dos veces
+            elif nombre == META_SERVICIOS_MDNS and tipo in (TIPO_PTR, TIPO_ANY):
+                respuestas.append(r['meta'])
+            elif nombre == instancia and tipo in (TIPO_SRV, TIPO_TXT, TIPO_ANY):
+                respuestas += [r['srv']] if tipo == TIPO_SRV else [r['txt']] if tipo == TIPO_TXT else [r['srv'], r['txt']]
+                adicionales += r['a']
+            elif nombre == host and tipo in (TIPO_A, TIPO_ANY):
+                respuestas += r['a']
+        adicionales = [a for i, a in enumerate(adicionales) if a not in respuestas and a not in adicionales[:i]]
+        return respuestas, adicionales
+
+    def responder(self, datos, origen):
+        try:
+            ident, flags, preguntas, _ = parsear_dns(datos)
+        except (ValueError, IndexError, struct.error):
+            with self.lock:
+                self.contadores['errores'] += 1
+            return
+        if flags & 0x8000 or not preguntas:
+            return   # respuestas de otros equipos en la red
+        with self.lock:
+            self.contadores['consultas'] += 1
+        legacy = origen[1] != MDNS_PUERTO   # consulta de un solo disparo (buscar-servidor.py, dig -p 5353)
+        respuestas, adicionales = self.armar_respuesta(preguntas, origen[0], legacy)
+        if not respuestas:
+            return
+        cabecera = struct.pack('!6H', ident if legacy else 0, 0x8400, len(preguntas) if legacy else 0,
+                               len(respuestas), 0, len(adicionales))
+        eco = b''.join(codificar_nombre(n) + struct.pack('!HH', t, 1) for n, t, _ in preguntas) if legacy else b''
+        paquete = cabecera + eco + b''.join(respuestas) + b''.join(adicionales)
+        unicast = legacy or any(clase & 0x8000 for _, _, clase in preguntas)   # bit QU: "respóndeme a mí"
+        self.enviar(paquete, origen if unicast else None, origen[0])
+        with self.lock:
+            self.contadores['respuestas'] += 1
+
+    def enviar(self, paquete, destino=None, origen=None):
+        """Unicast al destino, o multicast por la interfaz que comparte red con 'origen' (o por todas)"""
+        try:
+            if destino is not None:
+                self.sock.sendto(paquete, destino)
+                return
+            if origen is not None and origen.startswith('127.'):
+                interfaces = ['127.0.0.1']
+            else:
+                prefijo = (origen or '').rsplit('.', 1)[0] + '.'
+                interfaces = [ip for ip in self.direcciones if origen and ip.startswith(prefijo)] or list(self.direcciones)
+            with self.lock:   # IP_MULTICAST_IF es estado del socket: un envío a la vez
+                for ip in interfaces:
+                    try:
+                        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(ip))
+                        self.sock.sendto(paquete, (MDNS_GRUPO, MDNS_PUERTO))
+                    except OSError:
+                        self.contadores['errores'] += 1
+        except OSError:
+            with self.lock:
+                self.contadores['errores'] += 1
+
+    def anunciar(self, repeticiones=2, despedida=False):
+        """Respuestas no pedidas (RFC 6762 §8.3): dos veces, a un segundo; TTL 0 = despedida"""
+        for i in range(repeticiones):
+            r = self.registros(*((0, 0) if despedida else ()))
+            registros = [r['ptr'], r['meta'], r['srv'], r['txt'], *r['a']]
+            self.enviar(struct.pack('!6H', 0, 0x8400, 0, len(registros), 0, 0) + b''.join(registros))
+            r = self.registros(*((0, 0) if despedida else ()), con_loopback=True)
+            registros = [r['ptr'], r['srv'], r['txt'], *r['a']]
+            self.enviar(struct.pack('!6H', 0, 0x8400, 0, len(registros), 0, 0) + b''.join(registros), origen='127.0.0.1')
+            with self.lock:
+                self.contadores['anuncios'] += 1
+            if i + 1 < repeticiones:
+                time.sleep(1)
+
+    def actualizar(self, direcciones):
+        """VigiaRed avisa de un cambio: unirse al grupo en las interfaces nuevas y re-anunciar las direcciones"""
+        self.direcciones = dict(direcciones)
+        self.unirse(self.direcciones)
+        threading.Thread(target=self.anunciar, daemon=True).start()
+
+    def escuchar(self):
+        while True:
+            try:
+                datos, origen = self.sock.recvfrom(9000)
+            except OSError:
+                return   # socket cerrado en detener()
+            self.responder(datos, origen)
+
+    def iniciar(self):
+        threading.Thread(target=self.escuchar, daemon=True, name='mdns').start()
+        threading.Thread(target=self.anunciar, daemon=True).start()
+        return self
+
+    def detener(self, despedida=True):
+        if despedida:
+            self.anunciar(repeticiones=1, despedida=True)
+        self.sock.close()
+
+    def resumen(self):
+        with self.lock:
+            contadores = dict(self.contadores)
+        return {'servicio': SERVICIO_MDNS, 'instancia': self.instancia, 'host': self.host, 'puerto': self.puerto,
+                'direcciones': list(self.direcciones), 'grupos_unidos_en': sorted(self.unidas), **contadores}
+
+
+respondedor_mdns = None
+
+
+def iniciar_mdns():
+    global respondedor_mdns
+    if not MDNS:
+        return
+    try:
+        respondedor_mdns = RespondedorMDNS(PORT, descubrir_interfaces(), 'https' if contexto_tls else 'http').iniciar()
+    except OSError as e:
+        print(f"⚠️ mDNS desactivado: no pude abrir el puerto {MDNS_PUERTO}/udp ({e})")
+        return
+    print(f"📣 Anunciando {respondedor_mdns.instancia} en {respondedor_mdns.host}:{PORT} por mDNS "
+          f"(buscar con: python buscar-servidor.py)")
+
+
+# ---------- Carrera de rutas (/rutas): el navegador mide cada dirección y elige la más rápida ----------
+
+MAX_RUTAS_REPORTADAS = 32   # un reporte inventado no debe hacer crecer la tabla sin límite
+MAX_CUERPO_REPORTE = 16384
+
+
+def direcciones_anunciadas():
+    """Direcciones que se ofrecen al celular: las que sigue VigiaRed o, sin vigía, las descubiertas ahora"""
+    return dict(vigia_red.direcciones) if vigia_red is not None else descubrir_interfaces()
+
+
+class EstadisticasRutas:
+    """Agrega lo que reportan las páginas /rutas: RTT por dirección, pérdidas y cuántas veces ganó cada una"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rutas = {}
+        self.reportes = 0
+        self.clientes = set()
+
+    def ruta(self, host):
+        datos = self.rutas.get(host)
+        if datos is None:
+            if len(self.rutas) >= MAX_RUTAS_REPORTADAS:
+                host = 'otras'
+            datos = self.rutas.setdefault(host, {'reportes': 0, 'elegida': 0, 'ok': 0, 'perdidas': 0, 'clientes': set(),
+                                                 'rtt': {'n': 0, 'suma': 0.0, 'max': 0.0,
+                                                         'cubetas': [0] * (len(LIMITES_MS) + 1)}})
+        return datos
+
+    def registrar(self, reporte, cliente):
+        """reporte = {'elegida': url, 'rutas': {url: {'mediana_ms': x|None, 'ok': n, 'perdidas': n}}} (ok/perdidas desde
+        el reporte anterior); ValueError si no tiene esa forma"""
+        rutas = reporte.get('rutas') if isinstance(reporte, dict) else None
+        if not isinstance(rutas, dict) or len(rutas) > MAX_RUTAS_REPORTADAS:
+            raise ValueError('Se esperaba {"elegida": url, "rutas": {url: {...}}}')
+        elegida = urlparse(str(reporte.get('elegida') or '')).hostname
+        with self.lock:
+            self.reportes += 1
+            if len(self.clientes) < 10000:
+                self.clientes.add(cliente)
+            for url, medida in rutas.items():
+                host = urlparse(str(url)).hostname
+                if not host or not isinstance(medida, dict):
+                    continue
+                datos = self.ruta(host)
+                datos['reportes'] += 1
+                datos['ok'] += max(0, int(medida.get('ok') or 0))
+                datos['perdidas'] += max(0, int(medida.get('perdidas') or 0))
+                if len(datos['clientes']) < 1000:
+                    datos['clientes'].add(cliente)
+                if host == elegida:
+                    datos['elegida'] += 1
+                ms = medida.get('mediana_ms')
+                if isinstance(ms, (int, float)) and 0 <= ms < 600000:
+                    h = datos['rtt']
+                    h['n'] += 1
+                    h['suma'] += ms
+                    if ms > h['max']:
+                        h['max'] = ms
+                    i = 0
+                    while i < len(LIMITES_MS) and ms > LIMITES_MS[i]:
+                        i += 1
+                    h['cubetas'][i] += 1
+
+    def resumen(self):
+        with self.lock:
+            copia = {host: dict(d, clientes=len(d['clientes']), rtt=dict(d['rtt'], cubetas=list(d['rtt']['cubetas'])))
+                     for host, d in self.rutas.items()}
+            reportes, clientes = self.reportes, len(self.clientes)
+        rutas = {}
+        for host, d in sorted(copia.items()):
+            h = d.pop('rtt')
+            intentos = d['ok'] + d['perdidas']
+            rutas[host] = dict(d, red=detectar_tipo_ip(host),
+                               perdida_pct=round(100 * d['perdidas'] / intentos, 1) if intentos else None,
+                               elegida_pct=round(100 * d['elegida'] / reportes, 1) if reportes else None)
+            if h['n']:
+                rutas[host].update(rtt_promedio_ms=round(h['suma'] / h['n'], 2), rtt_p50_ms=TiemposFases.percentil(h, 50),
+                                   rtt_p90_ms=TiemposFases.percentil(h, 90), rtt_max_ms=round(h['max'], 2))
+        return {'reportes': reportes, 'clientes': clientes, 'rutas': rutas}
+
+
+estadisticas_rutas = EstadisticasRutas()
+
+
+# ---------- Clientes recientes (/clients): qué celulares se conectaron, por qué camino y cómo les fue ----------
+
+MAX_CLIENTES_RECIENTES = int(os.environ.get('MAX_CLIENTES_RECIENTES', '256'))   # un barrido de IPs sólo expulsa a los más viejos
+ALFA_RECIENTE = 0.2   # peso de la última petición en la latencia reciente (media móvil exponencial)
+
+
+class BosquejoLatencia:
+    """Histograma de cubetas fijas (LIMITES_MS) en 4 bytes por cubeta, más una media móvil para ver la tendencia"""
+    __slots__ = ('n', 'suma', 'max', 'reciente', 'cubetas')
+
+    def __init__(self):
+        self.n = 0
+        self.suma = 0.0
+        self.max = 0.0
+        self.reciente = None
+        self.cubetas = array('I', bytes(4 * (len(LIMITES_MS) + 1)))
+
+    def registrar(self, ms):
+        self.n += 1
+        self.suma += ms
+        if ms > self.max:
+            self.max = ms
+        self.reciente = ms if self.reciente is None else self.reciente + ALFA_RECIENTE * (ms - self.reciente)
+        i = 0
+        while i < len(LIMITES_MS) and ms > LIMITES_MS[i]:
+            i += 1
+        self.cubetas[i] += 1
+
+    def resumen(self):
+        if not self.n:
+            return {'n': 0}
+        h = {'n': self.n, 'cubetas': self.cubetas, 'max': self.max}
+        return {'n': self.n, 'promedio_ms': round(self.suma / self.n, 2), 'reciente_ms': round(self.reciente, 2),
+                'p50_ms': TiemposFases.percentil(h, 50), 'p90_ms': TiemposFases.percentil(h, 90),
+                'p99_ms': TiemposFases.percentil(h, 99), 'max_ms': round(self.max, 2)}
+
+
+class ClienteReciente:
+    __slots__ = ('primera', 'ultima', 'peticiones', 'errores', 'bytes_enviados', 'red', 'cliente', 'tls', 'latencia')
+
+    def __init__(self, ahora):
+        self.primera = ahora
+        self.ultima = ahora
+        self.peticiones = 0
+        self.errores = 0
+        self.bytes_enviados = 0
+        self.red = None
+        self.cliente = None
+        self.tls = False
+        self.latencia = BosquejoLatencia()
+
+
+class ClientesRecientes:
+    """Tabla LRU por IP de cliente con tamaño máximo fijo: registrar es O(1) y la memoria no crece con los escaneos"""
+
+    def __init__(self, maximo=MAX_CLIENTES_RECIENTES):
+        self.maximo = maximo
+        self.entradas = OrderedDict()   # ip -> ClienteReciente, el menos reciente primero
+        self.lock = threading.Lock()
+        self.contadores = {'nuevos': 0, 'expulsiones': 0}
+        self.desde = time.time()
+
+    def registrar(self, handler):
+        ahora = time.time()
+        ip = handler.client_address[0]
+        ms = (time.perf_counter() - handler.traza.inicio) * 1000 if handler.traza is not None else None
+        ip_local = handler.ip_local or ''
+        red = detectar_tipo_ip(ip_local)
+        headers = getattr(handler, 'headers', None)
+        cliente = clase_cliente(headers.get('User-Agent', '')) if headers is not None else None
+        with self.lock:
+            entrada = self.entradas.get(ip)
+            if entrada is None:
+                entrada = self.entradas[ip] = ClienteReciente(ahora)
+                self.contadores['nuevos'] += 1
+                while len(self.entradas) > self.maximo:
+                    self.entradas.popitem(last=False)
+                    self.contadores['expulsiones'] += 1
+            else:
+                self.entradas.move_to_end(ip)
+            entrada.ultima = ahora
+            entrada.peticiones += 1
+            if isinstance(handler.status_enviado, int) and handler.status_enviado >= 500:
+                entrada.errores += 1
+            entrada.bytes_enviados += handler.bytes_enviados
+            entrada.red = red
+            entrada.tls = handler.server.tls is not None
+            if cliente is not None:
+                entrada.cliente = cliente
+            if ms is not None:
+                entrada.latencia.registrar(ms)
+
+    def resumen(self, limite=None):
+        ahora = time.time()
+        with self.lock:
+            recientes = list(reversed(self.entradas.items()))[:limite]
+            filas = [(ip, e.primera, e.ultima, e.peticiones, e.errores, e.bytes_enviados, e.red, e.cliente, e.tls,
+                      e.latencia.resumen()) for ip, e in recientes]
+            total, contadores = len(self.entradas), dict(self.contadores)
+        clientes = []
+        for ip, primera, ultima, peticiones, errores, enviados, red, cliente, tls, latencia in filas:
+            clientes.append({
+                'ip': ip, 'red': red, 'red_cliente': detectar_tipo_ip(ip),
+                'cliente': cliente, 'tls': tls,
+                'primera_vez': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(primera)),
+                'ultima_vez': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ultima)),
+                'hace_s': round(ahora - ultima, 1), 'peticiones': peticiones, 'errores_5xx': errores,
+                'bytes_enviados': enviados, 'latencia': latencia,
+            })
+        return {'desde': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.desde)), 'pid': os.getpid(),
+                'maximo': self.maximo, 'en_tabla': total, **contadores, 'clientes': clientes}
+
+
+clientes_recientes = ClientesRecientes()
+
+
+# ---------- Traspaso sin cortes: socket heredado de supervisor-servidor.py y drenaje al recibir SIGTERM ----------
+
+SOCKET_HEREDADO = os.environ.get('SOCKET_HEREDADO', '')    # descriptor del socket de escucha que abrió el supervisor
+AVISO_LISTO = os.environ.get('AVISO_LISTO', '')            # descriptor de un pipe: escribir en él = "ya acepto conexiones"
+DRENAJE_SALIDA_S = float(os.environ.get('DRENAJE_SALIDA_S', '30'))   # gracia para las peticiones en curso al detenerse
+
+
+def socket_heredado():
+    if not SOCKET_HEREDADO:
+        return None
+    return socket.socket(fileno=int(SOCKET_HEREDADO))
+
+
+def avisar_listo():
+    """Le dice al supervisor que ya puede detener al worker anterior"""
+    if not AVISO_LISTO:
+        return
+    try:
+        os.write(int(AVISO_LISTO), f"{os.getpid()}\n".encode())
+        os.close(int(AVISO_LISTO))
+    except OSError:
+        pass   # el supervisor ya no espera (se rindió o murió): seguir atendiendo igual
+
+
+def drenar_con_sigterm(httpd):
+    """SIGTERM deja de aceptar (el otro worker o la cola del kernel toman las conexiones nuevas) y
+    serve_forever() retorna; las peticiones en curso terminan en esperar_drenaje()"""
+    def detener(*_):
+        httpd.drenando = True
+        # shutdown() espera a que serve_forever() salga: no puede correr en el hilo que lo está ejecutando
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+    httpd.drenando = False
+    signal.signal(signal.SIGTERM, detener)
+
+
+def esperar_drenaje(httpd):
+    if not getattr(httpd, 'drenando', False):
+        return
+    time.sleep(0.05)   # los hilos recién aceptados todavía no se dieron de alta en la vigilancia
+    en_curso = len(vigilancia.activas)
+    print(f"🚰 Drenando {en_curso} conexión(es) en curso (máximo {DRENAJE_SALIDA_S:g} s)")
+    vigilancia.drenar(None, DRENAJE_SALIDA_S)
+    limite = time.monotonic() + DRENAJE_SALIDA_S + 1
+    while vigilancia.activas and time.monotonic() < limite:
+        time.sleep(0.05)
+    if vigilancia.activas:
+        print(f"⚠️ {len(vigilancia.activas)} conexión(es) no terminaron a tiempo")
+
+
+# ---------- Modo prefork: N procesos con SO_REUSEPORT y estadísticas en memoria compartida ----------
+
+WORKERS = int(os.environ.get('WORKERS', '1'))
+SALIDA_BIND_FALLIDO = 3
+
+
+class EstadisticasCluster:
+    """Una ranura de 64 bytes por worker en un mmap anónimo compartido; cada worker escribe sólo la suya"""
+    FORMATO = struct.Struct('<qdqqqqdd')   # pid, inicio, reinicios, peticiones, errores_5xx, en_curso, ms_total, ms_max
+
+    def __init__(self, cantidad):
+        self.cantidad = cantidad
+        self.memoria = mmap.mmap(-1, cantidad * self.FORMATO.size)   # MAP_SHARED: lo ven todos los hijos de fork()
+        self.ranura = None
+        self.local = None
+        self.lock = threading.Lock()
+
+    def leer(self, ranura):
+        return list(self.FORMATO.unpack_from(self.memoria, ranura * self.FORMATO.size))
+
+    def escribir(self, ranura, valores):
+        self.FORMATO.pack_into(self.memoria, ranura * self.FORMATO.size, *valores)
+
+    def adoptar(self, ranura):
+        """Lo llama el worker recién creado: sigue acumulando sobre los contadores de su antecesor"""
+        self.ranura = ranura
+        self.local = self.leer(ranura)
+        self.local[0] = os.getpid()
+        self.local[1] = time.time()
+        self.local[5] = 0
+        self.escribir(ranura, self.local)
+
+    def contar_reinicio(self, ranura):
+        valores = self.leer(ranura)
+        valores[2] += 1
+        self.escribir(ranura, valores)
+
+    def entrada(self):
+        with self.lock:
+            self.local[5] += 1
+            self.escribir(self.ranura, self.local)
+
+    def salida(self, status, ms):
+        with self.lock:
+            self.local[3] += 1
+            if isinstance(status, int) and status >= 500:
+                self.local[4] += 1
+            self.local[5] -= 1
+            self.local[6] += ms
+            if ms > self.local[7]:
+                self.local[7] = ms
+            self.escribir(self.ranura, self.local)
+
+    def resumen(self):
+        workers = []
+        for ranura in range(self.cantidad):
+            pid, inicio, reinicios, peticiones, errores, en_curso, ms_total, ms_max = self.leer(ranura)
+            workers.append({'worker': ranura, 'pid': pid, 'activo_hace_s': round(time.time() - inicio) if inicio else None,
+                            'reinicios': reinicios, 'peticiones': peticiones, 'errores_5xx': errores,
+                            'en_curso': en_curso, 'promedio_ms': round(ms_total / peticiones, 2) if peticiones else None,
+                            'max_ms': round(ms_max, 1)})
+        total = sum(w['peticiones'] for w in workers)
+        return {
+            'modo': 'prefork', 'workers': self.cantidad, 'atendido_por': self.ranura,
+            'peticiones': total, 'errores_5xx': sum(w['errores_5xx'] for w in workers),
+            'en_curso': sum(w['en_curso'] for w in workers), 'reinicios': sum(w['reinicios'] for w in workers),
+            'reparto_pct': [round(w['peticiones'] * 100 / total, 1) if total else 0 for w in workers],
+            'detalle': workers,
+        }
+
+
+estadisticas_cluster = None   # sólo en modo prefork
+
+
+class ServidorWorker(ServidorHilos):
+    reutilizar_puerto = True
+
+
+def crear_servidor(reutilizar_puerto=False):
+    clase = ServidorWorker if reutilizar_puerto else ServidorHilos
+    heredado = socket_heredado()
+    if heredado is not None:
+        servidor = ServidorHilos(None, RobustServer, heredado=heredado)
+        servidor.tls = contexto_tls
+        servidor.estadisticas = EstadisticasEscucha(servidor.server_address[0], 'supervisor')
+        return servidor
+    if ESCUCHA_POR_INTERFAZ:
+        return ServidorMultiInterfaz(clase, direcciones_escucha(), PORT)
+    servidor = clase(("0.0.0.0", PORT), RobustServer)
+    servidor.tls = contexto_tls
+    servidor.estadisticas = EstadisticasEscucha('0.0.0.0', 'todas')
+    return servidor
+
+
+def correr_worker(ranura):
+    """Cuerpo de cada proceso hijo; nunca retorna"""
+    global respondedor_mdns
+    respondedor_mdns = None   # el del maestro (heredado en los reinicios) anuncia por todos
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    estadisticas_cluster.adoptar(ranura)
+    iniciar_captura(f'.w{ranura}')
+    iniciar_tls_proceso()
+    codigo = 0
+    try:
+        httpd = crear_servidor(reutilizar_puerto=True)
+    except OSError as e:
+        print(f"❌ Worker {ranura}: no pude escuchar en {PORT}: {e}")
+        os._exit(SALIDA_BIND_FALLIDO)
+    iniciar_vigia_red(httpd)
+    drenar_con_sigterm(httpd)
+    avisar_listo()
+    try:
+        httpd.serve_forever()
+        esperar_drenaje(httpd)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    except Exception as e:
+        print(f"💥 Worker {ranura} (pid {os.getpid()}) cayó: {e}")
+        codigo = 1
+    finally:
+        httpd.server_close()
+        if captura_trafico is not None:
+            captura_trafico.vaciar()
+    os._exit(codigo)
+
+
+def correr_prefork(cantidad):
+    """Proceso maestro: lanza los workers, reinicia los que caen (con espera creciente si caen en bucle)"""
+    global estadisticas_cluster
+    estadisticas_cluster = EstadisticasCluster(cantidad)
+    procesos = {}
+    lanzado = {}
+    caidas_rapidas = [0] * cantidad
+    deteniendo = False
+
+    def lanzar(ranura):
+        pid = os.fork()
+        if pid == 0:
+            correr_worker(ranura)
+        procesos[pid] = ranura
+        lanzado[ranura] = time.monotonic()
+
+    def reenviar(numero, _):
+        for pid in list(procesos):
+            try:
+                os.kill(pid, numero)
+            except ProcessLookupError:
+                pass
+
+    def detener(*_):
+        nonlocal deteniendo
+        deteniendo = True
+        for pid in list(procesos):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for ranura in range(cantidad):
+        lanzar(ranura)
+    signal.signal(signal.SIGTERM, detener)
+    if contexto_tls is not None:
+        signal.signal(signal.SIGHUP, reenviar)   # kill -HUP al maestro recarga el certificado en todos los workers
+    if SOCKET_HEREDADO:
+        print(f"👷 {cantidad} workers compartiendo el socket del supervisor en el puerto {PORT} (pids {', '.join(map(str, procesos))})")
+    else:
+        print(f"👷 {cantidad} workers escuchando en {'cada interfaz' if ESCUCHA_POR_INTERFAZ else '0.0.0.0'}:{PORT} con SO_REUSEPORT y perfil '{PERFIL_SOCKET}' (pids {', '.join(map(str, procesos))})")
+    print(f"📊 Estadísticas del cluster en /estado/cluster")
+    iniciar_mdns()
+    iniciar_vigia_red(None)
+
+    while procesos:
+        try:
+            pid, estado = os.wait()
+        except ChildProcessError:
+            break
+        except KeyboardInterrupt:
+            detener()   # Ctrl+C también llega a los hijos; sólo falta esperarlos
+            continue
+        ranura = procesos.pop(pid, None)
+        if ranura is None or deteniendo:
+            continue
+        if os.WIFEXITED(estado) and os.WEXITSTATUS(estado) == SALIDA_BIND_FALLIDO:
+            print(f"❌ El puerto {PORT} está ocupado por otro proceso sin SO_REUSEPORT; deteniendo el cluster")
+            detener()
+            continue
+        motivo = f"señal {os.WTERMSIG(estado)}" if os.WIFSIGNALED(estado) else f"código {os.WEXITSTATUS(estado)}"
+        caidas_rapidas[ranura] = caidas_rapidas[ranura] + 1 if time.monotonic() - lanzado[ranura] < 5 else 0
+        espera = min(30.0, 0.5 * 2 ** caidas_rapidas[ranura]) if caidas_rapidas[ranura] else 0
+        print(f"💥 Worker {ranura} (pid {pid}) terminó con {motivo}; reiniciando{f' en {espera:.1f} s' if espera else ''}")
+        if espera:
+            time.sleep(espera)
+        estadisticas_cluster.contar_reinicio(ranura)
+        lanzar(ranura)
+    if respondedor_mdns is not None:
+        respondedor_mdns.detener(despedida=not SOCKET_HEREDADO)
+    print("\n🛑 Cluster detenido")
+
+
 def verificar_configuracion_completa():
     """Verifica toda la configuración necesaria"""
     print("🔍 VERIFICACIÓN COMPLETA DEL SISTEMA:")
@@ -372,44 +3800,93 @@ def abrir_navegador_local():
     """Abre el navegador local para verificar que funciona"""
     try:
         time.sleep(2)  # Esperar a que el servidor se inicie
-        webbrowser.open('http://localhost:8090')
+        webbrowser.open(f"{'https' if contexto_tls is not None else 'http'}://localhost:{PORT}")
         print("🌐 Navegador local abierto para verificación")
     except:
         pass
 
 def main():
-    PORT = 8090
-
     print("🚀 SERVIDOR DEFINITIVO PARA CELULAR")
     print("=" * 50)
 
-    # Verificación completa
-    verificar_configuracion_completa()
+    # Verificación completa (bajo el supervisor el puerto ya está tomado por él y cada traspaso la repetiría)
+    if not SOCKET_HEREDADO:
+        verificar_configuracion_completa()
 
     print(f"\n📱 URLs PARA TU CELULAR:")
-    print("   🔗 WiFi: http://192.168.1.24:8090")
-    print("   🔗 Radmin VPN: http://26.36.148.66:8090")
-    print("   🔗 OpenVPN: http://10.0.11.2:8090")
+    for ip in descubrir_interfaces():
+        print(f"   🔗 {detectar_tipo_ip(ip)}: {'https' if TLS_CERT else 'http'}://{ip}:{PORT}")
 
     print(f"\n🌐 Iniciando servidor en puerto {PORT}...")
 
+    if PERFIL_SOCKET not in PERFILES_SOCKET:
+        print(f"❌ PERFIL_SOCKET desconocido: {PERFIL_SOCKET} (opciones: {', '.join(PERFILES_SOCKET)})")
+        return
+
+    global contexto_tls
+    if TLS_CERT:
+        try:
+            contexto_tls = ContextoTLS(TLS_CERT, TLS_KEY)
+        except (ssl.SSLError, OSError) as e:
+            print(f"❌ No pude cargar el certificado TLS ({TLS_CERT}): {e}")
+            return
+        print(f"🔐 TLS activo en el puerto {PORT} con {TLS_CERT} (recarga cada {TLS_RECARGA_S:g} s o con SIGHUP)")
+
     # Abrir navegador local en un hilo separado
-    threading.Thread(target=abrir_navegador_local, daemon=True).start()
+    if not SOCKET_HEREDADO:
+        threading.Thread(target=abrir_navegador_local, daemon=True).start()
+
+    if WORKERS > 1:
+        if hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT'):
+            correr_prefork(WORKERS)
+            return
+        print(f"⚠️ WORKERS={WORKERS} requiere fork() y SO_REUSEPORT (Linux); sigo con un solo proceso")
 
+    iniciar_captura()
+    iniciar_tls_proceso()
     try:
-        with socketserver.TCPServer(("0.0.0.0", PORT), RobustServer) as httpd:
+        with crear_servidor() as httpd:
             print(f"✅ Servidor iniciado exitosamente")
-            print(f"🎯 Escuchando en 0.0.0.0:{PORT}")
+            if isinstance(httpd, ServidorMultiInterfaz):
+                for servidor in httpd.servidores:
+                    e = servidor.estadisticas
+                    print(f"🎯 Escuchando en {e.ip}:{PORT} ({e.interfaz}, {e.red})")
+                print(f"🧭 Un socket por interfaz (perfil '{httpd.nombre_perfil}'); tráfico por camino en /estado/interfaces")
+            elif SOCKET_HEREDADO:
+                print(f"🎯 Atendiendo {httpd.server_address[0]}:{httpd.server_address[1]} con el socket heredado del supervisor (pid {os.getpid()})")
+            else:
+                print(f"🎯 Escuchando en 0.0.0.0:{PORT} (perfil de socket '{httpd.nombre_perfil}', backlog {httpd.request_queue_size})")
+            print(f"🔁 /api/* -> {KTOR_URL} (estado en /estado/upstream)")
+            print(f"🏥 Salud de todo el stack en /health/full")
+            print(f"👥 Últimos {MAX_CLIENTES_RECIENTES} clientes (camino, peticiones, latencia) en /clients")
+            iniciar_vigia_red(httpd)
+            iniciar_mdns()
+            if vigia_red is not None:
+                print(f"📡 Cambios de red vigilados por {vigia_red.modo} (/estado/red): no hace falta reiniciar")
+            print(f"⏱️ Plazos por conexión: {', '.join(f'{k} {v:g} s' for k, v in PLAZOS_CONEXION.items())} (/estado/plazos)")
+            print(f"🔬 Perfilador en /debug/profile?seconds=10, tiempos por fase en /debug/tiempos y memoria en /debug/memoria (sólo localhost)")
+            if captura_trafico is not None:
+                print(f"🎥 Capturando tráfico en {CAPTURA_TRAFICO} (rota cada {CAPTURA_MAX_BYTES // 1024 ** 2} MB)")
             print(f"⏳ Esperando conexiones...")
             print("🔥 Presiona Ctrl+C para detener")
             print("=" * 50)
 
+            drenar_con_sigterm(httpd)
+            avisar_listo()
             httpd.serve_forever()
+            esperar_drenaje(httpd)
     except KeyboardInterrupt:
         print("\n🛑 Servidor detenido por el usuario")
     except Exception as e:
         print(f"❌ Error iniciando servidor: {e}")
         print("💡 Intenta ejecutar como administrador")
+    finally:
+        if captura_trafico is not None:
+            captura_trafico.vaciar()
+        if respondedor_mdns is not None:
+            # TTL 0: los celulares olvidan la dirección en vez de esperar que caduque. Bajo el supervisor no:
+            # el worker que lo reemplaza ya está anunciando la misma dirección
+            respondedor_mdns.detener(despedida=not SOCKET_HEREDADO)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Supervisor de servidor-definitivo.py: el socket de escucha lo abre y lo conserva el supervisor, así que reiniciar
+no rechaza a ningún celular. Para reiniciar lanza un worker nuevo que hereda el socket, espera a que avise que
+está atendiendo y recién entonces le pide al anterior que termine lo que tenga en curso (SIGTERM = drenar)
+Si el worker se cae, lo vuelve a lanzar con espera creciente; el estado se consulta por un socket de control
+Requiere Linux/macOS (herencia de descriptores con pass_fds)
+
+Uso:
+    nohup python supervisor-servidor.py iniciar > servidor.log 2>&1 &
+    python supervisor-servidor.py reiniciar      # traspaso sin cortes (código nuevo, certificado nuevo, otra config)
+    python supervisor-servidor.py estado
+    python supervisor-servidor.py detener        # drena y se detiene
+    kill -HUP <pid del supervisor>               # lo mismo que 'reiniciar'
+"""
+import argparse
+import json
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+
+from herramientas_comunes import cargar_servidor   # perfiles de socket y preparar_escucha(): el socket queda idéntico
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+CONTROL = os.path.join(DIRECTORIO, 'supervisor-servidor.sock')
+CAIDA_RAPIDA_S = 5        # un worker que muere antes de esto cuenta para la espera creciente
+ESPERA_MAXIMA_S = 30.0
+
+
+def abrir_escucha(srv, host, puerto, nombre_perfil):
+    perfil = srv.PERFILES_SOCKET[nombre_perfil]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if perfil['reutilizar_direccion']:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.preparar_escucha(sock, perfil)
+    sock.bind((host, puerto))
+    sock.listen(perfil['backlog'])
+    return sock
+
+
+class Worker:
+    def __init__(self, proceso):
+        self.proceso = proceso
+        self.pid = proceso.pid
+        self.lanzado = time.monotonic()
+        self.drenando_desde = None
+
+    def vivo(self):
+        return self.proceso.poll() is None
+
+    def motivo_salida(self):
+        codigo = self.proceso.returncode
+        return f"señal {-codigo}" if codigo < 0 else f"código {codigo}"
+
+    def resumen(self):
+        ahora = time.monotonic()
+        datos = {'pid': self.pid, 'activo_hace_s': round(ahora - self.lanzado, 1)}
+        if self.drenando_desde is not None:
+            datos['drenando_hace_s'] = round(ahora - self.drenando_desde, 1)
+        return datos
+
+
+class Lanzamiento:
+    """Worker recién lanzado que todavía no avisa que está listo; su pipe lo vigila el selector del bucle principal"""
+
+    def __init__(self, worker, lectura, limite, tipo, motivo=None):
+        self.worker = worker
+        self.lectura = lectura
+        self.limite = limite
+        self.tipo = tipo        # 'arranque', 'relanzamiento' (tras una caída) o 'traspaso'
+        self.motivo = motivo
+        self.inicio = time.monotonic()
+        self.esperan = []       # conexiones de control que pidieron 'reiniciar' y esperan el resultado
+
+
+class Supervisor:
+    def __init__(self, args, srv):
+        self.args = args
+        self.srv = srv
+        self.escucha = abrir_escucha(srv, args.host, args.puerto, args.perfil)
+        self.actual = None
+        self.lanzando = None   # a lo más un worker esperando su aviso de 'listo' a la vez
+        self.selector = selectors.DefaultSelector()
+        self.drenando = []
+        self.inicio = time.monotonic()
+        self.caidas_rapidas = 0
+        self.relanzar_en = None   # monotonic: relanzar tras una caída (con espera creciente)
+        self.contadores = {'lanzados': 0, 'traspasos': 0, 'traspasos_fallidos': 0, 'caidas': 0}
+        self.ultimo_traspaso_s = None
+        self.ultimo_error = None
+        self.eventos = deque(maxlen=20)
+        self.traspaso_pedido = False
+        self.deteniendo = False
+        self.error_arranque = None
+        self.limite_drenaje = srv.DRENAJE_SALIDA_S + 5   # después de esto, SIGKILL
+
+    def registrar(self, texto):
+        print(f"🧭 [{time.strftime('%H:%M:%S')}] {texto}", flush=True)
+        self.eventos.append(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {texto}")
+
+    def lanzar(self, tipo, motivo=None):
+        """Lanza un worker con el socket heredado; su aviso de 'listo' se espera en el bucle principal, que mientras
+        tanto sigue atendiendo el control y las señales"""
+        lectura, escritura = os.pipe()
+        entorno = dict(os.environ, SOCKET_HEREDADO=str(self.escucha.fileno()), AVISO_LISTO=str(escritura),
+                       PORT=str(self.args.puerto), PERFIL_SOCKET=self.args.perfil, PYTHONUNBUFFERED='1')
+        try:
+            # Sesión propia: el Ctrl+C de la terminal le llega sólo al supervisor, que decide cómo detener
+            proceso = subprocess.Popen([sys.executable, self.args.servidor], env=entorno,
+                                       pass_fds=(self.escucha.fileno(), escritura), start_new_session=True)
+        except OSError:
+            os.close(lectura)
+            raise
+        finally:
+            os.close(escritura)
+        self.contadores['lanzados'] += 1
+        self.lanzando = Lanzamiento(Worker(proceso), lectura, time.monotonic() + self.args.espera_listo, tipo, motivo)
+        self.selector.register(lectura, selectors.EVENT_READ, self.lanzando)
+        return self.lanzando
+
+    def revisar_lanzamiento(self, aviso=False):
+        """Cierra el lanzamiento en curso si avisó, murió o se le acabó el plazo"""
+        lanzamiento = self.lanzando
+        if aviso:
+            listo = bool(os.read(lanzamiento.lectura, 64))   # b'' = murió (se cerró su extremo del pipe) sin avisar
+        elif lanzamiento.worker.vivo() and time.monotonic() < lanzamiento.limite:
+            return
+        else:
+            listo = False
+        self.selector.unregister(lanzamiento.lectura)
+        os.close(lanzamiento.lectura)
+        self.lanzando = None
+        worker = lanzamiento.worker if listo else self.descartar(lanzamiento.worker)
+
+        if lanzamiento.tipo == 'traspaso':
+            respuesta = self.completar_traspaso(lanzamiento, worker)
+            for conexion in lanzamiento.esperan:
+                self.responder(conexion, respuesta)
+        elif worker is not None:
+            self.actual = worker
+            self.registrar(f"✅ Worker {worker.pid} atendiendo")
+        elif lanzamiento.tipo == 'arranque':
+            self.error_arranque = self.ultimo_error
+            self.deteniendo = True
+        else:
+            self.caidas_rapidas += 1
+            espera = min(ESPERA_MAXIMA_S, 0.5 * 2 ** self.caidas_rapidas)
+            self.relanzar_en = time.monotonic() + espera
+            self.contadores['caidas'] += 1
+            self.registrar(f"💥 {self.ultimo_error}; nuevo intento en {espera:.1f} s")
+
+    def descartar(self, worker):
+        """Worker que no llegó a atender: lo termina si sigue vivo y deja anotado por qué"""
+        try:
+            worker.proceso.wait(1)   # el pipe se cierra un instante antes de que el proceso se pueda recoger
+        except subprocess.TimeoutExpired:
+            pass
+        if worker.vivo():
+            self.ultimo_error = f"el worker {worker.pid} no avisó en {self.args.espera_listo:g} s"
+            worker.proceso.kill()
+            worker.proceso.wait()
+        else:
+            worker.proceso.wait()
+            self.ultimo_error = f"el worker {worker.pid} terminó con {worker.motivo_salida()} antes de atender"
+        return None
+
+    def traspasar(self, motivo):
+        """Worker nuevo primero, el anterior después: el socket nunca deja de tener quien acepte
+        Devuelve el lanzamiento (uno nuevo o el traspaso que ya estaba en curso) o None si hay un relanzamiento"""
+        if self.lanzando is not None:
+            if self.lanzando.tipo == 'traspaso':
+                self.registrar(f"🔄 Traspaso ({motivo}) pedido con otro en curso: se espera el resultado de ése")
+                return self.lanzando
+            return None
+        return self.lanzar('traspaso', motivo)
+
+    def completar_traspaso(self, lanzamiento, nuevo):
+        motivo = lanzamiento.motivo
+        if nuevo is None:
+            self.contadores['traspasos_fallidos'] += 1
+            self.registrar(f"❌ Traspaso ({motivo}) fallido: {self.ultimo_error}; sigue el worker anterior")
+            return {'ok': False, 'error': self.ultimo_error}
+        anterior, self.actual = self.actual, nuevo
+        self.relanzar_en = None   # si había un relanzamiento pendiente tras una caída, éste lo reemplaza
+        self.ultimo_traspaso_s = round(time.monotonic() - lanzamiento.inicio, 2)
+        self.contadores['traspasos'] += 1
+        if anterior is not None and anterior.vivo():
+            anterior.proceso.terminate()   # SIGTERM: deja de aceptar y termina lo que tiene en curso
+            anterior.drenando_desde = time.monotonic()
+            self.drenando.append(anterior)
+        texto = f"pid {anterior.pid} -> {nuevo.pid}" if anterior is not None else f"pid {nuevo.pid}"
+        self.registrar(f"🔄 Traspaso ({motivo}): {texto} en {self.ultimo_traspaso_s} s")
+        return {'ok': True, 'anterior': anterior.pid if anterior is not None else None, 'nuevo': nuevo.pid,
+                'segundos': self.ultimo_traspaso_s}
+
+    def revisar(self):
+        ahora = time.monotonic()
+        for worker in list(self.drenando):
+            if not worker.vivo():
+                self.drenando.remove(worker)
+                self.registrar(f"🚰 Worker {worker.pid} terminó de drenar ({round(ahora - worker.drenando_desde, 1)} s)")
+            elif ahora - worker.drenando_desde > self.limite_drenaje:
+                worker.proceso.kill()
+                self.registrar(f"⚠️ Worker {worker.pid} no terminó de drenar en {self.limite_drenaje:g} s: SIGKILL")
+
+        if self.actual is not None and not self.actual.vivo():
+            caido = self.actual
+            self.actual = None
+            self.contadores['caidas'] += 1
+            self.caidas_rapidas = self.caidas_rapidas + 1 if ahora - caido.lanzado < CAIDA_RAPIDA_S else 0
+            espera = min(ESPERA_MAXIMA_S, 0.5 * 2 ** self.caidas_rapidas) if self.caidas_rapidas else 0
+            self.relanzar_en = ahora + espera
+            self.ultimo_error = f"el worker {caido.pid} terminó con {caido.motivo_salida()}"
+            # Mientras tanto el socket sigue abierto: los celulares esperan en la cola en vez de ver "conexión rechazada"
+            self.registrar(f"💥 {self.ultimo_error}; relanzando{f' en {espera:.1f} s' if espera else ''}")
+
+        if self.actual is None and self.lanzando is None and self.relanzar_en is not None and ahora >= self.relanzar_en:
+            self.relanzar_en = None
+            self.lanzar('relanzamiento')
+
+    def estado(self):
+        ahora = time.monotonic()
+        return {
+            'supervisor_pid': os.getpid(),
+            'escuchando': f"{self.args.host}:{self.args.puerto}",
+            'perfil_socket': self.args.perfil,
+            'activo_hace_s': round(ahora - self.inicio),
+            'worker': self.actual.resumen() if self.actual is not None else None,
+            'lanzando': {**self.lanzando.worker.resumen(), 'tipo': self.lanzando.tipo} if self.lanzando is not None else None,
+            'drenando': [w.resumen() for w in self.drenando],
+            **self.contadores,
+            'ultimo_traspaso_s': self.ultimo_traspaso_s,
+            'relanzar_en_s': round(self.relanzar_en - ahora, 1) if self.relanzar_en is not None else None,
+            'ultimo_error': self.ultimo_error,
+            'eventos': list(self.eventos),
+        }
+
+    def atender_control(self, conexion):
+        conexion.settimeout(2)
+        try:
+            comando = conexion.recv(256).decode(errors='replace').strip()
+        except OSError:
+            conexion.close()
+            return
+        if comando == 'estado':
+            respuesta = self.estado()
+        elif comando == 'reiniciar':
+            lanzamiento = self.traspasar('pedido por control')
+            if lanzamiento is not None:
+                lanzamiento.esperan.append(conexion)   # se responde cuando el worker nuevo avise (o falle)
+                return
+            respuesta = {'ok': False, 'error': 'hay un worker relanzándose tras una caída; reintenta en unos segundos'}
+        elif comando == 'detener':
+            self.deteniendo = True
+            pendientes = self.drenando + [self.actual] + ([self.lanzando.worker] if self.lanzando is not None else [])
+            respuesta = {'ok': True, 'drenando': [w.pid for w in pendientes if w is not None]}
+        else:
+            respuesta = {'ok': False, 'error': f"comando desconocido: {comando!r} (estado, reiniciar, detener)"}
+        self.responder(conexion, respuesta)
+
+    def responder(self, conexion, respuesta):
+        try:
+            conexion.sendall(json.dumps(respuesta, ensure_ascii=False).encode() + b'\n')
+        except OSError:
+            pass
+        finally:
+            conexion.close()
+
+    def detener(self):
+        pendientes = self.drenando + [self.actual]
+        if self.lanzando is not None:
+            lanzamiento, self.lanzando = self.lanzando, None
+            self.selector.unregister(lanzamiento.lectura)
+            os.close(lanzamiento.lectura)
+            pendientes.append(lanzamiento.worker)
+            for conexion in lanzamiento.esperan:
+                self.responder(conexion, {'ok': False, 'error': 'el supervisor se está deteniendo'})
+        vivos = [w for w in pendientes if w is not None and w.vivo()]
+        self.registrar(f"🛑 Deteniendo: drenando {len(vivos)} worker(s)")
+        for worker in vivos:
+            worker.proceso.terminate()
+        limite = time.monotonic() + self.limite_drenaje
+        for worker in vivos:
+            try:
+                worker.proceso.wait(max(0.1, limite - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                worker.proceso.kill()
+                worker.proceso.wait()
+        self.escucha.close()
+
+    def correr(self, control):
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, 'traspaso_pedido', True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'deteniendo', True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, 'deteniendo', True))
+        print(f"🧭 Supervisor (pid {os.getpid()}) con el socket {self.args.host}:{self.args.puerto} "
+              f"(perfil '{self.args.perfil}'); control en {self.args.control}", flush=True)
+        self.lanzar('arranque')
+        self.selector.register(control, selectors.EVENT_READ)
+        while not self.deteniendo:
+            for clave, _ in self.selector.select(0.25):
+                if clave.fileobj is not control:
+                    if clave.data is self.lanzando:
+                        self.revisar_lanzamiento(aviso=True)
+                    continue
+                try:
+                    conexion, _ = control.accept()
+                except OSError:
+                    continue
+                self.atender_control(conexion)
+            if self.lanzando is not None:
+                self.revisar_lanzamiento()
+            if self.traspaso_pedido:
+                self.traspaso_pedido = False
+                if self.traspasar('SIGHUP') is None:
+                    self.registrar("⚠️ SIGHUP ignorado: hay un worker relanzándose tras una caída")
+            self.revisar()
+        self.detener()
+        self.selector.close()
+        if self.error_arranque is not None:
+            raise SystemExit(f"❌ No arrancó el primer worker: {self.error_arranque}")
+
+
+def abrir_control(ruta):
+    if os.path.exists(ruta):
+        try:
+            pedir(ruta, 'estado', timeout=1)
+            raise SystemExit(f"❌ Ya hay un supervisor usando {ruta}")
+        except OSError:
+            os.unlink(ruta)   # quedó de un supervisor que murió sin limpiar
+    control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    control.bind(ruta)
+    os.chmod(ruta, 0o600)   # sólo el dueño puede reiniciar o detener el servidor
+    control.listen(8)
+    return control
+
+
+def pedir(ruta, comando, timeout=5.0):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(ruta)
+        s.sendall(comando.encode() + b'\n')
+        datos = b''
+        while not datos.endswith(b'\n'):
+            parte = s.recv(65536)
+            if not parte:
+                break
+            datos += parte
+    return json.loads(datos)
+
+
+def iniciar(args):
+    srv = cargar_servidor()
+    args.perfil = args.perfil or srv.PERFIL_SOCKET
+    if args.perfil not in srv.PERFILES_SOCKET:
+        raise SystemExit(f"❌ Perfil de socket desconocido: {args.perfil} (opciones: {', '.join(srv.PERFILES_SOCKET)})")
+    control = abrir_control(args.control)
+    try:
+        supervisor = Supervisor(args, srv)
+    except OSError as e:
+        control.close()
+        os.unlink(args.control)
+        raise SystemExit(f"❌ No pude escuchar en {args.host}:{args.puerto}: {e}")
+    try:
+        supervisor.correr(control)
+    finally:
+        control.close()
+        if os.path.exists(args.control):
+            os.unlink(args.control)
+    print("🛑 Supervisor detenido", flush=True)
+
+
+def cliente(args):
+    try:
+        respuesta = pedir(args.control, args.comando, timeout=args.espera_listo + 10 if args.comando == 'reiniciar' else 5)
+    except OSError as e:
+        raise SystemExit(f"❌ No hay supervisor en {args.control} ({e})")
+    if args.json or args.comando == 'estado' and not sys.stdout.isatty():
+        print(json.dumps(respuesta, indent=2, ensure_ascii=False))
+    elif args.comando == 'estado':
+        worker = respuesta['worker']
+        actual = f"pid {worker['pid']} (hace {worker['activo_hace_s']} s)" if worker else '❌ ninguno'
+        print(f"🧭 Supervisor pid {respuesta['supervisor_pid']} en {respuesta['escuchando']} hace {respuesta['activo_hace_s']} s")
+        print(f"   👷 Worker: {actual}"
+              + (f" | relanzando en {respuesta['relanzar_en_s']} s" if respuesta['relanzar_en_s'] is not None else ''))
+        if respuesta['lanzando']:
+            print(f"   🚀 Lanzando ({respuesta['lanzando']['tipo']}): pid {respuesta['lanzando']['pid']} "
+                  f"hace {respuesta['lanzando']['activo_hace_s']} s, esperando su aviso de listo")
+        if respuesta['drenando']:
+            print(f"   🚰 Drenando: {', '.join(str(w['pid']) for w in respuesta['drenando'])}")
+        print(f"   🔄 Traspasos {respuesta['traspasos']} (fallidos {respuesta['traspasos_fallidos']}) "
+              f"| caídas {respuesta['caidas']} | lanzados {respuesta['lanzados']}")
+        if respuesta['ultimo_error']:
+            print(f"   ⚠️ Último error: {respuesta['ultimo_error']}")
+        for evento in respuesta['eventos'][-5:]:
+            print(f"   • {evento}")
+    elif args.comando == 'reiniciar':
+        if not respuesta['ok']:
+            raise SystemExit(f"❌ {respuesta['error']} (el worker anterior sigue atendiendo)")
+        print(f"✅ Traspaso pid {respuesta['anterior']} -> {respuesta['nuevo']} en {respuesta['segundos']} s; "
+              f"el anterior termina lo que tenía en curso")
+    else:
+        print(f"🛑 Deteniendo (drenando pids {', '.join(map(str, respuesta['drenando']))})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reinicios sin cortes de servidor-definitivo.py')
+    parser.add_argument('--control', default=CONTROL, help='socket Unix de control (defecto: supervisor-servidor.sock)')
+    parser.add_argument('--espera-listo', type=float, default=60.0, help='segundos que se espera el aviso de un worker nuevo')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    arranque = sub.add_parser('iniciar')
+    arranque.add_argument('--host', default='0.0.0.0')
+    arranque.add_argument('--puerto', type=int, default=int(os.environ.get('PORT', '8090')))
+    arranque.add_argument('--perfil', help='perfil de socket de servidor-definitivo.py (defecto: PERFIL_SOCKET)')
+    arranque.add_argument('--servidor', default=os.path.join(DIRECTORIO, 'servidor-definitivo.py'),
+                          help='script que respeta SOCKET_HEREDADO y AVISO_LISTO')
+    for comando in ('estado', 'reiniciar', 'detener'):
+        sub.add_parser(comando).add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    if not hasattr(socket, 'AF_UNIX') or os.name == 'nt':
+        raise SystemExit("❌ El supervisor necesita Linux o macOS (heredar el socket con pass_fds y control por socket Unix)")
+    if args.comando == 'iniciar':
+        iniciar(args)
+    else:
+        cliente(args)
+
+
+if __name__ == "__main__":
+    main()